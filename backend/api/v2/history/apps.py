@@ -0,0 +1,19 @@
+"""
+Prompt History v2 App Configuration
+"""
+from django.apps import AppConfig
+
+
+class HistoryConfig(AppConfig):
+    name = 'api.v2.history'
+    label = 'history'
+    verbose_name = 'Prompt History'
+    default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .search import ensure_search_indexes
+
+        post_migrate.connect(ensure_search_indexes, sender=self, dispatch_uid='history_search_indexes')
@@ -0,0 +1,304 @@
+"""
+Prompt History Benchmarks
+Seeds skewed history volumes and drives PromptHistoryViewSet end to end
+against the deterministic stub provider, recording latency and query counts
+"""
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .blobs import prepare_for_bulk_create
+from .credits import CreditLedger
+from .models import PromptHistory
+from .providers import StubProvider, get_provider_registry
+from .scheduler import ProviderScheduler, set_provider_scheduler
+from .rollups import record_created
+from .search import get_search_backend
+from .similarity import get_vector_store, is_available as similarity_available
+from .tags import index_new_tags
+
+VERBS = ['Summarize', 'Explain', 'Translate', 'Refactor', 'Draft', 'Review', 'Outline', 'Compare']
+TOPICS = [
+    'the quarterly sales report', 'this Python function', 'a product launch email',
+    'the meeting transcript', 'a SQL query for monthly churn', 'the onboarding guide',
+    'a bedtime story about dragons', 'the API error logs', 'a cover letter', 'the research abstract',
+]
+QUALIFIERS = ['in five bullet points', 'for a beginner', 'in formal tone', 'with examples', 'briefly', '']
+TAGS = ['work', 'personal', 'code', 'writing', 'research', 'meeting', 'draft', 'urgent']
+SEARCH_TERMS = ['report', 'python', 'email', 'meeting', 'churn', 'dragons', 'logs', 'abstract']
+INTENTS = [choice for choice, _ in PromptHistory.INTENT_CATEGORIES]
+SOURCES = [choice for choice, _ in PromptHistory.SOURCES]
+
+USERNAME_PREFIX = 'bench_user_'
+
+# Scheduler limits during a run: the stub needs no protecting, and production
+# rate limits would turn enhance scenarios into a throttling benchmark
+BENCH_MODEL_LIMITS = {
+    'rate': 1e9,
+    'burst': 10 ** 9,
+    'concurrency': 1024,
+    'acquire_timeout': 60.0,
+    'failure_threshold': 10 ** 9,
+}
+
+
+def _prompt(rng: random.Random, n: int) -> str:
+    return f"{rng.choice(VERBS)} {rng.choice(TOPICS)} {rng.choice(QUALIFIERS)} (#{n})".replace('  ', ' ')
+
+
+def bench_users(count: int) -> List:
+    """Benchmark users, ordered by rank (rank 0 owns the most rows)"""
+    User = get_user_model()
+    names = [f"{USERNAME_PREFIX}{rank}" for rank in range(count)]
+    existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+    missing = []
+    for name in names:
+        if name not in existing:
+            user = User(username=name)
+            user.set_unusable_password()
+            missing.append(user)
+    User.objects.bulk_create(missing)
+    users = {user.username: user for user in User.objects.filter(username__in=names)}
+    return [users[name] for name in names]
+
+
+def seed(users: int = 50, rows: int = 100000, skew: float = 1.1, batch_size: int = 5000,
+         random_seed: int = 0, log: Callable[[str], None] = None) -> Dict[str, Any]:
+    """
+    Insert `rows` history rows across `users` with a Zipf-like skew
+    (user of rank r gets weight 1 / (r + 1) ** skew), then build indexes
+    """
+    rng = random.Random(random_seed)
+    accounts = bench_users(users)
+    weights = [1 / (rank + 1) ** skew for rank in range(users)]
+
+    inserted = 0
+    started = time.monotonic()
+    while inserted < rows:
+        size = min(batch_size, rows - inserted)
+        owners = rng.choices(accounts, weights=weights, k=size)
+        batch = []
+        for offset, owner in enumerate(owners):
+            history = PromptHistory(
+                user=owner,
+                original_prompt=_prompt(rng, inserted + offset),
+                intent_category=rng.choice(INTENTS),
+                source=rng.choices(SOURCES, weights=[6, 3, 1])[0],
+                tags=rng.sample(TAGS, rng.randint(0, 3)),
+                meta={'bench': True},
+            )
+            history.refresh_previews()
+            batch.append(history)
+
+        prepare_for_bulk_create(batch)
+        PromptHistory.objects.bulk_create(batch)
+        index_new_tags(batch)
+        record_created(batch)
+        if similarity_available():
+            get_vector_store().add(batch)
+
+        inserted += size
+        if log:
+            log(f"  seeded {inserted}/{rows} rows ({inserted / (time.monotonic() - started):.0f} rows/s)")
+
+    get_search_backend().rebuild(PromptHistory.objects.filter(user__in=accounts))
+    return {
+        'users': users,
+        'rows': rows,
+        'skew': skew,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+
+
+class Scenario:
+    """One endpoint call pattern: viewset actions plus a request builder"""
+
+    def __init__(self, name: str, method: str, actions: Dict[str, str], build: Callable):
+        self.name = name
+        self.method = method
+        self.actions = actions
+        self.build = build  # (context, iteration) -> (data, view kwargs)
+
+
+def default_scenarios(bulk_size: int = 50) -> List[Scenario]:
+    def row_id(context, i):
+        ids = context['ids']
+        return {'id': str(ids[i % len(ids)])}
+
+    return [
+        Scenario('list', 'get', {'get': 'list'}, lambda c, i: ({}, {})),
+        Scenario('list_compact', 'get', {'get': 'list'}, lambda c, i: ({'view': 'compact'}, {})),
+        Scenario('list_cursor', 'get', {'get': 'list'}, lambda c, i: ({'pagination': 'cursor'}, {})),
+        Scenario('filter', 'get', {'get': 'list'}, lambda c, i: (
+            {'intent_category': INTENTS[i % len(INTENTS)], 'source': SOURCES[i % len(SOURCES)]}, {}
+        )),
+        Scenario('filter_tag', 'get', {'get': 'list'}, lambda c, i: ({'tag': TAGS[i % len(TAGS)]}, {})),
+        Scenario('search', 'get', {'get': 'list'}, lambda c, i: ({'q': SEARCH_TERMS[i % len(SEARCH_TERMS)]}, {})),
+        Scenario('retrieve', 'get', {'get': 'retrieve'}, lambda c, i: ({}, row_id(c, i))),
+        Scenario('stats', 'get', {'get': 'stats'}, lambda c, i: ({}, {})),
+        Scenario('create', 'post', {'post': 'create'}, lambda c, i: (
+            {'original_prompt': _prompt(c['rng'], -i), 'intent_category': 'other', 'source': 'api'}, {}
+        )),
+        Scenario('bulk', 'post', {'post': 'bulk'}, lambda c, i: (
+            {'items': [
+                {'original_prompt': _prompt(c['rng'], -i * bulk_size - n), 'source': 'api'}
+                for n in range(bulk_size)
+            ]}, {}
+        )),
+        Scenario('enhance', 'post', {'post': 'enhance'}, lambda c, i: (
+            {'model': 'gpt-4o-mini', 'style': 'balanced'}, row_id(c, i)
+        )),
+    ]
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class BenchmarkRunner:
+    """Runs scenarios through PromptHistoryViewSet as one benchmark user"""
+
+    def __init__(self, user, iterations: int = 200, warmup: int = 10, concurrency: int = 1,
+                 provider_latency_ms: float = 0, provider_token_latency_ms: float = 0,
+                 random_seed: int = 0):
+        from .views import PromptHistoryViewSet
+
+        self.viewset = PromptHistoryViewSet
+        self.user = user
+        self.iterations = iterations
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.factory = APIRequestFactory()
+        self.provider_config = {
+            'latency_ms': provider_latency_ms,
+            'token_latency_ms': provider_token_latency_ms,
+            'seed': random_seed,
+        }
+        self.context = {
+            'rng': random.Random(random_seed),
+            'ids': list(
+                PromptHistory.objects.filter(user=user, is_deleted=False)
+                .order_by('-created_at').values_list('id', flat=True)[:5000]
+            ),
+        }
+
+    def _call(self, view, scenario: Scenario, i: int):
+        data, kwargs = scenario.build(self.context, i)
+        if scenario.method == 'get':
+            request = self.factory.get('/api/v2/history/', data)
+        else:
+            request = getattr(self.factory, scenario.method)('/api/v2/history/', data, format='json')
+        force_authenticate(request, user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = view(request, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            elif getattr(response, 'streaming', False):
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries.captured_queries), response.status_code
+
+    def run_scenario(self, scenario: Scenario) -> Dict[str, Any]:
+        view = self.viewset.as_view(scenario.actions)
+        for i in range(self.warmup):
+            self._call(view, scenario, -1 - i)
+
+        def worker(indexes):
+            close_old_connections()
+            try:
+                return [self._call(view, scenario, i) for i in indexes]
+            finally:
+                close_old_connections()
+
+        shards = [range(n, self.iterations, self.concurrency) for n in range(self.concurrency)]
+        started = time.perf_counter()
+        if self.concurrency == 1:
+            samples = [self._call(view, scenario, i) for i in range(self.iterations)]
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                samples = [sample for shard in pool.map(worker, shards) for sample in shard]
+        wall = time.perf_counter() - started
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        queries = [sample[1] for sample in samples]
+        errors = sum(1 for sample in samples if sample[2] >= 400)
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'p50_ms': round(_percentile(latencies, 50), 2),
+            'p95_ms': round(_percentile(latencies, 95), 2),
+            'p99_ms': round(_percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+            'throughput_rps': round(len(samples) / wall, 1) if wall else 0.0,
+            'queries_avg': round(sum(queries) / len(queries), 2) if queries else 0.0,
+            'queries_max': max(queries) if queries else 0,
+        }
+
+    def run(self, scenarios: List[Scenario], log: Callable[[str], None] = None) -> Dict[str, Any]:
+        """Run scenarios with every provider call routed to an unthrottled stub"""
+        registry = get_provider_registry()
+        previous_override = registry.override
+        registry.override = 'stub'
+        registry.register('stub', StubProvider(**self.provider_config))
+        previous_scheduler = set_provider_scheduler(
+            ProviderScheduler(limits={'default': BENCH_MODEL_LIMITS}, failover=False)
+        )
+        CreditLedger().grant(self.user, Decimal('1000000'), description='Benchmark credits')
+
+        results = {}
+        try:
+            for scenario in scenarios:
+                results[scenario.name] = self.run_scenario(scenario)
+                if log:
+                    log(format_row(scenario.name, results[scenario.name]))
+        finally:
+            registry.override = previous_override
+            set_provider_scheduler(previous_scheduler)
+        return results
+
+
+REPORT_COLUMNS = ['p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_avg', 'errors']
+
+
+def format_header() -> str:
+    return f"{'scenario':<14}" + ''.join(f"{column:>16}" for column in REPORT_COLUMNS)
+
+
+def format_row(name: str, result: Dict[str, Any]) -> str:
+    return f"{name:<14}" + ''.join(f"{result[column]:>16}" for column in REPORT_COLUMNS)
+
+
+def save_baseline(path: str, report: Dict[str, Any]):
+    """Stable, diff-friendly JSON"""
+    with open(path, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Any], threshold_pct: float = 20.0) -> List[str]:
+    """Scenarios whose p95 or average query count regressed beyond the threshold"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + threshold_pct / 100.0):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result['queries_avg'] > before['queries_avg']:
+            regressions.append(f"{name}: queries {before['queries_avg']} -> {result['queries_avg']}")
+    return regressions
@@ -0,0 +1,129 @@
+"""
+Prompt Blob Store
+Deduplicates long prompt texts into reference-counted, optionally
+compressed PromptBlob rows (enable with settings.HISTORY_BLOB_STORE)
+"""
+from collections import Counter
+from typing import Iterable, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import PromptBlob, PromptHistory
+from .storage import content_hash, encode_text, get_blob_config
+
+# (text field, blob foreign key) pairs on PromptHistory
+BLOB_FIELDS = (
+    ('original_prompt', 'original_blob'),
+    ('optimized_prompt', 'optimized_blob'),
+)
+
+
+def acquire(text: str, config=None) -> str:
+    """Take a reference on the blob for `text`, creating it if needed"""
+    digest = content_hash(text)
+    if PromptBlob.objects.filter(hash=digest).update(refcount=F('refcount') + 1):
+        return digest
+
+    codec, data = encode_text(text, config)
+    try:
+        with transaction.atomic():
+            PromptBlob.objects.create(hash=digest, codec=codec, data=data, size=len(text), refcount=1)
+    except IntegrityError:
+        # Stored concurrently by another writer
+        PromptBlob.objects.filter(hash=digest).update(refcount=F('refcount') + 1)
+    return digest
+
+
+def release(digests: Iterable[str]):
+    """Drop references; blobs at zero are left for gc_prompt_blobs"""
+    for digest, count in Counter(d for d in digests if d).items():
+        PromptBlob.objects.filter(hash=digest).update(refcount=F('refcount') - count)
+
+
+def sync_blobs(history, update_fields=None) -> List[str]:
+    """
+    Point the row's text fields at blobs (or back inline) per the config
+    Called before the row is written; returns the blob fields that changed.
+    """
+    config = get_blob_config()
+    changed = []
+    for text_field, blob_field in BLOB_FIELDS:
+        if update_fields is not None and text_field not in update_fields:
+            continue
+        if text_field not in history.__dict__:
+            continue  # deferred, so unchanged
+
+        blob_attname = f'{blob_field}_id'
+        current = getattr(history, blob_attname)
+        if current and history.__dict__[text_field] == '':
+            continue  # blob-backed and never read, so unchanged
+
+        text = history.__dict__[text_field]
+        if current and text and content_hash(text) == current:
+            desired = current
+        elif config['enabled'] and text and len(text) >= config['min_size']:
+            desired = content_hash(text)
+        else:
+            desired = None
+
+        if desired == current:
+            continue
+        if desired:
+            acquire(text, config)
+        if current:
+            release([current])
+        setattr(history, blob_attname, desired)
+        changed.append(blob_field)
+    return changed
+
+
+def prepare_for_bulk_create(histories: Iterable[PromptHistory]):
+    """bulk_create skips save(); store eligible texts as blobs first"""
+    if not get_blob_config()['enabled']:
+        return
+    for history in histories:
+        sync_blobs(history)
+
+
+def release_rows(histories: Iterable[PromptHistory]):
+    """Release the blobs held by rows about to be hard deleted"""
+    release(
+        getattr(history, f'{blob_field}_id')
+        for history in histories
+        for _, blob_field in BLOB_FIELDS
+    )
+
+
+def collect_garbage(batch_size: int = 1000, max_batches: int = 100) -> int:
+    """Delete unreferenced blobs in batches"""
+    deleted = 0
+    for _ in range(max_batches):
+        hashes = list(PromptBlob.objects.filter(refcount__lte=0).values_list('hash', flat=True)[:batch_size])
+        if not hashes:
+            break
+        # Re-check the count in the DELETE so a concurrent acquire wins
+        deleted += PromptBlob.objects.filter(hash__in=hashes, refcount__lte=0).delete()[0]
+    return deleted
+
+
+def recount() -> int:
+    """Recompute every refcount from PromptHistory; returns blobs corrected"""
+    counts = Counter()
+    for _, blob_field in BLOB_FIELDS:
+        rows = (
+            PromptHistory.objects.filter(**{f'{blob_field}__isnull': False})
+            .values(f'{blob_field}_id')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        for row in rows.iterator():
+            counts[row[f'{blob_field}_id']] += row['n']
+
+    corrected = 0
+    for blob in PromptBlob.objects.only('hash', 'refcount').iterator():
+        actual = counts.get(blob.hash, 0)
+        if blob.refcount != actual:
+            PromptBlob.objects.filter(hash=blob.hash).update(refcount=actual)
+            corrected += 1
+    return corrected
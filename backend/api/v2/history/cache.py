@@ -0,0 +1,159 @@
+"""
+Enhancement Result Cache
+Content-addressed cache of provider results keyed on prompt, model and style
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+
+
+DEFAULT_CACHE_CONFIG = {
+    'enabled': True,
+    'max_entries': 10000,
+    'ttl': 24 * 60 * 60,
+    # Django cache alias for a cache shared between processes (None = local only)
+    'backend': None,
+    # Credits charged on a hit: 'full', 'free' or 'fraction'
+    'hit_credit_policy': 'full',
+    'hit_credit_fraction': '0.5',
+}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize unicode and whitespace so trivially different prompts share a key"""
+    text = unicodedata.normalize('NFC', text or '')
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+class EnhancementCache:
+    """
+    Two-tier cache: a size-bounded in-process LRU in front of an optional
+    shared Django cache backend. Both tiers honour the same TTL.
+    """
+
+    KEY_PREFIX = 'history:enhance:'
+
+    def __init__(self, **config):
+        self.config = {**DEFAULT_CACHE_CONFIG, **config}
+        self.enabled = self.config['enabled']
+        self.max_entries = self.config['max_entries']
+        self.ttl = self.config['ttl']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'expirations': 0,
+        }
+
+    @property
+    def shared(self):
+        alias = self.config['backend']
+        if not alias:
+            return None
+        from django.core.cache import caches
+        return caches[alias]
+
+    def make_key(self, prompt: str, model: str, style: str) -> str:
+        digest = hashlib.sha256(
+            '\x00'.join([normalize_prompt(prompt), model, style]).encode('utf-8')
+        ).hexdigest()
+        return self.KEY_PREFIX + digest
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result or None"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        shared = self.shared
+        if shared is not None:
+            value = shared.get(key)
+            if value is not None:
+                self._store_local(key, value)
+                with self._lock:
+                    self._stats['shared_hits'] += 1
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a provider result in both tiers"""
+        if not self.enabled:
+            return
+        self._store_local(key, value)
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, value, timeout=self.ttl)
+        with self._lock:
+            self._stats['sets'] += 1
+
+    def _store_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def credits_for_hit(self, full_cost: Decimal) -> Decimal:
+        """Apply the configured credit policy to a cache hit"""
+        policy = self.config['hit_credit_policy']
+        if policy == 'free':
+            return Decimal('0.00')
+        if policy == 'fraction':
+            fraction = Decimal(str(self.config['hit_credit_fraction']))
+            return (full_cost * fraction).quantize(Decimal('0.01'))
+        return full_cost
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_enhancement_cache() -> EnhancementCache:
+    """Return the process-wide enhancement cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EnhancementCache(**getattr(settings, 'HISTORY_ENHANCE_CACHE', {}))
+    return _cache
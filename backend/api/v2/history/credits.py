@@ -0,0 +1,281 @@
+"""
+Credit Ledger
+Append-only credit movements with atomic reserve / commit / refund
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Sum
+from django.utils import timezone
+
+from .models import CreditAccount, CreditReservation, CreditLedgerEntry, CreditSnapshot, EnhancementJob
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientCreditsError(Exception):
+    """Raised when user doesn't have enough credits"""
+
+    def __init__(self, required_credits: Decimal, current_credits: Decimal):
+        self.required_credits = required_credits
+        self.current_credits = current_credits
+        super().__init__(
+            f"Insufficient credits. Required: {required_credits}, Available: {current_credits}"
+        )
+
+
+class CreditLedger:
+    """
+    Credit operations for enhancements
+
+    Every movement appends a CreditLedgerEntry and adjusts CreditAccount
+    with a single conditional UPDATE, so concurrent enhances never do a
+    read-modify-write on the user row and balance reads are one lookup.
+
+    When the user model has the legacy `credits` column
+    (HISTORY_LEGACY_CREDITS_FIELD), sync_legacy_balance() reconciles it
+    off the hot path (snapshot_credit_ledger): out-of-band edits (top-ups,
+    admin) are folded into the ledger, then the account balance is copied
+    back onto the column.
+    """
+
+    def get_account(self, user) -> CreditAccount:
+        """Return the user's account, opening it on first use"""
+        try:
+            return CreditAccount.objects.get(user=user)
+        except CreditAccount.DoesNotExist:
+            return self._open_account(user)
+
+    def _open_account(self, user) -> CreditAccount:
+        # Seed from the legacy user.credits field when present
+        field = self._legacy_field()
+        if field:
+            opening = Decimal(str(getattr(user, field) or 0))
+        else:
+            opening = Decimal(str(getattr(settings, 'HISTORY_DEFAULT_CREDITS', '100.00')))
+
+        try:
+            with transaction.atomic():
+                account = CreditAccount.objects.create(
+                    user=user, balance=opening, legacy_balance=opening if field else None
+                )
+                CreditLedgerEntry.objects.create(
+                    user=user,
+                    kind=CreditLedgerEntry.KIND_GRANT,
+                    amount=opening,
+                    description='Opening balance'
+                )
+                return account
+        except IntegrityError:
+            # Opened concurrently by another request
+            return CreditAccount.objects.get(user=user)
+
+    def _legacy_field(self):
+        """Name of the user model's legacy balance column, or None"""
+        name = getattr(settings, 'HISTORY_LEGACY_CREDITS_FIELD', 'credits')
+        if not name:
+            return None
+        try:
+            get_user_model()._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        return name
+
+    def sync_legacy_balance(self, user) -> Decimal:
+        """
+        Reconcile user.credits with the account; returns the out-of-band change folded in
+
+        Anything that moved user.credits away from the value this last wrote
+        (legacy_balance) is booked as a grant / adjustment, then the account
+        balance is written back. Both writes are conditional, so a concurrent
+        movement or edit is simply picked up by the next run.
+        """
+        field = self._legacy_field()
+        if not field:
+            return Decimal('0.00')
+
+        account = self.get_account(user)
+        users = get_user_model().objects.filter(pk=user.pk)
+        legacy = Decimal(str(users.values_list(field, flat=True).first() or 0))
+        # Accounts opened before legacy_balance existed were kept equal to it
+        written = account.legacy_balance if account.legacy_balance is not None else account.balance
+        drift = legacy - written
+
+        with transaction.atomic():
+            if drift:
+                CreditAccount.objects.filter(pk=account.pk).update(
+                    balance=F('balance') + drift,
+                    updated_at=timezone.now()
+                )
+                CreditLedgerEntry.objects.create(
+                    user=user,
+                    kind=CreditLedgerEntry.KIND_GRANT if drift > 0 else CreditLedgerEntry.KIND_ADJUST,
+                    amount=drift,
+                    description=f'Synced from user.{field}'
+                )
+            balance = CreditAccount.objects.filter(pk=account.pk).values_list('balance', flat=True).get()
+            # If user.credits was edited again meanwhile, remember what was booked
+            # so the next run folds in only the newer edit
+            written = balance if users.filter(**{field: legacy}).update(**{field: balance}) else legacy
+            CreditAccount.objects.filter(pk=account.pk).update(legacy_balance=written)
+        return drift
+
+    def get_balance(self, user) -> Decimal:
+        """Spendable credits (excludes in-flight reservations)"""
+        return self.get_account(user).balance
+
+    def reserve(self, user, amount: Decimal, history=None, model: str = None) -> CreditReservation:
+        """
+        Hold `amount` credits before a provider call
+
+        Raises InsufficientCreditsError if the balance can't cover it.
+        """
+        self.get_account(user)
+
+        with transaction.atomic():
+            updated = CreditAccount.objects.filter(user=user, balance__gte=amount).update(
+                balance=F('balance') - amount,
+                reserved=F('reserved') + amount,
+                updated_at=timezone.now()
+            )
+            if not updated:
+                raise InsufficientCreditsError(amount, self.get_account(user).balance)
+
+            reservation = CreditReservation.objects.create(
+                user=user,
+                amount=amount,
+                history=history,
+                model=model
+            )
+            CreditLedgerEntry.objects.create(
+                user=user,
+                kind=CreditLedgerEntry.KIND_RESERVE,
+                amount=-amount,
+                reservation=reservation,
+                description=model or ''
+            )
+        return reservation
+
+    def touch(self, reservation: CreditReservation) -> bool:
+        """Renew a long-held reservation (e.g. a batch) so it isn't expired in flight"""
+        return bool(CreditReservation.objects.filter(
+            id=reservation.id,
+            status=CreditReservation.STATUS_PENDING
+        ).update(touched_at=timezone.now()))
+
+    def commit(self, reservation: CreditReservation, amount: Decimal = None) -> bool:
+        """
+        Settle a reservation, charging `amount` (default: all of it)
+        Any unused part goes back to the balance. Returns False if the
+        reservation was already settled.
+        """
+        charged = reservation.amount if amount is None else min(amount, reservation.amount)
+        returned = reservation.amount - charged
+        return self._settle(reservation, CreditReservation.STATUS_COMMITTED, CreditLedgerEntry.KIND_COMMIT, returned)
+
+    def refund(self, reservation: CreditReservation) -> bool:
+        """Release a reservation after a failed enhancement"""
+        return self._settle(
+            reservation,
+            CreditReservation.STATUS_REFUNDED,
+            CreditLedgerEntry.KIND_REFUND,
+            reservation.amount
+        )
+
+    def _settle(self, reservation, new_status, kind, returned: Decimal) -> bool:
+        with transaction.atomic():
+            # Conditional transition: only one settle can win
+            updated = CreditReservation.objects.filter(
+                id=reservation.id,
+                status=CreditReservation.STATUS_PENDING
+            ).update(status=new_status, finished_at=timezone.now())
+            if not updated:
+                return False
+
+            CreditAccount.objects.filter(user_id=reservation.user_id).update(
+                balance=F('balance') + returned,
+                reserved=F('reserved') - reservation.amount,
+                updated_at=timezone.now()
+            )
+            CreditLedgerEntry.objects.create(
+                user_id=reservation.user_id,
+                kind=kind,
+                amount=returned,
+                reservation=reservation
+            )
+
+        reservation.status = new_status
+        return True
+
+    def grant(self, user, amount: Decimal, description: str = '') -> CreditLedgerEntry:
+        """Add credits (purchase, promotion, manual adjustment)"""
+        self.get_account(user)
+        with transaction.atomic():
+            CreditAccount.objects.filter(user=user).update(
+                balance=F('balance') + amount,
+                updated_at=timezone.now()
+            )
+            return CreditLedgerEntry.objects.create(
+                user=user,
+                kind=CreditLedgerEntry.KIND_GRANT if amount >= 0 else CreditLedgerEntry.KIND_ADJUST,
+                amount=amount,
+                description=description
+            )
+
+    def snapshot(self, user) -> CreditSnapshot:
+        """
+        Checkpoint the ledger balance and reconcile it with the account
+        Only entries since the previous snapshot are summed.
+        """
+        previous = CreditSnapshot.objects.filter(user=user).order_by('-last_entry_id').first()
+        base = previous.balance if previous else Decimal('0.00')
+        after_id = previous.last_entry_id if previous else 0
+
+        entries = CreditLedgerEntry.objects.filter(user=user, id__gt=after_id)
+        last_entry_id = entries.order_by('-id').values_list('id', flat=True).first()
+        if last_entry_id is None:
+            return previous
+
+        delta = entries.filter(id__lte=last_entry_id).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        snapshot = CreditSnapshot.objects.create(
+            user=user,
+            balance=base + delta,
+            last_entry_id=last_entry_id
+        )
+
+        account = CreditAccount.objects.filter(user=user).first()
+        if account is not None and account.balance != snapshot.balance:
+            # Entries appended after last_entry_id can legitimately differ;
+            # persistent drift indicates a bug and should be investigated
+            logger.warning(
+                "Credit drift for user %s: account %s, ledger %s",
+                user.pk, account.balance, snapshot.balance
+            )
+        return snapshot
+
+    def expire_stale_reservations(self, older_than_seconds: int = 15 * 60) -> int:
+        """
+        Refund reservations orphaned by crashed workers
+
+        Only reservations untouched for `older_than_seconds` qualify, and
+        never one whose history has a queued or running job: those are
+        settled by the job, or refunded by recover_jobs once it is lost.
+        """
+        cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+        active_job = EnhancementJob.objects.filter(
+            history_id=OuterRef('history_id'),
+            status__in=[EnhancementJob.STATUS_PENDING, EnhancementJob.STATUS_RUNNING]
+        )
+        count = 0
+        for reservation in CreditReservation.objects.filter(
+            status=CreditReservation.STATUS_PENDING,
+            touched_at__lt=cutoff
+        ).exclude(Exists(active_job)).iterator():
+            if self.refund(reservation):
+                count += 1
+        return count
@@ -0,0 +1,174 @@
+"""
+Prompt History Export / Import
+Streaming NDJSON and CSV encoders and decoders with flat memory use
+"""
+import csv
+import json
+from typing import Dict, Iterable, Iterator, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .storage import decode_text
+
+EXPORT_FIELDS = [
+    'id',
+    'original_prompt',
+    'optimized_prompt',
+    'intent_category',
+    'source',
+    'tags',
+    'meta',
+    'model',
+    'tokens',
+    'credits_spent',
+    'enhanced_at',
+    'created_at',
+]
+
+# Fields read back on import; enhancement results and credits are not imported
+IMPORT_FIELDS = ['original_prompt', 'intent_category', 'source', 'tags', 'meta']
+
+# JSON-valued columns, stored as JSON text in CSV cells
+JSON_FIELDS = ('tags', 'meta')
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def get_chunk_size() -> int:
+    return getattr(settings, 'HISTORY_EXPORT_CHUNK_SIZE', 2000)
+
+
+# Blob-backed text columns are stored as '' and joined from PromptBlob
+BLOB_COLUMNS = {
+    'original_prompt': ('original_blob__codec', 'original_blob__data'),
+    'optimized_prompt': ('optimized_blob__codec', 'optimized_blob__data'),
+}
+
+
+def _rows(queryset, chunk_size):
+    """Plain dicts straight from the cursor; no model instances"""
+    extra = [column for columns in BLOB_COLUMNS.values() for column in columns]
+    for row in queryset.values(*EXPORT_FIELDS, *extra).iterator(chunk_size=chunk_size):
+        for field, (codec, data) in BLOB_COLUMNS.items():
+            codec, data = row.pop(codec), row.pop(data)
+            if codec is not None:
+                row[field] = decode_text(codec, data)
+        yield row
+
+
+def _batched(lines: Iterable[str], size: int = 100) -> Iterator[str]:
+    """Join lines so each streamed chunk carries many rows"""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def iter_ndjson(queryset, chunk_size: int = None) -> Iterator[str]:
+    """One JSON object per line"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return _batched(
+        encoder.encode(row) + '\n'
+        for row in _rows(queryset, chunk_size or get_chunk_size())
+    )
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size: int = None) -> Iterator[str]:
+    """Header row, then one CSV row per history item"""
+    writer = csv.writer(_Echo())
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    def lines():
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in _rows(queryset, chunk_size or get_chunk_size()):
+            yield writer.writerow([
+                encoder.encode(row[name]) if name in JSON_FIELDS
+                else ('' if row[name] is None else row[name])
+                for name in EXPORT_FIELDS
+            ])
+
+    return _batched(lines())
+
+
+def export_stream(queryset, export_format: str) -> Iterator[str]:
+    if export_format == 'csv':
+        return iter_csv(queryset)
+    return iter_ndjson(queryset)
+
+
+def _decode(lines: Iterable[bytes]) -> Iterator[str]:
+    first = True
+    for line in lines:
+        text = line.decode('utf-8')
+        if first:
+            text = text.lstrip('\ufeff')
+            first = False
+        yield text
+
+
+def _import_item(record: Dict) -> Dict:
+    """
+    Keep importable fields; the exported id (or an explicit
+    idempotency_key) becomes the row's key in the long-lived import scope
+    """
+    item = {name: record[name] for name in IMPORT_FIELDS if record.get(name) not in (None, '')}
+    if record.get('id'):
+        item['idempotency_key'] = f"import:{record['id']}"
+    elif record.get('idempotency_key'):
+        item['idempotency_key'] = record['idempotency_key']
+    return item
+
+
+def iter_ndjson_records(lines: Iterable[bytes]) -> Iterator[Tuple[int, Dict]]:
+    """
+    Parse an NDJSON body line by line: yields (line_number, item)
+    Malformed lines yield an item with an 'error' key instead.
+    """
+    for number, text in enumerate(_decode(lines), start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            yield number, {'error': f"Invalid JSON: {e}"}
+            continue
+        if not isinstance(record, dict):
+            yield number, {'error': "Expected a JSON object"}
+            continue
+        yield number, _import_item(record)
+
+
+def iter_csv_records(lines: Iterable[bytes]) -> Iterator[Tuple[int, Dict]]:
+    """Parse a CSV body with a header row (as written by iter_csv)"""
+    reader = csv.DictReader(_decode(lines))
+    for record in reader:
+        number = reader.line_num
+        try:
+            for name in JSON_FIELDS:
+                if record.get(name):
+                    record[name] = json.loads(record[name])
+        except ValueError as e:
+            yield number, {'error': f"Invalid JSON in column: {e}"}
+            continue
+        yield number, _import_item(record)
+
+
+def import_records(lines: Iterable[bytes], import_format: str) -> Iterator[Tuple[int, Dict]]:
+    if import_format == 'csv':
+        return iter_csv_records(lines)
+    return iter_ndjson_records(lines)
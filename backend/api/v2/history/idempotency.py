@@ -0,0 +1,109 @@
+"""
+Idempotency Key Store
+Single index probe per request; safe under concurrent retries
+"""
+import random
+from datetime import timedelta
+from typing import Dict, Iterable, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+def get_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'HISTORY_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+
+def get_import_ttl() -> timedelta:
+    """Import keys dedupe re-imports of the same export file, so they outlive retries"""
+    return timedelta(days=getattr(settings, 'HISTORY_IMPORT_KEY_TTL_DAYS', 100 * 365))
+
+
+def claim_key(user, scope: str, key: str, history=None) -> Tuple[IdempotencyKey, bool]:
+    """
+    Claim (user, scope, key)
+
+    Returns (record, True) if this request owns the key, or the existing
+    record and False if another request got there first. A concurrent
+    claimer blocks on the unique index until the owner commits.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user,
+                scope=scope,
+                key=key,
+                history=history,
+                expires_at=now + get_ttl()
+            )
+    except IntegrityError:
+        record = IdempotencyKey.objects.select_related('history').get(
+            user=user,
+            scope=scope,
+            key=key
+        )
+        if record.expires_at > now:
+            return record, False
+
+        # Expired but not purged yet: recycle it
+        record.history = history
+        record.completed = False
+        record.expires_at = now + get_ttl()
+        record.save(update_fields=['history', 'completed', 'expires_at'])
+
+    maybe_purge_expired()
+    return record, True
+
+
+def resolve_keys(user, scope: str, keys: Iterable[str], include_expired: bool = False) -> Dict[str, IdempotencyKey]:
+    """
+    Look up many keys with one query
+    Expired rows still hold the unique index until purged; callers that
+    insert keys pass include_expired so they can replace them first.
+    """
+    queryset = IdempotencyKey.objects.select_related('history').filter(
+        user=user,
+        scope=scope,
+        key__in=list(keys)
+    )
+    if not include_expired:
+        queryset = queryset.filter(expires_at__gt=timezone.now())
+    return {record.key: record for record in queryset}
+
+
+def complete_key(record: IdempotencyKey, history):
+    """Point the key at the resource that answered the request"""
+    record.history = history
+    record.completed = True
+    record.save(update_fields=['history', 'completed'])
+
+
+def release_key(record: IdempotencyKey):
+    """Drop a claim after a failure so the client can retry"""
+    record.delete()
+
+
+def purge_expired(batch_size: int = 1000, max_batches: int = 100) -> int:
+    """Delete expired keys in small batches to keep lock times short"""
+    deleted = 0
+    for _ in range(max_batches):
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+    return deleted
+
+
+def maybe_purge_expired():
+    """Occasionally schedule a purge on the background worker pool"""
+    rate = getattr(settings, 'HISTORY_IDEMPOTENCY_PURGE_RATE', 0.001)
+    if rate and random.random() < rate:
+        from .jobs import get_job_runner
+        get_job_runner().submit_task(purge_expired)
@@ -0,0 +1,214 @@
+"""
+Asynchronous Enhancement Jobs
+Runs enhancements on a local worker pool so web workers aren't held on LLM latency
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .credits import CreditLedger
+from .models import CreditReservation, EnhancementJob
+from .services import PromptEnhancementService, InsufficientCreditsError, ProviderUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class EnhancementJobRunner:
+    """
+    Executes EnhancementJob rows on an in-process thread pool
+
+    Provider calls are I/O bound, so threads are enough and no external
+    broker is required. Job state lives in the database, which lets any
+    web worker answer status polls.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or getattr(settings, 'HISTORY_ENHANCE_WORKERS', 4)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='history-enhance'
+        )
+
+    def submit(self, job: EnhancementJob):
+        """Queue a job once the surrounding transaction commits"""
+        self.submit_id(job.id)
+
+    def submit_id(self, job_id):
+        transaction.on_commit(lambda: self._executor.submit(self._run, job_id))
+
+    def submit_task(self, fn, *args, **kwargs):
+        """Run a maintenance task (e.g. a purge) on the same pool"""
+        return self._executor.submit(self._run_task, fn, *args, **kwargs)
+
+    def _run_task(self, fn, *args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task %s failed", getattr(fn, '__name__', fn))
+        finally:
+            close_old_connections()
+
+    def _run(self, job_id):
+        """Worker entry point"""
+        close_old_connections()
+        try:
+            job = EnhancementJob.objects.select_related('user', 'history').get(id=job_id)
+            if job.status != EnhancementJob.STATUS_PENDING or not job.mark_running():
+                return
+
+            self._execute(job)
+        except Exception:
+            logger.exception("Enhancement job %s crashed", job_id)
+        finally:
+            close_old_connections()
+
+    def _execute(self, job: EnhancementJob):
+        try:
+            service = PromptEnhancementService()
+            service.enhance_history(
+                user=job.user,
+                history=job.history,
+                model=job.model,
+                style=job.style,
+                idempotency_key=job.idempotency_key
+            )
+        except InsufficientCreditsError as e:
+            job.mark_failed('insufficient_credits', {
+                'message': str(e),
+                'required_credits': str(e.required_credits),
+                'current_credits': str(e.current_credits),
+            })
+        except ProviderUnavailableError as e:
+            job.mark_failed('provider_unavailable', {
+                'message': str(e),
+                'retry_after': e.retry_after,
+            })
+        except Exception as e:
+            logger.exception("Enhancement job %s failed", job.id)
+            job.mark_failed('enhancement_failed', {'message': str(e)})
+        else:
+            job.mark_succeeded()
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work; with wait, block until queued jobs finish"""
+        self._executor.shutdown(wait=wait)
+
+
+def recover_jobs(runner: EnhancementJobRunner = None, pending_after: int = None, stale_after: int = None,
+                 requeue_running: bool = None):
+    """
+    Pick up jobs a restart or deploy left behind
+
+    Pending jobs older than `pending_after` seconds are queued again (the
+    claim in mark_running makes a double submit harmless). Running jobs
+    untouched for `stale_after` seconds lost their worker: they fail with
+    `worker_lost`, or are queued again with requeue_running. Either way
+    their pending credit reservations are refunded here (a requeued run
+    reserves afresh); expire_stale_reservations skips jobs' histories.
+
+    Returns (requeued, failed).
+    """
+    runner = runner or get_job_runner()
+    pending_after = pending_after if pending_after is not None else getattr(
+        settings, 'HISTORY_JOB_PENDING_GRACE', 60
+    )
+    stale_after = stale_after if stale_after is not None else getattr(
+        settings, 'HISTORY_JOB_STALE_AFTER', 15 * 60
+    )
+    if requeue_running is None:
+        requeue_running = getattr(settings, 'HISTORY_JOB_REQUEUE_RUNNING', False)
+
+    now = timezone.now()
+    pending = list(
+        EnhancementJob.objects.filter(
+            status=EnhancementJob.STATUS_PENDING,
+            updated_at__lt=now - timedelta(seconds=pending_after)
+        ).values_list('id', flat=True)
+    )
+
+    failed = 0
+    stale = EnhancementJob.objects.filter(
+        status=EnhancementJob.STATUS_RUNNING,
+        updated_at__lt=now - timedelta(seconds=stale_after)
+    )
+    lost = list(stale.values('user_id', 'history_id', 'model', 'started_at'))
+    if requeue_running:
+        stale_ids = list(stale.values_list('id', flat=True))
+        # Conditional on status, so a job that finished meanwhile is left alone
+        EnhancementJob.objects.filter(id__in=stale_ids, status=EnhancementJob.STATUS_RUNNING).update(
+            status=EnhancementJob.STATUS_PENDING,
+            started_at=None,
+            updated_at=now
+        )
+        pending += stale_ids
+    else:
+        failed = stale.update(
+            status=EnhancementJob.STATUS_FAILED,
+            error='worker_lost',
+            error_detail={'message': 'The worker running this job stopped; retry the request'},
+            finished_at=now,
+            updated_at=now
+        )
+
+    _refund_lost_reservations(lost)
+
+    for job_id in pending:
+        runner.submit_id(job_id)
+
+    if pending or failed:
+        logger.info("Recovered enhancement jobs: %s requeued, %s failed", len(pending), failed)
+    return len(pending), failed
+
+
+def _refund_lost_reservations(jobs) -> int:
+    """Refund what lost job runs reserved; refund is conditional, so settled ones are skipped"""
+    ledger = CreditLedger()
+    refunded = 0
+    for job in jobs:
+        reservations = CreditReservation.objects.filter(
+            status=CreditReservation.STATUS_PENDING,
+            user_id=job['user_id'],
+            history_id=job['history_id'],
+            model=job['model'],
+        )
+        if job['started_at'] is not None:
+            reservations = reservations.filter(created_at__gte=job['started_at'])
+        for reservation in reservations:
+            if ledger.refund(reservation):
+                refunded += 1
+    return refunded
+
+
+def wait_for_job(job: EnhancementJob, timeout: float, interval: float = 0.25) -> EnhancementJob:
+    """
+    Long-poll helper: block until the job finishes or timeout elapses
+    """
+    deadline = time.monotonic() + timeout
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+        job.refresh_from_db()
+    return job
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> EnhancementJobRunner:
+    """Return the process-wide job runner"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = EnhancementJobRunner()
+                # First use in this process (i.e. after a start or deploy): sweep leftovers
+                if getattr(settings, 'HISTORY_JOB_RECOVER_ON_START', True):
+                    _runner.submit_task(recover_jobs, _runner)
+    return _runner
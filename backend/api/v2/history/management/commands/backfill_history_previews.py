@@ -0,0 +1,32 @@
+"""
+Backfill stored previews for existing prompt history rows
+"""
+from django.core.management.base import BaseCommand
+
+from ...models import PromptHistory
+
+
+class Command(BaseCommand):
+    help = "Compute preview/optimized_preview for rows created before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = PromptHistory.objects.filter(preview='').only(
+            'id', 'original_prompt', 'optimized_prompt', 'preview', 'optimized_preview'
+        )
+
+        batch = []
+        updated = 0
+        for history in rows.iterator(chunk_size=batch_size):
+            history.refresh_previews()
+            batch.append(history)
+            if len(batch) >= batch_size:
+                updated += PromptHistory.objects.bulk_update(batch, ['preview', 'optimized_preview'])
+                batch = []
+        if batch:
+            updated += PromptHistory.objects.bulk_update(batch, ['preview', 'optimized_preview'])
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled previews for {updated} rows"))
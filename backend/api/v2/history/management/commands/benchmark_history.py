@@ -0,0 +1,120 @@
+"""
+Benchmark the prompt history API against the stub provider
+"""
+import json
+import platform
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ... import benchmark
+from ...models import PromptHistory
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed benchmark users/history and report p50/p95/p99 latency, throughput "
+        "and query counts per endpoint. Writes data: use a dedicated database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-rows', type=int, default=0, help="Insert this many history rows first")
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for rows per user")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--scenarios', help="Comma-separated subset (default: all)")
+        parser.add_argument('--user-rank', type=int, default=0, help="Run as this user (0 owns the most rows)")
+        parser.add_argument('--provider-latency-ms', type=float, default=0)
+        parser.add_argument('--provider-token-latency-ms', type=float, default=0)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--save-baseline', metavar='PATH')
+        parser.add_argument('--compare', metavar='PATH', help="Fail if results regress against this baseline")
+        parser.add_argument('--threshold', type=float, default=20.0, help="Allowed p95 regression in percent")
+        parser.add_argument('--purge', action='store_true', help="Delete benchmark users and their data, then exit")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+
+        if options['purge']:
+            deleted, _ = User.objects.filter(username__startswith=benchmark.USERNAME_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} benchmark objects"))
+            return
+
+        seeded = None
+        if options['seed_rows']:
+            self.stdout.write(f"Seeding {options['seed_rows']} rows across {options['users']} users...")
+            seeded = benchmark.seed(
+                users=options['users'],
+                rows=options['seed_rows'],
+                skew=options['skew'],
+                batch_size=options['batch_size'],
+                random_seed=options['random_seed'],
+                log=self.stdout.write
+            )
+
+        users = benchmark.bench_users(options['users'])
+        if options['user_rank'] >= len(users):
+            raise CommandError("--user-rank must be below --users")
+        user = users[options['user_rank']]
+        user_rows = PromptHistory.objects.filter(user=user, is_deleted=False).count()
+        if not user_rows:
+            raise CommandError("Benchmark user has no history; run with --seed-rows first")
+
+        scenarios = benchmark.default_scenarios()
+        if options['scenarios']:
+            wanted = [name.strip() for name in options['scenarios'].split(',')]
+            known = {scenario.name for scenario in scenarios}
+            unknown = set(wanted) - known
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+
+        runner = benchmark.BenchmarkRunner(
+            user,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            concurrency=options['concurrency'],
+            provider_latency_ms=options['provider_latency_ms'],
+            provider_token_latency_ms=options['provider_token_latency_ms'],
+            random_seed=options['random_seed']
+        )
+
+        self.stdout.write(
+            f"Running {len(scenarios)} scenarios as {user} ({user_rows} rows), "
+            f"{options['iterations']} iterations x {options['concurrency']} workers"
+        )
+        self.stdout.write(benchmark.format_header())
+        results = runner.run(scenarios, log=self.stdout.write)
+
+        report = {
+            'meta': {
+                'recorded_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'iterations': options['iterations'],
+                'concurrency': options['concurrency'],
+                'user_rows': user_rows,
+                'provider_latency_ms': options['provider_latency_ms'],
+                'seeded': seeded,
+            },
+            'results': results,
+        }
+
+        if options['save_baseline']:
+            benchmark.save_baseline(options['save_baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['save_baseline']}"))
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+            regressions = benchmark.compare(baseline, results, threshold_pct=options['threshold'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(self.style.ERROR(f"Regression: {line}"))
+                raise CommandError(f"{len(regressions)} regressions against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
@@ -0,0 +1,33 @@
+"""
+Archive and purge soft-deleted prompt history
+"""
+from django.core.management.base import BaseCommand
+
+from ...retention import compact, get_retention_days, purge_archive
+
+
+class Command(BaseCommand):
+    help = "Move soft-deleted history past the retention window into the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=None, help="Seconds to sleep between batches")
+        parser.add_argument(
+            '--older-than-days', type=int, default=None,
+            help=f"Override HISTORY_SOFT_DELETE_RETENTION_DAYS (currently {get_retention_days()})"
+        )
+        parser.add_argument('--skip-archive-purge', action='store_true')
+
+    def handle(self, *args, **options):
+        archived = compact(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            pause=options['pause'],
+            older_than_days=options['older_than_days']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} soft-deleted history rows"))
+
+        if not options['skip_archive_purge']:
+            purged = purge_archive(max_batches=options['max_batches'], pause=options['pause'])
+            self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired archive rows"))
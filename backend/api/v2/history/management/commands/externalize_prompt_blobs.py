@@ -0,0 +1,37 @@
+"""
+Move existing long prompt texts into the blob store
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from ...models import PromptHistory
+from ...storage import get_blob_config
+
+
+class Command(BaseCommand):
+    help = "Store inline prompt texts at or above HISTORY_BLOB_STORE['min_size'] as PromptBlobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        config = get_blob_config()
+        if not config['enabled']:
+            raise CommandError("Enable HISTORY_BLOB_STORE first")
+
+        min_size = config['min_size']
+        rows = PromptHistory.objects.annotate(
+            original_length=Length('original_prompt'),
+            optimized_length=Length('optimized_prompt'),
+        ).filter(
+            Q(original_blob__isnull=True, original_length__gte=min_size) |
+            Q(optimized_blob__isnull=True, optimized_length__gte=min_size)
+        )
+
+        moved = 0
+        for history in rows.iterator(chunk_size=options['batch_size']):
+            history.save(update_fields=['original_prompt', 'optimized_prompt'])
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Externalized text for {moved} history rows"))
@@ -0,0 +1,29 @@
+"""
+Delete unreferenced prompt blobs
+"""
+from django.core.management.base import BaseCommand
+
+from ...blobs import collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = "Remove PromptBlob rows no history row references"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=1000)
+        parser.add_argument(
+            '--recount', action='store_true',
+            help="Recompute refcounts from prompt_history first (repairs drift from failed writes)"
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            corrected = recount()
+            self.stdout.write(f"Corrected {corrected} blob refcounts")
+
+        deleted = collect_garbage(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unreferenced prompt blobs"))
@@ -0,0 +1,21 @@
+"""
+Purge expired idempotency keys
+"""
+from django.core.management.base import BaseCommand
+
+from ...idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired prompt history idempotency keys in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired idempotency keys"))
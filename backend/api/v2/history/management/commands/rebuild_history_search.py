@@ -0,0 +1,18 @@
+"""
+Rebuild the prompt history full-text search index
+"""
+from django.core.management.base import BaseCommand
+
+from ...models import PromptHistory
+from ...search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for prompt history"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        count = backend.rebuild(PromptHistory.objects.filter(is_deleted=False))
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} history rows with {type(backend).__name__}"
+        ))
@@ -0,0 +1,37 @@
+"""
+Rebuild the normalized prompt history tag index
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import PromptHistory, PromptTag
+from ...tags import index_new_tags
+
+
+class Command(BaseCommand):
+    help = "Rebuild PromptTag from PromptHistory.tags"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = PromptHistory.objects.filter(is_deleted=False).exclude(tags=[]).only(
+            'id', 'user_id', 'tags', 'is_deleted'
+        )
+
+        with transaction.atomic():
+            PromptTag.objects.all().delete()
+            batch = []
+            count = 0
+            for history in rows.iterator(chunk_size=batch_size):
+                batch.append(history)
+                if len(batch) >= batch_size:
+                    index_new_tags(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                index_new_tags(batch)
+                count += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed tags for {count} history rows"))
@@ -0,0 +1,40 @@
+"""
+Rebuild prompt vectors for similar-prompt search
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import PromptHistory, PromptVector
+from ...similarity import get_vector_store, is_available
+
+
+class Command(BaseCommand):
+    help = "Recompute PromptVector rows for live prompt history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError("Similarity search needs numpy and HISTORY_SIMILARITY['enabled']")
+
+        store = get_vector_store()
+        batch_size = options['batch_size']
+        PromptVector.objects.all().delete()
+        rows = PromptHistory.objects.filter(is_deleted=False).select_related(
+            'original_blob'
+        ).only('id', 'user_id', 'original_prompt', 'original_blob')
+
+        batch = []
+        count = 0
+        for history in rows.iterator(chunk_size=batch_size):
+            batch.append(history)
+            if len(batch) >= batch_size:
+                store.add(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            store.add(batch)
+            count += len(batch)
+        store.clear()
+
+        self.stdout.write(self.style.SUCCESS(f"Vectorized {count} prompts"))
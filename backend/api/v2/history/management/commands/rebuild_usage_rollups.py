@@ -0,0 +1,27 @@
+"""
+Rebuild the usage rollup table from prompt history
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ...rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute UsageRollup from PromptHistory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this user (id or username)")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            User = get_user_model()
+            lookup = {'pk': options['user']} if options['user'].isdigit() else {User.USERNAME_FIELD: options['user']}
+            try:
+                user = User.objects.get(**lookup)
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+
+        count = rebuild(user=user)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} usage rollup rows"))
@@ -0,0 +1,30 @@
+"""
+Re-queue or fail async enhancement jobs left behind by a restart
+"""
+from django.core.management.base import BaseCommand
+
+from ...jobs import EnhancementJobRunner, recover_jobs
+
+
+class Command(BaseCommand):
+    help = "Re-queue pending enhancement jobs and fail (or re-queue) stale running ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending-after', type=int, default=None,
+                            help="Seconds a pending job may wait before it is queued again")
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help="Seconds without progress before a running job counts as lost")
+        parser.add_argument('--requeue-running', action='store_true',
+                            help="Queue lost running jobs again instead of failing them")
+
+    def handle(self, *args, **options):
+        # Run the recovered jobs here, then wait for them before exiting
+        runner = EnhancementJobRunner()
+        requeued, failed = recover_jobs(
+            runner,
+            pending_after=options['pending_after'],
+            stale_after=options['stale_after'],
+            requeue_running=options['requeue_running'] or None,
+        )
+        runner.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f"Re-queued {requeued} jobs, failed {failed} lost jobs"))
@@ -0,0 +1,37 @@
+"""
+Snapshot credit balances, refund orphaned reservations and reconcile user.credits
+"""
+from django.core.management.base import BaseCommand
+
+from ...credits import CreditLedger
+from ...models import CreditAccount
+
+
+class Command(BaseCommand):
+    help = "Checkpoint credit ledger balances and refund stale reservations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=15 * 60,
+            help="Refund pending reservations with no activity for this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        ledger = CreditLedger()
+
+        refunded = ledger.expire_stale_reservations(options['stale_after'])
+
+        snapshots = 0
+        synced = 0
+        for account in CreditAccount.objects.select_related('user').iterator():
+            if ledger.sync_legacy_balance(account.user):
+                synced += 1
+            if ledger.snapshot(account.user) is not None:
+                snapshots += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Refunded {refunded} stale reservations, wrote {snapshots} snapshots, "
+            f"folded {synced} legacy balance edits into the ledger"
+        ))
@@ -0,0 +1,220 @@
+"""
+Prompt History Metrics
+In-process counters and histograms, per-request query tracking and a
+slow-request log, exposed in the Prometheus text format
+"""
+import bisect
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., +Inf count, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(key)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in key) + '}'
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+STAGE_SECONDS = Histogram(
+    'history_stage_seconds', 'Time spent in each enhancement stage', LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'history_request_seconds', 'History API request latency by action', LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'history_request_queries', 'DB queries per history API request', QUERY_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    'history_request_db_seconds', 'DB time per history API request', LATENCY_BUCKETS
+)
+PROVIDER_SECONDS = Histogram(
+    'history_provider_latency_seconds', 'Provider call latency by served model', LATENCY_BUCKETS
+)
+PROVIDER_TOKENS = Histogram(
+    'history_provider_tokens', 'Tokens per provider call by served model', TOKEN_BUCKETS
+)
+PROVIDER_ERRORS = Counter(
+    'history_provider_errors_total', 'Failed provider calls by model'
+)
+COALESCED_ENHANCEMENTS = Counter(
+    'history_enhance_coalesced_total', 'Enhance calls answered by a concurrent identical call'
+)
+SLOW_REQUESTS = Counter(
+    'history_slow_requests_total', 'Requests over HISTORY_SLOW_REQUEST_MS by action'
+)
+
+ALL_METRICS = [
+    STAGE_SECONDS, REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS,
+    PROVIDER_SECONDS, PROVIDER_TOKENS, PROVIDER_ERRORS, COALESCED_ENHANCEMENTS, SLOW_REQUESTS,
+]
+
+
+@contextmanager
+def stage(name: str):
+    """Time one enhancement stage into history_stage_seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def observe_provider_call(model: str, seconds: float, tokens: int = None):
+    PROVIDER_SECONDS.observe(seconds, model=model)
+    if tokens is not None:
+        PROVIDER_TOKENS.observe(tokens, model=model)
+
+
+class QueryTracker:
+    """connection.execute_wrapper that counts and times every query"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = None  # (seconds, sql, params)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if not many and (self.slowest is None or elapsed > self.slowest[0]):
+                self.slowest = (elapsed, sql, params)
+
+
+@contextmanager
+def track_request(action: str):
+    """Record latency, query count and DB time for one API request"""
+    tracker = QueryTracker()
+    started = time.perf_counter()
+    with connection.execute_wrapper(tracker):
+        try:
+            yield tracker
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, action=action)
+            REQUEST_QUERIES.observe(tracker.count, action=action)
+            REQUEST_DB_SECONDS.observe(tracker.seconds, action=action)
+            _log_if_slow(action, elapsed, tracker)
+
+
+def _log_if_slow(action, elapsed, tracker):
+    threshold_ms = getattr(settings, 'HISTORY_SLOW_REQUEST_MS', None)
+    if threshold_ms is None or elapsed * 1000 < threshold_ms:
+        return
+
+    SLOW_REQUESTS.inc(action=action)
+    plan = None
+    explain_rate = getattr(settings, 'HISTORY_SLOW_QUERY_EXPLAIN_RATE', 0.1)
+    if tracker.slowest is not None and explain_rate and random.random() < explain_rate:
+        plan = explain(tracker.slowest[1], tracker.slowest[2])
+
+    logger.warning(
+        "Slow history request: action=%s duration_ms=%.1f queries=%s db_ms=%.1f slowest_ms=%.1f slowest_sql=%s%s",
+        action,
+        elapsed * 1000,
+        tracker.count,
+        tracker.seconds * 1000,
+        tracker.slowest[0] * 1000 if tracker.slowest else 0.0,
+        tracker.slowest[1][:500] if tracker.slowest else '',
+        f"\nplan:\n{plan}" if plan else '',
+    )
+
+
+def explain(sql: str, params):
+    """EXPLAIN a captured SELECT (never re-runs writes)"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as e:  # diagnostics must never break the request
+        return f"(explain failed: {e})"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
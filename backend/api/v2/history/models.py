@@ -7,9 +7,31 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 import uuid
 
+from .storage import BlobTextField, decode_text
+
+try:
+    from django.contrib.postgres.search import SearchVectorField
+    HAS_POSTGRES_SEARCH = True
+except ImportError:  # psycopg not installed; search falls back to SQLite FTS5 / icontains
+    SearchVectorField = models.Field
+    HAS_POSTGRES_SEARCH = False
+
 User = get_user_model()
 
 
+class SearchVectorColumn(SearchVectorField):
+    """
+    tsvector on PostgreSQL, an unused nullable text column elsewhere
+
+    The column exists whatever is installed, so the schema (and migrations)
+    don't depend on whether psycopg happens to import. Its GIN index is
+    PostgreSQL-only and created by search.ensure_search_indexes().
+    """
+
+    def db_type(self, connection):
+        return 'tsvector' if connection.vendor == 'postgresql' else 'text'
+
+
 class PromptHistory(models.Model):
     """
     Stores user prompt history with enhancement capabilities
@@ -36,9 +58,30 @@ class PromptHistory(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prompt_history')
 
-    # Prompt data
-    original_prompt = models.TextField(help_text="Original user prompt")
-    optimized_prompt = models.TextField(blank=True, null=True, help_text="Enhanced/optimized prompt")
+    # Prompt data; long texts may live in a shared PromptBlob (see blobs.py)
+    original_prompt = BlobTextField(blob_field='original_blob', help_text="Original user prompt")
+    optimized_prompt = BlobTextField(
+        blob_field='optimized_blob',
+        blank=True,
+        null=True,
+        help_text="Enhanced/optimized prompt"
+    )
+    original_blob = models.ForeignKey(
+        'PromptBlob',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    optimized_blob = models.ForeignKey(
+        'PromptBlob',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
 
     # Metadata
     intent_category = models.CharField(
@@ -53,6 +96,10 @@ class PromptHistory(models.Model):
         default='web',
         db_index=True
     )
+    # Stored previews so list views can defer the full prompt columns
+    preview = models.CharField(max_length=160, blank=True, default='', editable=False)
+    optimized_preview = models.CharField(max_length=160, blank=True, default='', editable=False)
+
     tags = models.JSONField(default=list, blank=True, help_text="User tags for organization")
     meta = models.JSONField(default=dict, blank=True, help_text="Additional metadata (session_id, etc.)")
 
@@ -67,35 +114,94 @@ class PromptHistory(models.Model):
         help_text="Credits debited for enhancement"
     )
     enhanced_at = models.DateTimeField(null=True, blank=True, help_text="When enhancement was performed")
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Alternative optimized versions keyed by style ({style: {text, model, enhanced_at}})"
+    )
 
-    # Soft delete
-    is_deleted = models.BooleanField(default=False, db_index=True)
+    # Soft delete (rows are archived and purged after a retention window)
+    is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Full-text search (PostgreSQL); maintained by search.get_search_backend()
+    search_vector = SearchVectorColumn(null=True, editable=False)
+
     class Meta:
         db_table = 'prompt_history'
         ordering = ['-created_at']
+        # Reads only ever touch live rows, so the hot indexes skip soft-deleted ones;
+        # the last index serves the retention sweep (see retention.py)
         indexes = [
-            models.Index(fields=['user', 'is_deleted', '-created_at']),
-            models.Index(fields=['user', 'intent_category', '-created_at']),
-            models.Index(fields=['user', 'source', '-created_at']),
+            models.Index(
+                fields=['user', '-created_at'],
+                name='prompt_history_live_idx',
+                condition=models.Q(is_deleted=False)
+            ),
+            models.Index(
+                fields=['user', 'intent_category', '-created_at'],
+                name='prompt_history_live_intent_idx',
+                condition=models.Q(is_deleted=False)
+            ),
+            models.Index(
+                fields=['user', 'source', '-created_at'],
+                name='prompt_history_live_source_idx',
+                condition=models.Q(is_deleted=False)
+            ),
+            models.Index(
+                fields=['deleted_at'],
+                name='prompt_history_deleted_idx',
+                condition=models.Q(is_deleted=True)
+            ),
+            # Delta sync feed (sync.py) scans by (updated_at, id) and includes tombstones
+            models.Index(fields=['user', 'updated_at', 'id'], name='prompt_history_sync_idx'),
         ]
         verbose_name = 'Prompt History'
         verbose_name_plural = 'Prompt Histories'
 
+    PREVIEW_LENGTH = 160
+
     def __str__(self):
         preview = self.original_prompt[:60] + '...' if len(self.original_prompt) > 60 else self.original_prompt
         return f"{self.user.username} - {preview}"
 
+    @classmethod
+    def make_preview(cls, text):
+        """Truncate text to a single-line preview"""
+        if not text:
+            return ''
+        text = ' '.join(text.split())
+        if len(text) <= cls.PREVIEW_LENGTH:
+            return text
+        return text[:cls.PREVIEW_LENGTH - 3] + '...'
+
+    def refresh_previews(self):
+        """Recompute stored previews (bulk_create doesn't call save)"""
+        self.preview = self.make_preview(self.original_prompt)
+        self.optimized_preview = self.make_preview(self.optimized_prompt)
+
+    def save(self, *args, **kwargs):
+        from .blobs import sync_blobs
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.refresh_previews()
+            sync_blobs(self)
+        elif {'original_prompt', 'optimized_prompt'}.intersection(update_fields):
+            self.refresh_previews()
+            blob_fields = sync_blobs(self, update_fields)
+            kwargs['update_fields'] = set(update_fields) | {'preview', 'optimized_preview'} | set(blob_fields)
+        super().save(*args, **kwargs)
+
     def soft_delete(self):
         """Perform soft delete"""
         self.is_deleted = True
         self.deleted_at = timezone.now()
-        self.save(update_fields=['is_deleted', 'deleted_at'])
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
 
     def mark_enhanced(self, optimized_prompt, model, tokens, credits_spent):
         """Mark prompt as enhanced"""
@@ -108,3 +214,411 @@ class PromptHistory(models.Model):
             'optimized_prompt', 'model', 'tokens',
             'credits_spent', 'enhanced_at', 'updated_at'
         ])
+
+
+class EnhancementJob(models.Model):
+    """
+    Tracks an asynchronous enhancement run for a history item
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    STATUSES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    TERMINAL_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enhancement_jobs')
+    history = models.ForeignKey(PromptHistory, on_delete=models.CASCADE, related_name='enhancement_jobs')
+
+    # Request parameters
+    model = models.CharField(max_length=50)
+    style = models.CharField(max_length=20, default='balanced')
+    idempotency_key = models.CharField(max_length=255, blank=True, null=True)
+
+    # Outcome
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_PENDING, db_index=True)
+    error = models.CharField(max_length=50, blank=True, null=True, help_text="Machine-readable error code")
+    error_detail = models.JSONField(default=dict, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'prompt_history_enhancement_job'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            # Recovery sweep (jobs.recover_jobs) scans unfinished jobs by age
+            models.Index(fields=['status', 'updated_at'], name='history_job_status_idx'),
+        ]
+        constraints = [
+            # Retries of one async request share a job (see views._enqueue_enhancement)
+            models.UniqueConstraint(
+                fields=['history', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='uniq_history_enhancement_job_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.history_id} - {self.model} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in self.TERMINAL_STATUSES
+
+    def mark_running(self):
+        """
+        Claim the job for this worker
+        Conditional, so a job queued twice (e.g. by recovery) runs once;
+        returns False if another worker already took it.
+        """
+        now = timezone.now()
+        claimed = EnhancementJob.objects.filter(id=self.id, status=self.STATUS_PENDING).update(
+            status=self.STATUS_RUNNING,
+            started_at=now,
+            updated_at=now
+        )
+        if claimed:
+            self.status = self.STATUS_RUNNING
+            self.started_at = self.updated_at = now
+        return bool(claimed)
+
+    def mark_succeeded(self):
+        """Mark job as completed"""
+        self.status = self.STATUS_SUCCEEDED
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'finished_at', 'updated_at'])
+
+    def mark_failed(self, error, detail=None):
+        """Mark job as failed with an error code"""
+        self.status = self.STATUS_FAILED
+        self.error = error
+        self.error_detail = detail or {}
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'error_detail', 'finished_at', 'updated_at'])
+
+
+class IdempotencyKey(models.Model):
+    """
+    Client-supplied idempotency key, unique per (user, scope, key)
+
+    The unique constraint makes concurrent retries collide on insert instead
+    of both missing a lookup; `history` points at the response resource.
+    """
+
+    SCOPE_CREATE = 'create'
+    SCOPE_ENHANCE = 'enhance'
+    SCOPE_IMPORT = 'import'  # exported record id -> imported row; long-lived
+
+    SCOPES = [
+        (SCOPE_CREATE, 'Create'),
+        (SCOPE_ENHANCE, 'Enhance'),
+        (SCOPE_IMPORT, 'Import'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=20, choices=SCOPES)
+    key = models.CharField(max_length=255)
+    history = models.ForeignKey(
+        PromptHistory,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='idempotency_keys'
+    )
+    completed = models.BooleanField(default=False, help_text="Response has been produced")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'prompt_history_idempotency_key'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='uniq_history_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.scope}:{self.key}"
+
+
+class CreditAccount(models.Model):
+    """
+    Running credit balance per user, maintained incrementally from the ledger
+
+    `balance` is what can still be reserved; `reserved` is held by in-flight
+    enhancements. Both change only through conditional UPDATEs, so no
+    lock is held across a provider call.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='credit_account')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    reserved = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # user.credits as last written by the legacy reconcile (credits.py); a
+    # different value there means someone edited it outside the ledger
+    legacy_balance = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'prompt_history_credit_account'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.balance} (+{self.reserved} reserved)"
+
+
+class CreditReservation(models.Model):
+    """
+    Credits held for one enhancement until it is committed or refunded
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_COMMITTED = 'committed'
+    STATUS_REFUNDED = 'refunded'
+
+    STATUSES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_REFUNDED, 'Refunded'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_reservations')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_PENDING)
+    history = models.ForeignKey(
+        PromptHistory,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='credit_reservations'
+    )
+    model = models.CharField(max_length=50, blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last sign of life from the holder (CreditLedger.touch); stale pending
+    # reservations are refunded by expire_stale_reservations
+    touched_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'prompt_history_credit_reservation'
+        indexes = [
+            models.Index(fields=['status', 'touched_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.amount} ({self.status})"
+
+
+class CreditLedgerEntry(models.Model):
+    """
+    Append-only record of every credit movement
+    """
+
+    KIND_GRANT = 'grant'
+    KIND_RESERVE = 'reserve'
+    KIND_COMMIT = 'commit'
+    KIND_REFUND = 'refund'
+    KIND_ADJUST = 'adjust'
+
+    KINDS = [
+        (KIND_GRANT, 'Grant'),
+        (KIND_RESERVE, 'Reserve'),
+        (KIND_COMMIT, 'Commit'),
+        (KIND_REFUND, 'Refund'),
+        (KIND_ADJUST, 'Adjustment'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_ledger')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        help_text="Signed change to the spendable balance"
+    )
+    reservation = models.ForeignKey(
+        CreditReservation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='entries'
+    )
+    description = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'prompt_history_credit_ledger'
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.kind} {self.amount}"
+
+
+class CreditSnapshot(models.Model):
+    """
+    Periodic checkpoint of a user's balance, used to reconcile the account
+    against the ledger without replaying it from the start
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='credit_snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField(help_text="Last ledger entry included")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'prompt_history_credit_snapshot'
+        indexes = [
+            models.Index(fields=['user', '-last_entry_id']),
+        ]
+
+
+class PromptTag(models.Model):
+    """
+    Normalized tag index, one row per (history, tag) for live history rows
+    Mirrors PromptHistory.tags so tag filters and facet counts use an index
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prompt_tags')
+    history = models.ForeignKey(PromptHistory, on_delete=models.CASCADE, related_name='tag_index')
+    name = models.CharField(max_length=64, help_text="Normalized (trimmed, lowercased) tag")
+
+    class Meta:
+        db_table = 'prompt_history_tag'
+        constraints = [
+            models.UniqueConstraint(fields=['history', 'name'], name='uniq_history_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'name']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.name}"
+
+
+class UsageRollup(models.Model):
+    """
+    Per-day usage totals, kept equal to aggregating live PromptHistory rows
+    grouped by (user, day, intent_category, source, model)
+    Maintained incrementally by rollups.py
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='usage_rollups')
+    day = models.DateField()
+    intent_category = models.CharField(max_length=20)
+    source = models.CharField(max_length=20)
+    model = models.CharField(max_length=50, blank=True, default='', help_text="Empty for unenhanced prompts")
+
+    prompts = models.IntegerField(default=0)
+    enhanced = models.IntegerField(default=0)
+    tokens = models.BigIntegerField(default=0)
+    credits_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'prompt_history_usage_rollup'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'intent_category', 'source', 'model'],
+                name='uniq_usage_rollup_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.intent_category}/{self.source}/{self.model or '-'}"
+
+
+class ArchivedPromptHistory(models.Model):
+    """
+    Cold storage for soft-deleted history past the retention window
+    The full row is kept as compressed JSON; see retention.py
+    """
+
+    CODEC_ZLIB = 'zlib'
+
+    id = models.UUIDField(primary_key=True, help_text="Id of the archived PromptHistory row")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_prompt_history')
+    created_at = models.DateTimeField()
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    codec = models.CharField(max_length=10, default=CODEC_ZLIB)
+    payload = models.BinaryField(help_text="Compressed JSON of the original row")
+
+    class Meta:
+        db_table = 'prompt_history_archive'
+        indexes = [
+            models.Index(fields=['user', '-deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: archived {self.id}"
+
+    def load(self):
+        """Decompress the archived row into a dict"""
+        from .retention import decode_payload
+        return decode_payload(self.codec, self.payload)
+
+
+class PromptBlob(models.Model):
+    """
+    Content-addressed prompt text shared by every history row that uses it
+    Reference counted; unreferenced blobs are removed by gc_prompt_blobs
+    """
+
+    hash = models.CharField(max_length=64, primary_key=True, help_text="SHA-256 of the UTF-8 text")
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    size = models.IntegerField(help_text="Length of the decoded text in characters")
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'prompt_history_blob'
+        indexes = [
+            models.Index(fields=['refcount'], name='prompt_blob_unreferenced_idx', condition=models.Q(refcount__lte=0)),
+        ]
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} chars, {self.refcount} refs)"
+
+    @property
+    def text(self) -> str:
+        return decode_text(self.codec, self.data)
+
+
+class PromptVector(models.Model):
+    """
+    Hashed n-gram vector of a history row's original prompt (similarity.py)
+    float32, L2-normalized; ids increase so caches can load only new rows
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='prompt_vectors')
+    history = models.OneToOneField(PromptHistory, on_delete=models.CASCADE, related_name='vector')
+    vector = models.BinaryField()
+
+    class Meta:
+        db_table = 'prompt_history_vector'
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: vector for {self.history_id}"
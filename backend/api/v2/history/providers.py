@@ -0,0 +1,342 @@
+"""
+LLM Provider Registry
+Long-lived, pooled provider clients shared across enhancement requests
+"""
+import hashlib
+import random
+import threading
+import time
+from typing import Dict, Any, Iterator
+
+from django.conf import settings
+
+
+# Defaults for every provider; override per provider via settings.HISTORY_PROVIDERS
+DEFAULT_PROVIDER_CONFIG = {
+    'timeout': 30.0,
+    'connect_timeout': 5.0,
+    'max_retries': 2,
+    'pool_size': 20,
+    'keepalive_connections': 10,
+    'keepalive_expiry': 60.0,
+}
+
+
+class BaseProvider:
+    """
+    Common interface for enhancement providers
+
+    Subclasses build their SDK client once (lazily) and reuse it, so the
+    HTTP connection pool and TLS sessions survive across calls.
+    """
+
+    name = None
+
+    def __init__(self, **config):
+        self.config = {**DEFAULT_PROVIDER_CONFIG, **config}
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def _build_client(self):
+        raise NotImplementedError
+
+    def _build_http_client(self):
+        """Keep-alive connection pool shared by all calls to this provider"""
+        import httpx
+
+        return httpx.Client(
+            timeout=httpx.Timeout(self.config['timeout'], connect=self.config['connect_timeout']),
+            limits=httpx.Limits(
+                max_connections=self.config['pool_size'],
+                max_keepalive_connections=self.config['keepalive_connections'],
+                keepalive_expiry=self.config['keepalive_expiry'],
+            ),
+        )
+
+    def complete(self, prompt: str, model: str, max_tokens: int = 500, temperature: float = 0.7) -> Dict[str, Any]:
+        """Run a completion and return {'text': ..., 'tokens': ...}"""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, model: str, max_tokens: int = 500,
+               temperature: float = 0.7) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a completion as events:
+        {'type': 'delta', 'text': ...} per chunk, then {'type': 'done', 'tokens': ...}
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release pooled connections"""
+        if self._client is not None and hasattr(self._client, 'close'):
+            self._client.close()
+        self._client = None
+
+
+class OpenAIProvider(BaseProvider):
+    """OpenAI chat completions"""
+
+    name = 'openai'
+
+    def _build_client(self):
+        import openai
+
+        return openai.OpenAI(
+            api_key=self.config.get('api_key') or getattr(settings, 'OPENAI_API_KEY', ''),
+            max_retries=self.config['max_retries'],
+            http_client=self._build_http_client(),
+        )
+
+    def complete(self, prompt, model, max_tokens=500, temperature=0.7):
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are a prompt engineering expert."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+
+        return {
+            'text': response.choices[0].message.content.strip(),
+            'tokens': response.usage.total_tokens,
+        }
+
+    def stream(self, prompt, model, max_tokens=500, temperature=0.7):
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are a prompt engineering expert."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        tokens = 0
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {'type': 'delta', 'text': chunk.choices[0].delta.content}
+                if chunk.usage is not None:
+                    tokens = chunk.usage.total_tokens
+        finally:
+            response.close()
+
+        yield {'type': 'done', 'tokens': tokens}
+
+
+class AnthropicProvider(BaseProvider):
+    """Anthropic messages"""
+
+    name = 'anthropic'
+
+    def _build_client(self):
+        import anthropic
+
+        return anthropic.Anthropic(
+            api_key=self.config.get('api_key') or getattr(settings, 'ANTHROPIC_API_KEY', ''),
+            max_retries=self.config['max_retries'],
+            http_client=self._build_http_client(),
+        )
+
+    def complete(self, prompt, model, max_tokens=500, temperature=0.7):
+        response = self.client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+
+        tokens = response.usage.input_tokens + response.usage.output_tokens
+
+        return {
+            'text': response.content[0].text.strip(),
+            'tokens': tokens,
+        }
+
+    def stream(self, prompt, model, max_tokens=500, temperature=0.7):
+        with self.client.messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        ) as response:
+            for text in response.text_stream:
+                yield {'type': 'delta', 'text': text}
+            usage = response.get_final_message().usage
+
+        yield {'type': 'done', 'tokens': usage.input_tokens + usage.output_tokens}
+
+
+class StubProviderError(Exception):
+    """Injected provider failure carrying an HTTP-like status code"""
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        super().__init__(f"Stub provider error {status_code}")
+
+
+class StubProvider(BaseProvider):
+    """
+    Deterministic local provider for benchmarks and development
+    No network; optional injected latency via the `latency_ms` setting and
+    injected failures via `error_rate` / `error_status` (default 429)
+    """
+
+    name = 'stub'
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self._random = random.Random(self.config.get('seed', 0))
+
+    def _build_client(self):
+        return None
+
+    def complete(self, prompt, model, max_tokens=500, temperature=0.7):
+        latency_ms = self.config.get('latency_ms', 0)
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+
+        error_rate = self.config.get('error_rate', 0)
+        if error_rate and self._random.random() < error_rate:
+            raise StubProviderError(self.config.get('error_status', 429))
+
+        digest = hashlib.sha256(f"{model}:{prompt}".encode('utf-8')).hexdigest()[:12]
+        text = f"[{model} stub {digest}] {prompt.strip()}"
+        words = len(prompt.split()) + len(text.split())
+
+        return {
+            'text': text,
+            'tokens': min(words, max_tokens + len(prompt.split())),
+        }
+
+    def stream(self, prompt, model, max_tokens=500, temperature=0.7):
+        result = self.complete(prompt, model, max_tokens, temperature)
+        token_latency_ms = self.config.get('token_latency_ms', 0)
+        for index, word in enumerate(result['text'].split(' ')):
+            if token_latency_ms:
+                time.sleep(token_latency_ms / 1000.0)
+            yield {'type': 'delta', 'text': word if index == 0 else ' ' + word}
+        yield {'type': 'done', 'tokens': result['tokens']}
+
+
+class LocalRulesProvider(BaseProvider):
+    """
+    Rule-based enhancer running in-process (see rules.py)
+    Takes the user's raw prompt plus a `style`, never a wrapped enhancement prompt
+    """
+
+    name = 'local'
+
+    def _build_client(self):
+        return None
+
+    def enhance(self, prompt: str, style: str = 'balanced') -> Dict[str, Any]:
+        from .rules import enhance
+
+        return {'text': enhance(prompt, style), 'tokens': 0}
+
+    def complete(self, prompt, model, max_tokens=500, temperature=0.7, style='balanced'):
+        return self.enhance(prompt, style)
+
+    def stream(self, prompt, model, max_tokens=500, temperature=0.7, style='balanced'):
+        result = self.enhance(prompt, style)
+        yield {'type': 'delta', 'text': result['text']}
+        yield {'type': 'done', 'tokens': 0}
+
+
+class ProviderRegistry:
+    """
+    Maps model names to provider instances
+
+    Models are routed by prefix ('gpt-' -> openai, 'claude-' -> anthropic,
+    'local-' -> the in-process rule engine).
+    Setting HISTORY_PROVIDER_OVERRIDE routes every model to one provider,
+    e.g. 'stub' to benchmark without network.
+    """
+
+    PROVIDER_CLASSES = {
+        'openai': OpenAIProvider,
+        'anthropic': AnthropicProvider,
+        'stub': StubProvider,
+        'local': LocalRulesProvider,
+    }
+
+    MODEL_PREFIXES = {
+        'gpt-': 'openai',
+        'claude-': 'anthropic',
+        'stub-': 'stub',
+        'local-': 'local',
+    }
+
+    def __init__(self, config: Dict[str, Dict[str, Any]] = None, override: str = None):
+        self.config = config if config is not None else getattr(settings, 'HISTORY_PROVIDERS', {})
+        self.override = override if override is not None else getattr(settings, 'HISTORY_PROVIDER_OVERRIDE', None)
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def provider_name_for(self, model: str) -> str:
+        if self.override:
+            return self.override
+        for prefix, name in self.MODEL_PREFIXES.items():
+            if model.startswith(prefix):
+                return name
+        raise ValueError(f"Unsupported model: {model}")
+
+    def get(self, name: str) -> BaseProvider:
+        """Return the shared provider instance for `name`"""
+        provider = self._providers.get(name)
+        if provider is None:
+            with self._lock:
+                provider = self._providers.get(name)
+                if provider is None:
+                    provider_class = self.PROVIDER_CLASSES[name]
+                    provider = provider_class(**self.config.get(name, {}))
+                    self._providers[name] = provider
+        return provider
+
+    def for_model(self, model: str) -> BaseProvider:
+        return self.get(self.provider_name_for(model))
+
+    def register(self, name: str, provider: BaseProvider):
+        """Install a provider instance (e.g. a stub with custom latency)"""
+        with self._lock:
+            old = self._providers.get(name)
+            self._providers[name] = provider
+        if old is not None and old is not provider:
+            old.close()
+
+    def close(self):
+        with self._lock:
+            providers, self._providers = self._providers, {}
+        for provider in providers.values():
+            provider.close()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """Return the process-wide provider registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ProviderRegistry()
+    return _registry
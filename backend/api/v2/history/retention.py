@@ -0,0 +1,130 @@
+"""
+Prompt History Retention
+Archives soft-deleted rows past the retention window and purges them in
+small, throttled batches
+"""
+import json
+import logging
+import time
+import zlib
+from datetime import timedelta
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import release_rows
+from .models import ArchivedPromptHistory, PromptHistory
+
+logger = logging.getLogger(__name__)
+
+# Columns not worth archiving (derived from the prompt text, or blob
+# references; the archived row carries the text itself)
+DERIVED_FIELDS = {'preview', 'optimized_preview', 'search_vector', 'original_blob', 'optimized_blob'}
+
+
+def get_retention_days() -> int:
+    """Days a soft-deleted row stays in prompt_history before archiving"""
+    return getattr(settings, 'HISTORY_SOFT_DELETE_RETENTION_DAYS', 30)
+
+
+def get_archive_retention_days():
+    """Days archived rows are kept; None keeps them forever"""
+    return getattr(settings, 'HISTORY_ARCHIVE_RETENTION_DAYS', None)
+
+
+def encode_payload(row: Dict[str, Any]) -> bytes:
+    level = getattr(settings, 'HISTORY_ARCHIVE_COMPRESSION_LEVEL', 6)
+    return zlib.compress(json.dumps(row, cls=DjangoJSONEncoder).encode('utf-8'), level)
+
+
+def decode_payload(codec: str, payload) -> Dict[str, Any]:
+    if codec != ArchivedPromptHistory.CODEC_ZLIB:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    return json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+
+
+def _archive_row(history: PromptHistory) -> ArchivedPromptHistory:
+    row = {
+        field.attname: getattr(history, field.attname)  # text fields read through their blobs
+        for field in history._meta.concrete_fields
+        if field.name not in DERIVED_FIELDS
+    }
+    return ArchivedPromptHistory(
+        id=history.id,
+        user_id=history.user_id,
+        created_at=history.created_at,
+        deleted_at=history.deleted_at,
+        payload=encode_payload(row),
+    )
+
+
+def compact(batch_size: int = 500, max_batches: int = 100, pause: float = None,
+            older_than_days: int = None) -> int:
+    """
+    Move soft-deleted rows older than the retention window into the archive
+
+    Each batch runs in its own short transaction and locks its rows with
+    SKIP LOCKED, so a batch never waits on rows a user is writing. The
+    sweep sleeps `pause` seconds between batches to cap its I/O.
+    Returns the number of rows archived.
+    """
+    if pause is None:
+        pause = getattr(settings, 'HISTORY_COMPACTION_PAUSE', 0.1)
+    days = get_retention_days() if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+
+    archived = 0
+    for _ in range(max_batches):
+        with transaction.atomic():
+            rows = list(
+                PromptHistory.objects.select_for_update(skip_locked=True)
+                .filter(is_deleted=True, deleted_at__lt=cutoff)
+                .order_by('deleted_at')[:batch_size]
+            )
+            if not rows:
+                break
+
+            ArchivedPromptHistory.objects.bulk_create(
+                [_archive_row(history) for history in rows],
+                ignore_conflicts=True
+            )
+            PromptHistory.objects.filter(id__in=[history.id for history in rows]).delete()
+            release_rows(rows)
+
+        archived += len(rows)
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if archived:
+        logger.info("Archived %s soft-deleted history rows", archived)
+    return archived
+
+
+def purge_archive(batch_size: int = 1000, max_batches: int = 100, pause: float = None) -> int:
+    """Delete archived rows past HISTORY_ARCHIVE_RETENTION_DAYS in batches"""
+    days = get_archive_retention_days()
+    if days is None:
+        return 0
+    if pause is None:
+        pause = getattr(settings, 'HISTORY_COMPACTION_PAUSE', 0.1)
+    cutoff = timezone.now() - timedelta(days=days)
+
+    deleted = 0
+    for _ in range(max_batches):
+        ids = list(
+            ArchivedPromptHistory.objects.filter(archived_at__lt=cutoff)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += ArchivedPromptHistory.objects.filter(id__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,152 @@
+"""
+Usage Rollups
+Incrementally maintained per-day usage totals for dashboards and /stats/
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import PromptHistory, UsageRollup
+
+COUNTERS = ('prompts', 'enhanced', 'tokens', 'credits_spent')
+KEY_FIELDS = ('user_id', 'day', 'intent_category', 'source', 'model')
+GROUP_FIELDS = ('day', 'intent_category', 'source', 'model')
+
+
+def usage_of(history, include_deleted: bool = False) -> Optional[Tuple[tuple, Dict[str, Any]]]:
+    """
+    A history row's contribution to the rollup: (key, counters)
+    Soft-deleted rows contribute nothing unless include_deleted is set.
+    """
+    if history.is_deleted and not include_deleted:
+        return None
+    created_at = history.created_at or timezone.now()
+    day = timezone.localtime(created_at).date() if timezone.is_aware(created_at) else created_at.date()
+    key = (history.user_id, day, history.intent_category, history.source, history.model or '')
+    counters = {
+        'prompts': 1,
+        'enhanced': 1 if history.enhanced_at else 0,
+        'tokens': history.tokens or 0,
+        'credits_spent': history.credits_spent or Decimal('0.00'),
+    }
+    return key, counters
+
+
+def _apply(deltas):
+    """Add {key: counters} to the rollup with conditional F() updates"""
+    for key, counters in deltas.items():
+        if not any(counters.values()):
+            continue
+        lookup = dict(zip(KEY_FIELDS, key))
+        updates = {name: F(name) + value for name, value in counters.items() if value}
+        with transaction.atomic():
+            if UsageRollup.objects.filter(**lookup).update(**updates):
+                continue
+            try:
+                with transaction.atomic():
+                    UsageRollup.objects.create(**lookup, **counters)
+            except IntegrityError:
+                # Created concurrently; fold into the winner
+                UsageRollup.objects.filter(**lookup).update(**updates)
+
+
+def record_change(before, after):
+    """Move a row's contribution from `before` to `after` (both from usage_of)"""
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    if before is not None:
+        key, counters = before
+        for name, value in counters.items():
+            deltas[key][name] -= value
+    if after is not None:
+        key, counters = after
+        for name, value in counters.items():
+            deltas[key][name] += value
+    _apply(deltas)
+
+
+def record_created(histories):
+    """Add freshly inserted rows, one UPDATE per distinct key"""
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for history in histories:
+        usage = usage_of(history)
+        if usage is None:
+            continue
+        key, counters = usage
+        for name, value in counters.items():
+            deltas[key][name] += value
+    _apply(deltas)
+
+
+def rebuild(user=None) -> int:
+    """Recompute rollups from PromptHistory (all users, or one)"""
+    rows = PromptHistory.objects.filter(is_deleted=False)
+    rollups = UsageRollup.objects.all()
+    if user is not None:
+        rows = rows.filter(user=user)
+        rollups = rollups.filter(user=user)
+
+    aggregates = (
+        rows.annotate(day=TruncDate('created_at'), model_key=Coalesce('model', Value('')))
+        .values('user_id', 'day', 'intent_category', 'source', 'model_key')
+        .annotate(
+            n_prompts=Count('id'),
+            n_enhanced=Count('id', filter=Q(enhanced_at__isnull=False)),
+            n_tokens=Coalesce(Sum('tokens'), 0),
+            n_credits=Coalesce(Sum('credits_spent'), Decimal('0.00')),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        rollups.delete()
+        created = UsageRollup.objects.bulk_create([
+            UsageRollup(
+                user_id=row['user_id'],
+                day=row['day'],
+                intent_category=row['intent_category'],
+                source=row['source'],
+                model=row['model_key'],
+                prompts=row['n_prompts'],
+                enhanced=row['n_enhanced'],
+                tokens=row['n_tokens'],
+                credits_spent=row['n_credits'],
+            )
+            for row in aggregates.iterator()
+        ], batch_size=1000)
+    return len(created)
+
+
+def usage_stats(user, days: int = 30, group_by: str = 'day') -> Dict[str, Any]:
+    """
+    Totals and a series for the last `days` days, read from the rollup
+    Cost depends on rollup rows in range, not on history size.
+    """
+    if group_by not in GROUP_FIELDS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_FIELDS)}")
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rollups = UsageRollup.objects.filter(user=user, day__gte=since)
+    sums = {f'total_{name}': Sum(name) for name in COUNTERS}
+
+    def unprefix(row):
+        # Sums over an empty range are NULL
+        return {
+            name.replace('total_', '', 1): (0 if value is None else value)
+            for name, value in row.items()
+        }
+
+    totals = unprefix(rollups.aggregate(**sums))
+    series = [unprefix(row) for row in rollups.values(group_by).annotate(**sums).order_by(group_by)]
+    return {
+        'since': since,
+        'days': days,
+        'group_by': group_by,
+        'totals': totals,
+        'series': series,
+    }
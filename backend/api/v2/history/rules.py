@@ -0,0 +1,116 @@
+"""
+Local Rule-Based Enhancer
+Python port of the extension's enhancePromptAI (background.js): wraps a
+prompt in a context / structure / approach scaffold with no network call
+"""
+from typing import Any, Dict
+
+CONTEXT_BLOCK = """Before answering, please ask me for any additional context about:
+- The specific goal I'm trying to achieve
+- Any constraints or requirements
+- My experience level with this topic
+
+"""
+
+DEFAULT_APPROACH = [
+    "Breaking down the problem into logical steps",
+    "Explaining your reasoning for each step",
+    "Providing specific, actionable information",
+]
+
+EXAMPLES_STEP = "Including relevant examples where helpful"
+
+DEFAULT_GUIDELINES = [
+    "Be specific and avoid vague generalities",
+    "State assumptions clearly when uncertain",
+    "Provide reasoning for recommendations",
+]
+
+DEFAULT_CLOSING = "Please ask any clarifying questions before providing your comprehensive response."
+
+# One rule set per PromptEnhancementService.STYLE_TEMPLATES entry;
+# 'balanced' reproduces enhancePromptAI's default options exactly
+STYLE_RULES: Dict[str, Dict[str, Any]] = {
+    'balanced': {
+        'add_context': True,
+        'approach': DEFAULT_APPROACH,
+        'add_examples': False,
+        'guidelines': [],
+        'closing': DEFAULT_CLOSING,
+    },
+    'concise': {
+        'add_context': False,
+        'approach': [
+            "Answering directly, leading with the key point",
+            "Keeping only the information I need to act on",
+        ],
+        'add_examples': False,
+        'guidelines': [
+            "Use short sentences or bullet points",
+            "Skip background I didn't ask for",
+        ],
+        'closing': None,
+    },
+    'detailed': {
+        'add_context': True,
+        'approach': DEFAULT_APPROACH,
+        'add_examples': True,
+        'guidelines': DEFAULT_GUIDELINES,
+        'closing': DEFAULT_CLOSING,
+    },
+    'creative': {
+        'add_context': False,
+        'approach': [
+            "Exploring several distinct ideas before settling on one",
+            "Favouring original angles over the obvious answer",
+            "Using vivid, concrete language",
+        ],
+        'add_examples': True,
+        'guidelines': [
+            "Feel free to take unexpected directions",
+            "Briefly note why the chosen idea stands out",
+        ],
+        'closing': None,
+    },
+    'technical': {
+        'add_context': True,
+        'approach': DEFAULT_APPROACH,
+        'add_examples': True,
+        'guidelines': DEFAULT_GUIDELINES + [
+            "Use precise terminology and name versions, units and standards",
+            "Call out edge cases, trade-offs and failure modes",
+        ],
+        'closing': DEFAULT_CLOSING,
+    },
+}
+
+
+def enhance(prompt: str, style: str = 'balanced', **overrides) -> str:
+    """
+    Scaffold `prompt` with the rule set for `style`
+
+    Keyword overrides mirror enhancePromptAI's options
+    (add_context, add_examples, guidelines, closing).
+    """
+    rules = {**STYLE_RULES.get(style, STYLE_RULES['balanced']), **overrides}
+
+    parts = []
+    if rules['add_context']:
+        parts.append(CONTEXT_BLOCK)
+
+    parts.append(f"Main Request:\n{prompt.strip()}\n\n")
+
+    steps = list(rules['approach'])
+    if rules['add_examples']:
+        steps.append(EXAMPLES_STEP)
+    parts.append("Please approach this by:\n" + '\n'.join(
+        f"{number}. {step}" for number, step in enumerate(steps, 1)
+    ))
+
+    if rules['guidelines']:
+        parts.append("\n\nImportant guidelines:\n" + '\n'.join(f"- {line}" for line in rules['guidelines']))
+
+    if rules['closing']:
+        parts.append(f"\n\n{rules['closing']}")
+
+    return ''.join(parts)
@@ -0,0 +1,411 @@
+"""
+Provider Scheduler
+Per-model rate limiting, concurrency caps, circuit breaking and failover
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+from django.conf import settings
+
+from . import metrics
+
+
+# Per-model limits; override with settings.HISTORY_MODEL_LIMITS ('default' applies to unlisted models)
+DEFAULT_MODEL_LIMITS = {
+    'rate': 10.0,             # sustained requests per second
+    'burst': 20,              # bucket capacity
+    'concurrency': 16,        # in-flight calls per process
+    'acquire_timeout': 2.0,   # seconds to wait for a token / slot
+    'failure_threshold': 5,   # consecutive failures that open the breaker
+    'recovery_timeout': 30.0,  # seconds before a half-open probe
+}
+
+# Models that can stand in for each other; override with settings.HISTORY_FAILOVER_GROUPS
+DEFAULT_FAILOVER_GROUPS = [
+    ['gpt-4o-mini', 'claude-3-5-haiku-20241022'],
+    ['gpt-4o', 'claude-3-5-sonnet-20241022'],
+]
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when no model in the failover group can take the request"""
+
+    def __init__(self, model: str, retry_after: float = None):
+        self.model = model
+        self.retry_after = retry_after
+        super().__init__(f"Provider for {model} is unavailable, try again later")
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Rate limits, timeouts, overloads and 5xx are worth failing over"""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(exc, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status_code in RETRYABLE_STATUS_CODES:
+        return True
+    name = type(exc).__name__
+    return any(marker in name for marker in ('RateLimit', 'Timeout', 'Connection', 'Overloaded', 'InternalServer'))
+
+
+class TokenBucket:
+    """Classic token bucket refilled at `rate` tokens/second up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token; returns 0 on success or seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate else float('inf')
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open after `recovery_timeout`; one probe decides.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                return False
+            # Half-open: let exactly one probe through
+            if self._probing:
+                return False
+            self._state = self.HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """Give back a half-open probe that never produced a verdict (throttled, client error)"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return 0.0
+            return max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+
+class ModelLane:
+    """Rate limit, concurrency cap, breaker and latency stats for one model"""
+
+    LATENCY_ALPHA = 0.2
+
+    def __init__(self, model: str, **limits):
+        self.model = model
+        self.limits = {**DEFAULT_MODEL_LIMITS, **limits}
+        self.bucket = TokenBucket(self.limits['rate'], self.limits['burst'])
+        self.slots = threading.BoundedSemaphore(self.limits['concurrency'])
+        self.breaker = CircuitBreaker(self.limits['failure_threshold'], self.limits['recovery_timeout'])
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.stats = {
+            'calls': 0, 'successes': 0, 'failures': 0, 'client_errors': 0, 'throttled': 0, 'rejected': 0,
+        }
+        self._lock = threading.Lock()
+
+    def try_enter(self, deadline: float) -> bool:
+        """Pass the breaker, take a rate token and a concurrency slot"""
+        if not self.breaker.allow():
+            self._count('rejected')
+            return False
+        remaining = max(deadline - time.monotonic(), 0)
+        if not self.bucket.acquire(remaining):
+            self._count('throttled')
+            self.breaker.release_probe()
+            return False
+        if not self.slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._count('throttled')
+            self.breaker.release_probe()
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.stats['calls'] += 1
+        return True
+
+    def leave(self, latency: float = None, failed: bool = False, neutral: bool = False):
+        """
+        Free the slot and report the outcome
+        neutral is for errors that say nothing about provider health (400,
+        401, bad key): no breaker transition and no latency sample.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if neutral:
+                self.stats['client_errors'] += 1
+            elif failed:
+                self.stats['failures'] += 1
+            else:
+                self.stats['successes'] += 1
+                if latency is not None:
+                    if self.latency_ewma is None:
+                        self.latency_ewma = latency
+                    else:
+                        self.latency_ewma += self.LATENCY_ALPHA * (latency - self.latency_ewma)
+        self.slots.release()
+        if neutral:
+            self.breaker.release_probe()
+        elif failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            in_flight = self.in_flight
+            latency = self.latency_ewma
+        return {
+            'rate': self.limits['rate'],
+            'burst': self.limits['burst'],
+            'tokens_available': round(self.bucket.available, 2),
+            'concurrency': self.limits['concurrency'],
+            'in_flight': in_flight,
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'retry_after': round(self.breaker.retry_after(), 2),
+            'latency_ewma_ms': round(latency * 1000, 1) if latency is not None else None,
+            **stats,
+        }
+
+
+class ProviderScheduler:
+    """
+    Routes provider calls through per-model lanes
+
+    A call goes to the requested model first; if its breaker is open, it is
+    throttled, or it fails with a retryable error, the call fails over to
+    equivalent models in the same group, fastest first.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, Any]] = None, failover_groups: List[List[str]] = None,
+                 failover: bool = None):
+        self.limits = limits if limits is not None else getattr(settings, 'HISTORY_MODEL_LIMITS', {})
+        groups = failover_groups if failover_groups is not None else getattr(
+            settings, 'HISTORY_FAILOVER_GROUPS', DEFAULT_FAILOVER_GROUPS
+        )
+        self.failover = failover if failover is not None else getattr(settings, 'HISTORY_PROVIDER_FAILOVER', True)
+        self._groups = {model: group for group in groups for model in group}
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def lane(self, model: str) -> ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(model)
+                if lane is None:
+                    limits = {**self.limits.get('default', {}), **self.limits.get(model, {})}
+                    lane = ModelLane(model, **limits)
+                    self._lanes[model] = lane
+        return lane
+
+    def candidates(self, model: str) -> List[str]:
+        """Requested model first, then healthy equivalents by observed latency"""
+        if not self.failover:
+            return [model]
+        others = [m for m in self._groups.get(model, []) if m != model]
+
+        def latency(m):
+            ewma = self.lane(m).latency_ewma
+            return ewma if ewma is not None else float('inf')
+
+        return [model] + sorted(others, key=latency)
+
+    def call(self, model: str, fn: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Run fn(served_model) on the first model that admits the call
+        The result gets a 'model' key naming the model that served it.
+        """
+        last_error = None
+        for candidate in self.candidates(model):
+            lane = self.lane(candidate)
+            if not lane.try_enter(time.monotonic() + lane.limits['acquire_timeout']):
+                continue
+
+            started = time.monotonic()
+            try:
+                result = fn(candidate)
+            except Exception as e:
+                metrics.PROVIDER_ERRORS.inc(model=candidate)
+                if not is_retryable(e):
+                    lane.leave(neutral=True)
+                    raise
+                lane.leave(failed=True)
+                last_error = e
+                continue
+            latency = time.monotonic() - started
+            lane.leave(latency=latency)
+            metrics.observe_provider_call(candidate, latency, result.get('tokens'))
+            return {**result, 'model': candidate}
+
+        raise ProviderUnavailableError(model, self.lane(model).breaker.retry_after() or None) from last_error
+
+    def stream(self, model: str, open_fn: Callable[[str], Iterator[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of call()
+        Fails over only until the first event arrives; the lane's slot is
+        held for the whole stream. The final 'done' event carries 'model'.
+        """
+        last_error = None
+        for candidate in self.candidates(model):
+            lane = self.lane(candidate)
+            if not lane.try_enter(time.monotonic() + lane.limits['acquire_timeout']):
+                continue
+
+            started = time.monotonic()
+            try:
+                # Inside the try: a synchronous failure opening the stream must free the slot too
+                events = open_fn(candidate)
+                first = next(events)
+            except StopIteration:
+                lane.leave(latency=time.monotonic() - started)
+                return
+            except Exception as e:
+                metrics.PROVIDER_ERRORS.inc(model=candidate)
+                if not is_retryable(e):
+                    lane.leave(neutral=True)
+                    raise
+                lane.leave(failed=True)
+                last_error = e
+                continue
+
+            return (yield from self._relay(lane, candidate, first, events, started))
+
+        raise ProviderUnavailableError(model, self.lane(model).breaker.retry_after() or None) from last_error
+
+    def _relay(self, lane, model, first, events, started):
+        failed = neutral = False
+        try:
+            event = first
+            while True:
+                if event.get('type') == 'done':
+                    event = {**event, 'model': model}
+                    metrics.observe_provider_call(model, time.monotonic() - started, event.get('tokens'))
+                yield event
+                event = next(events)
+        except StopIteration:
+            pass
+        except GeneratorExit:
+            # Consumer went away; not the provider's fault, so no breaker verdict
+            neutral = True
+            events.close()
+            raise
+        except Exception as e:
+            metrics.PROVIDER_ERRORS.inc(model=model)
+            failed = is_retryable(e)
+            neutral = not failed
+            raise
+        finally:
+            lane.leave(latency=time.monotonic() - started, failed=failed, neutral=neutral)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Live limits and breaker state for every model seen so far"""
+        with self._lock:
+            lanes = dict(self._lanes)
+        return {
+            'failover': self.failover,
+            'models': {model: lane.snapshot() for model, lane in sorted(lanes.items())},
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_provider_scheduler() -> ProviderScheduler:
+    """Return the process-wide provider scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ProviderScheduler()
+    return _scheduler
+
+
+def set_provider_scheduler(scheduler: ProviderScheduler) -> ProviderScheduler:
+    """Install a process-wide scheduler (e.g. unthrottled for benchmarks); returns the previous one"""
+    global _scheduler
+    with _scheduler_lock:
+        previous, _scheduler = _scheduler, scheduler
+    return previous
@@ -0,0 +1,275 @@
+"""
+Prompt History Full-Text Search
+Ranked, prefix-matching search over original/optimized prompts and tags
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import Case, When, Value, IntegerField, Q, F, TextField
+from django.db.models.functions import Cast
+
+from .models import PromptHistory, HAS_POSTGRES_SEARCH
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query: str):
+    """Split a free-text query into safe search terms"""
+    return _TOKEN_RE.findall(query or '')[:16]
+
+
+def document_for(history) -> str:
+    """Text indexed for a history row"""
+    tags = ' '.join(str(tag) for tag in (history.tags or []))
+    return '\n'.join(filter(None, [history.original_prompt, history.optimized_prompt, tags]))
+
+
+class BasicSearchBackend:
+    """Unindexed icontains scan; used on databases without a native engine"""
+
+    vendor = None
+
+    def search(self, queryset, query, user_id=None):
+        return queryset.filter(
+            Q(original_prompt__icontains=query) |
+            Q(optimized_prompt__icontains=query) |
+            Q(tags__contains=[query])
+        ).order_by('-created_at')
+
+    def index(self, history):
+        pass
+
+    def index_many(self, histories):
+        for history in histories:
+            self.index(history)
+
+    def remove(self, history_ids):
+        pass
+
+    def rebuild(self, queryset):
+        return 0
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    """
+    Weighted tsvector stored on PromptHistory.search_vector with a GIN index
+    Prompts weigh more than the enhancement, which weighs more than tags
+    """
+
+    vendor = 'postgresql'
+    INDEX = 'prompt_history_search_gin'
+
+    def _vector(self, history=None):
+        """
+        Vector over the row's columns, or over `history`'s in-memory text
+        (needed when the text lives in a PromptBlob and the column is '')
+        """
+        from django.contrib.postgres.search import SearchVector
+
+        config = getattr(settings, 'HISTORY_SEARCH_CONFIG', 'english')
+        if history is None:
+            original, optimized = 'original_prompt', 'optimized_prompt'
+        else:
+            original = Value(history.original_prompt or '', output_field=TextField())
+            optimized = Value(history.optimized_prompt or '', output_field=TextField())
+        return (
+            SearchVector(original, weight='A', config=config) +
+            SearchVector(optimized, weight='B', config=config) +
+            SearchVector(Cast('tags', TextField()), weight='C', config=config)
+        )
+
+    @staticmethod
+    def _blob_backed(history):
+        return bool(history.original_blob_id or history.optimized_blob_id)
+
+    def search(self, queryset, query, user_id=None):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+
+        config = getattr(settings, 'HISTORY_SEARCH_CONFIG', 'english')
+        raw = ' & '.join(f"{term}:*" for term in terms)
+        search_query = SearchQuery(raw, search_type='raw', config=config)
+
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at')
+
+    def index(self, history):
+        vector = self._vector(history) if self._blob_backed(history) else self._vector()
+        PromptHistory.objects.filter(pk=history.pk).update(search_vector=vector)
+
+    def index_many(self, histories):
+        inline = [h.pk for h in histories if not self._blob_backed(h)]
+        if inline:
+            PromptHistory.objects.filter(pk__in=inline).update(search_vector=self._vector())
+        for history in histories:
+            if self._blob_backed(history):
+                self.index(history)
+
+    def remove(self, history_ids):
+        PromptHistory.objects.filter(pk__in=history_ids).update(search_vector=None)
+
+    def ensure_index(self):
+        """GIN index on search_vector; PostgreSQL-only, so it lives outside Meta.indexes"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.INDEX} "
+                f"ON {PromptHistory._meta.db_table} USING gin (search_vector)"
+            )
+
+    def rebuild(self, queryset):
+        self.ensure_index()
+        count = queryset.update(search_vector=self._vector())
+        blob_backed = queryset.filter(Q(original_blob__isnull=False) | Q(optimized_blob__isnull=False))
+        for history in blob_backed.iterator():
+            self.index(history)
+        return count
+
+
+class SQLiteSearchBackend(BasicSearchBackend):
+    """
+    FTS5 shadow table keyed on history id, ranked with bm25()
+    Only live rows are indexed; soft deletes remove the entry
+    """
+
+    vendor = 'sqlite'
+    TABLE = 'prompt_history_fts'
+
+    def __init__(self):
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def ensure_table(self):
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+                        "history_id UNINDEXED, user_id UNINDEXED, body, "
+                        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                    )
+                self._ready = True
+
+    def search(self, queryset, query, user_id=None):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+
+        self.ensure_table()
+        match = ' '.join(f'"{term}"*' for term in terms)
+        limit = getattr(settings, 'HISTORY_SEARCH_MAX_RESULTS', 1000)
+
+        # The caller's filters (user, is_deleted, category, tags, dates) run
+        # inside the FTS query, so LIMIT caps matching rows rather than
+        # cutting the ranking before the filters see it
+        scope_sql, scope_params = queryset.order_by().values('id').query.sql_with_params()
+        sql = (
+            f"SELECT history_id FROM {self.TABLE} "
+            f"WHERE {self.TABLE} MATCH %s"
+        )
+        params = [match]
+        if user_id is not None:
+            sql += " AND user_id = %s"
+            params.append(str(user_id))
+        sql += f" AND history_id IN ({scope_sql}) ORDER BY bm25({self.TABLE}) LIMIT %s"
+        params.extend(scope_params)
+        params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranked_ids = [row[0] for row in cursor.fetchall()]
+
+        if not ranked_ids:
+            return queryset.none()
+
+        ordering = Case(
+            *[When(id=history_id, then=Value(position)) for position, history_id in enumerate(ranked_ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(id__in=ranked_ids).annotate(rank=ordering).order_by('rank')
+
+    def index(self, history):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE} WHERE history_id = %s", [history.pk.hex])
+            if not history.is_deleted:
+                cursor.execute(
+                    f"INSERT INTO {self.TABLE} (history_id, user_id, body) VALUES (%s, %s, %s)",
+                    [history.pk.hex, str(history.user_id), document_for(history)]
+                )
+
+    def index_many(self, histories):
+        """Index freshly inserted rows (bulk_create skips post_save)"""
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.TABLE} (history_id, user_id, body) VALUES (%s, %s, %s)",
+                [[h.pk.hex, str(h.user_id), document_for(h)] for h in histories if not h.is_deleted]
+            )
+
+    def remove(self, history_ids):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.TABLE} WHERE history_id = %s",
+                [[history_id.hex] for history_id in history_ids]
+            )
+
+    def rebuild(self, queryset):
+        self.ensure_table()
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE}")
+            rows = queryset.filter(is_deleted=False).select_related(
+                'original_blob', 'optimized_blob'
+            ).only(
+                'id', 'user_id', 'original_prompt', 'optimized_prompt', 'tags', 'is_deleted',
+                'original_blob', 'optimized_blob'
+            )
+            for history in rows.iterator(chunk_size=2000):
+                cursor.execute(
+                    f"INSERT INTO {self.TABLE} (history_id, user_id, body) VALUES (%s, %s, %s)",
+                    [history.pk.hex, str(history.user_id), document_for(history)]
+                )
+                count += 1
+        return count
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the search backend for the active database"""
+    vendor = connection.vendor
+    backend = _backends.get(vendor)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(vendor)
+            if backend is None:
+                if vendor == 'postgresql' and HAS_POSTGRES_SEARCH:
+                    backend = PostgresSearchBackend()
+                elif vendor == 'sqlite':
+                    backend = SQLiteSearchBackend()
+                else:
+                    backend = BasicSearchBackend()
+                _backends[vendor] = backend
+    return backend
+
+
+def ensure_search_indexes(using='default', **kwargs):
+    """post_migrate hook: create vendor-specific search structures"""
+    if using != DEFAULT_DB_ALIAS:
+        return
+    backend = get_search_backend()
+    if isinstance(backend, PostgresSearchBackend):
+        backend.ensure_index()
+    elif isinstance(backend, SQLiteSearchBackend):
+        backend.ensure_table()
@@ -2,10 +2,38 @@
 Prompt History v2 Serializers
 """
 from rest_framework import serializers
-from .models import PromptHistory
+from .models import PromptHistory, EnhancementJob
 
 
-class PromptHistorySerializer(serializers.ModelSerializer):
+ENHANCE_STYLES = ['concise', 'detailed', 'creative', 'technical', 'balanced']
+
+
+def _split_param(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Honour `?fields=a,b` and `?exclude=c` on GET requests
+    `id` is always included
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+
+        requested = _split_param(request.query_params.get('fields'))
+        excluded = _split_param(request.query_params.get('exclude'))
+        for name in list(self.fields):
+            if name == 'id':
+                continue
+            if (requested and name not in requested) or name in excluded:
+                self.fields.pop(name)
+
+
+class PromptHistorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Main serializer for Prompt History
     """
@@ -24,6 +52,7 @@ class PromptHistorySerializer(serializers.ModelSerializer):
             'tokens',
             'credits_spent',
             'enhanced_at',
+            'variants',
             'created_at',
             'updated_at',
         ]
@@ -34,6 +63,7 @@ class PromptHistorySerializer(serializers.ModelSerializer):
             'tokens',
             'credits_spent',
             'enhanced_at',
+            'variants',
             'created_at',
             'updated_at',
         ]
@@ -51,6 +81,36 @@ class PromptHistorySerializer(serializers.ModelSerializer):
         return value
 
 
+class PromptHistoryListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Compact list representation (`?view=compact`)
+    Stored previews instead of the full prompt text and meta
+    """
+    is_enhanced = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PromptHistory
+        fields = [
+            'id',
+            'preview',
+            'optimized_preview',
+            'is_enhanced',
+            'intent_category',
+            'source',
+            'tags',
+            'model',
+            'tokens',
+            'credits_spent',
+            'enhanced_at',
+            'created_at',
+            'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_is_enhanced(self, obj):
+        return obj.enhanced_at is not None
+
+
 class PromptHistoryCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating prompt history
@@ -73,6 +133,36 @@ class PromptHistoryCreateSerializer(serializers.ModelSerializer):
         return value.strip()
 
 
+class PromptHistoryBulkItemSerializer(PromptHistoryCreateSerializer):
+    """
+    Serializer for one item of a bulk create request
+    """
+    idempotency_key = serializers.CharField(required=False, max_length=255)
+
+    class Meta(PromptHistoryCreateSerializer.Meta):
+        fields = PromptHistoryCreateSerializer.Meta.fields + ['idempotency_key']
+
+
+class BulkCreateRequestSerializer(serializers.Serializer):
+    """
+    Serializer for bulk create request envelope
+    Items are validated individually so one bad item doesn't fail the batch
+    """
+    items = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        help_text="History items to create"
+    )
+
+    def validate_items(self, value):
+        """Cap batch size"""
+        from django.conf import settings
+        max_items = getattr(settings, 'HISTORY_BULK_MAX_ITEMS', 500)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} items per request")
+        return value
+
+
 class PromptHistoryUpdateSerializer(serializers.ModelSerializer):
     """
     Serializer for updating prompt history (tags, meta, etc.)
@@ -105,6 +195,7 @@ class EnhanceRequestSerializer(serializers.Serializer):
             'gpt-4o',
             'claude-3-5-sonnet-20241022',
             'claude-3-5-haiku-20241022',
+            'local-rules',
         ]
         if value not in allowed_models:
             raise serializers.ValidationError(
@@ -114,14 +205,57 @@ class EnhanceRequestSerializer(serializers.Serializer):
 
     def validate_style(self, value):
         """Validate style selection"""
-        allowed_styles = ['concise', 'detailed', 'creative', 'technical', 'balanced']
-        if value not in allowed_styles:
+        if value not in ENHANCE_STYLES:
             raise serializers.ValidationError(
-                f"Style must be one of: {', '.join(allowed_styles)}"
+                f"Style must be one of: {', '.join(ENHANCE_STYLES)}"
             )
         return value
 
 
+class EnhanceVariantsRequestSerializer(EnhanceRequestSerializer):
+    """
+    Serializer for a multi-style enhancement request
+    The first style becomes the row's optimized_prompt
+    """
+    style = None
+    styles = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        allow_empty=False,
+        help_text="Styles to generate in one provider call (default: all)"
+    )
+
+    def validate_styles(self, value):
+        """Known styles only, duplicates dropped, order kept"""
+        for style in value:
+            self.validate_style(style)
+        return list(dict.fromkeys(value))
+
+    def validate(self, attrs):
+        attrs.setdefault('styles', list(ENHANCE_STYLES))
+        return attrs
+
+
+class EnhanceBatchRequestSerializer(EnhanceRequestSerializer):
+    """
+    Serializer for batch enhancement request
+    """
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        help_text="History ids to enhance"
+    )
+
+    def validate_ids(self, value):
+        """Cap batch size and drop duplicates"""
+        from django.conf import settings
+        max_items = getattr(settings, 'HISTORY_ENHANCE_BATCH_MAX', 50)
+        value = list(dict.fromkeys(value))
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} ids per request")
+        return value
+
+
 class EnhanceResponseSerializer(serializers.ModelSerializer):
     """
     Serializer for enhancement response
@@ -137,5 +271,37 @@ class EnhanceResponseSerializer(serializers.ModelSerializer):
             'tokens',
             'credits_spent',
             'enhanced_at',
+            'variants',
         ]
         read_only_fields = fields
+
+
+class EnhancementJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for async enhancement job status
+    """
+    history_id = serializers.UUIDField(read_only=True)
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = EnhancementJob
+        fields = [
+            'id',
+            'history_id',
+            'model',
+            'style',
+            'status',
+            'error',
+            'error_detail',
+            'result',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
+        read_only_fields = fields
+
+    def get_result(self, obj):
+        """Include the enhancement once the job has succeeded"""
+        if obj.status != EnhancementJob.STATUS_SUCCEEDED:
+            return None
+        return EnhanceResponseSerializer(obj.history).data
@@ -2,21 +2,24 @@
 Prompt Enhancement Service
 Handles AI-powered prompt optimization with credit deduction
 """
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from decimal import Decimal
-from typing import Dict, Any
-import openai
+from typing import Dict, Any, Iterator, List
 from django.conf import settings
+from django.utils import timezone
 
+from .providers import get_provider_registry
+from .scheduler import get_provider_scheduler, ProviderUnavailableError  # noqa: F401 (re-exported)
+from .cache import get_enhancement_cache
+from .credits import CreditLedger, InsufficientCreditsError  # noqa: F401 (re-exported)
+from .metrics import COALESCED_ENHANCEMENTS, stage
+from .rollups import record_change, usage_of
+from .singleflight import flight_key, get_single_flight
 
-class InsufficientCreditsError(Exception):
-    """Raised when user doesn't have enough credits"""
 
-    def __init__(self, required_credits: Decimal, current_credits: Decimal):
-        self.required_credits = required_credits
-        self.current_credits = current_credits
-        super().__init__(
-            f"Insufficient credits. Required: {required_credits}, Available: {current_credits}"
-        )
+class VariantParseError(ValueError):
+    """The provider's multi-style answer had no usable variants"""
 
 
 class PromptEnhancementService:
@@ -30,6 +33,7 @@ class PromptEnhancementService:
         'gpt-4o': Decimal('0.50'),
         'claude-3-5-sonnet-20241022': Decimal('0.75'),
         'claude-3-5-haiku-20241022': Decimal('0.25'),
+        'local-rules': Decimal('0.00'),
     }
 
     # Style templates
@@ -41,6 +45,17 @@ class PromptEnhancementService:
         'balanced': "Optimize this prompt for clarity, specificity, and effectiveness:",
     }
 
+    # Completion budget per style in a multi-style call
+    VARIANT_MAX_TOKENS = 500
+
+    def __init__(self, providers=None, cache=None, ledger=None, scheduler=None, single_flight=None):
+        # Provider clients, the scheduler, the result cache and in-flight calls are process-wide
+        self.providers = providers or get_provider_registry()
+        self.scheduler = scheduler or get_provider_scheduler()
+        self.cache = cache or get_enhancement_cache()
+        self.ledger = ledger or CreditLedger()
+        self.single_flight = single_flight or get_single_flight()
+
     def enhance_prompt(
         self,
         user,
@@ -58,106 +73,610 @@ class PromptEnhancementService:
             style: The enhancement style
 
         Returns:
-            Dict with optimized_prompt, model, tokens, credits_spent
+            Dict with optimized_prompt, model, tokens, credits_spent, cached
+        """
+        with stage('price'):
+            credits_required, cache_key, cached = self._price(history.original_prompt, model, style)
+
+        # Reserve credits before the provider call (raises if insufficient)
+        reservation = None
+        if credits_required:
+            with stage('reserve'):
+                reservation = self.ledger.reserve(user, credits_required, history=history, model=model)
+
+        try:
+            with stage('generate'):
+                result = self._generate(history.original_prompt, model, style, cache_key, cached)
+        except Exception:
+            if reservation is not None:
+                self.ledger.refund(reservation)
+            raise
+
+        result = self._format_result(result, model, credits_required, cached)
+
+        # Settle the reservation (a cheaper failover model charges less)
+        if reservation is not None:
+            with stage('commit'):
+                self.ledger.commit(reservation, amount=result['credits_spent'])
+
+        return result
+
+    def enhance_batch(
+        self,
+        user,
+        histories,
+        model: str,
+        style: str = 'balanced'
+    ) -> Dict[Any, Dict[str, Any]]:
+        """
+        Enhance many history items with bounded concurrent provider calls
+
+        Credits for the whole batch are reserved up front (raises
+        InsufficientCreditsError if they can't be covered); only successful
+        items are charged. Provider calls run on a thread pool capped per
+        provider by HISTORY_BATCH_CONCURRENCY; results are persisted on the
+        calling thread.
+
+        Returns:
+            Dict of history id -> {'result': {...}} or {'error': ..., 'message': ...}
+        """
+        priced = {
+            history.id: self._price(history.original_prompt, model, style)
+            for history in histories
+        }
+        total = sum((credits for credits, _, _ in priced.values()), Decimal('0.00'))
+
+        reservation = None
+        if total:
+            reservation = self.ledger.reserve(user, total, model=model)
+
+        outcomes = {}
+        charged = Decimal('0.00')
+        try:
+            concurrency = self._batch_concurrency(model)
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(histories)) or 1) as executor:
+                futures = {
+                    executor.submit(
+                        self._generate_shared,
+                        history,
+                        model,
+                        style,
+                        priced[history.id][1],
+                        priced[history.id][2]
+                    ): history
+                    for history in histories
+                }
+                for future in as_completed(futures):
+                    history = futures[future]
+                    credits, _, cached = priced[history.id]
+                    try:
+                        generated, shared = future.result()
+                        result = self._format_result(generated, model, credits, cached)
+                        if shared:
+                            # The same item in a concurrent batch made (and pays for) the call
+                            COALESCED_ENHANCEMENTS.inc(model=model)
+                            result = {**result, 'credits_spent': Decimal('0.00'), 'cached': True, 'coalesced': True}
+                        self._save_enhancement(history, result)
+                    except ProviderUnavailableError as e:
+                        outcomes[history.id] = {'error': 'provider_unavailable', 'message': str(e)}
+                    except Exception as e:
+                        outcomes[history.id] = {'error': 'enhancement_failed', 'message': str(e)}
+                    else:
+                        charged += result['credits_spent']
+                        outcomes[history.id] = {'result': result}
+                    if reservation is not None:
+                        # Long batches outlive the expiry window; keep the hold alive
+                        self.ledger.touch(reservation)
+        finally:
+            if reservation is not None:
+                if charged:
+                    self.ledger.commit(reservation, amount=charged)
+                else:
+                    self.ledger.refund(reservation)
+
+        return outcomes
+
+    def _generate_shared(self, history, model: str, style: str, cache_key: str, cached):
+        """_generate for one batch item; identical items of concurrent batches share the provider call"""
+        return self.single_flight.run(
+            flight_key(history.id, model, 'generate:' + style),
+            lambda: self._generate(history.original_prompt, model, style, cache_key, cached)
+        )
+
+    def _batch_concurrency(self, model: str) -> int:
+        """Max in-flight provider calls for one batch"""
+        limits = getattr(settings, 'HISTORY_BATCH_CONCURRENCY', {})
+        provider_name = self.providers.provider_name_for(model)
+        return limits.get(provider_name, limits.get('default', 4))
+
+    def _price(self, original_prompt: str, model: str, style: str):
+        """
+        Credit cost for an enhancement, applying the cache-hit policy
+        Returns (credits_required, cache_key, cached_result_or_None)
         """
         # Calculate credit cost
         credits_required = self.CREDIT_COSTS.get(model, Decimal('0.10'))
 
-        # Check user credits
-        user_credits = self._get_user_credits(user)
-        if user_credits < credits_required:
-            raise InsufficientCreditsError(credits_required, user_credits)
+        # Identical prompt/model/style already enhanced? Reuse the result
+        cache_key = self.cache.make_key(original_prompt, model, style)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            credits_required = self.cache.credits_for_hit(credits_required)
+
+        return credits_required, cache_key, cached
+
+    def _generate(self, original_prompt: str, model: str, style: str, cache_key: str, cached) -> Dict[str, Any]:
+        """Return the cached result or call the provider and cache it"""
+        if cached is not None:
+            return {'text': cached['text'], 'tokens': 0}
+        result = self._call_model(original_prompt, model, style)
+        if not self._is_local(result.get('model', model)):
+            self.cache.set(cache_key, result)
+        return result
+
+    def _format_result(self, result: Dict[str, Any], model: str, credits_spent: Decimal, cached) -> Dict[str, Any]:
+        # After a failover, report the serving model and never charge more than requested
+        served = result.get('model', model)
+        if served != model:
+            credits_spent = min(credits_spent, self.CREDIT_COSTS.get(served, credits_spent))
+
+        return {
+            'optimized_prompt': result['text'],
+            'model': served,
+            'tokens': result['tokens'],
+            'credits_spent': credits_spent,
+            'cached': cached is not None,
+        }
 
+    def _build_enhancement_prompt(self, original_prompt: str, style: str) -> str:
+        """Wrap the user's prompt in the style instruction"""
         # Get style template
         style_instruction = self.STYLE_TEMPLATES.get(style, self.STYLE_TEMPLATES['balanced'])
 
         # Build enhancement prompt
-        enhancement_prompt = f"""
+        return f"""
 {style_instruction}
 
 Original Prompt:
-{history.original_prompt}
+{original_prompt}
 
 Enhanced Prompt (respond with only the enhanced prompt, no explanations):
 """
 
-        # Call AI model
-        if model.startswith('gpt-'):
-            result = self._enhance_with_openai(enhancement_prompt, model)
-        elif model.startswith('claude-'):
-            result = self._enhance_with_anthropic(enhancement_prompt, model)
-        else:
-            raise ValueError(f"Unsupported model: {model}")
+    def _call_model(self, original_prompt: str, model: str, style: str, stream: bool = False):
+        """
+        Run the enhancement prompt through the model's provider
+        With stream=True, returns the provider's event iterator instead.
+        The result (or final 'done' event) names the model that served it,
+        which differs from `model` after a failover or a local fallback.
+        """
+        # The rule engine is in-process: no rate limits, breaker or cache needed
+        if self._is_local(model):
+            return self._enhance_locally(original_prompt, model, style, stream=stream)
+
+        enhancement_prompt = self._build_enhancement_prompt(original_prompt, style)
+
+        # Call AI model through the scheduler (rate limits, breaker, failover)
+        if stream:
+            return self._stream_with_fallback(original_prompt, model, style, enhancement_prompt)
+        try:
+            return self.scheduler.call(
+                model,
+                lambda served: self._dispatch(enhancement_prompt, served, original_prompt=original_prompt, style=style)
+            )
+        except ProviderUnavailableError:
+            fallback = self._local_fallback_model()
+            if not fallback:
+                raise
+            return self._enhance_locally(original_prompt, fallback, style)
+
+    def _stream_with_fallback(self, original_prompt: str, model: str, style: str, enhancement_prompt: str):
+        """scheduler.stream(), switching to the local engine if no provider admits the call"""
+        events = self.scheduler.stream(
+            model,
+            lambda served: self._dispatch(
+                enhancement_prompt, served, stream=True, original_prompt=original_prompt, style=style
+            )
+        )
+        try:
+            # The scheduler only gives up before the first event
+            try:
+                first = next(events)
+            except StopIteration:
+                return
+            except ProviderUnavailableError:
+                fallback = self._local_fallback_model()
+                if not fallback:
+                    raise
+                yield from self._enhance_locally(original_prompt, fallback, style, stream=True)
+                return
+            yield first
+            yield from events
+        finally:
+            events.close()
+
+    def _is_local(self, model: str) -> bool:
+        return self.providers.provider_name_for(model) == 'local'
+
+    def _local_fallback_model(self):
+        """Local model that answers when every provider is unavailable (None = return 503)"""
+        return getattr(settings, 'HISTORY_LOCAL_FALLBACK_MODEL', None)
+
+    def _enhance_locally(self, original_prompt: str, model: str, style: str, stream: bool = False):
+        """Run the rule-based enhancer; same result / event shape as a provider call"""
+        result = {**self.providers.get('local').enhance(original_prompt, style), 'model': model}
+        if stream:
+            return iter([
+                {'type': 'delta', 'text': result['text']},
+                {'type': 'done', 'tokens': result['tokens'], 'model': model},
+            ])
+        return result
+
+    def _dispatch(self, enhancement_prompt: str, model: str, stream: bool = False, max_tokens: int = 500,
+                  original_prompt: str = None, style: str = 'balanced'):
+        """
+        Send the prompt to the provider that serves `model`
+        A failover group may hand the call to a local model, which gets
+        `original_prompt` and `style` instead of the wrapped enhancement prompt.
+        """
+        provider_name = self.providers.provider_name_for(model)
+        if provider_name == 'local':
+            if original_prompt is None:
+                raise ValueError(f"{model} needs the original prompt, not an enhancement prompt")
+            return self._enhance_locally(original_prompt, model, style, stream=stream)
+        if provider_name == 'openai':
+            return self._enhance_with_openai(enhancement_prompt, model, stream=stream, max_tokens=max_tokens)
+        elif provider_name == 'anthropic':
+            return self._enhance_with_anthropic(enhancement_prompt, model, stream=stream, max_tokens=max_tokens)
+        provider = self.providers.get(provider_name)
+        if stream:
+            return provider.stream(enhancement_prompt, model, max_tokens=max_tokens)
+        return provider.complete(enhancement_prompt, model, max_tokens=max_tokens)
+
+    def enhance_prompt_stream(
+        self,
+        user,
+        history,
+        model: str,
+        style: str = 'balanced'
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of enhance_prompt
+
+        Yields {'type': 'delta', 'text': ...} events as tokens arrive and a
+        final {'type': 'done', 'result': {...}} with the same shape as
+        enhance_prompt. Credits are reserved up front, committed when the
+        stream completes and refunded if it fails or the consumer closes
+        the generator early (client disconnect).
+        """
+        credits_required, cache_key, cached = self._price(history.original_prompt, model, style)
+
+        reservation = None
+        if credits_required:
+            reservation = self.ledger.reserve(user, credits_required, history=history, model=model)
+
+        settled = False
+        try:
+            if cached is not None:
+                yield {'type': 'delta', 'text': cached['text']}
+                result = {'text': cached['text'], 'tokens': 0}
+            else:
+                chunks = []
+                tokens = 0
+                served = model
+                for event in self._call_model(history.original_prompt, model, style, stream=True):
+                    if event['type'] == 'delta':
+                        chunks.append(event['text'])
+                        yield event
+                    elif event['type'] == 'done':
+                        tokens = event['tokens']
+                        served = event.get('model', model)
+                result = {'text': ''.join(chunks).strip(), 'tokens': tokens, 'model': served}
+                if not self._is_local(served):
+                    self.cache.set(cache_key, result)
 
-        # Deduct credits
-        self._deduct_credits(user, credits_required)
+            result = self._format_result(result, model, credits_required, cached)
+            if reservation is not None:
+                self.ledger.commit(reservation, amount=result['credits_spent'])
+            settled = True
+        finally:
+            # Provider error or client went away before the stream finished
+            if not settled and reservation is not None:
+                self.ledger.refund(reservation)
+
+        yield {'type': 'done', 'result': result}
+
+    def enhance_history(
+        self,
+        user,
+        history,
+        model: str,
+        style: str = 'balanced',
+        idempotency_key: str = None
+    ) -> Dict[str, Any]:
+        """
+        Enhance a history item and persist the result on it
 
+        Shared by the synchronous enhance endpoint and the async job runner.
+        Concurrent calls for the same (history, model, style) share one
+        provider call and one debit; the others get the saved result with
+        credits_spent 0 and coalesced True.
+        """
+        def enhance():
+            result = self.enhance_prompt(
+                user=user,
+                history=history,
+                model=model,
+                style=style
+            )
+            self._save_enhancement(history, result, idempotency_key)
+            return result
+
+        return self._coalesce(history, model, style, enhance)
+
+    def enhance_history_variants(
+        self,
+        user,
+        history,
+        model: str,
+        styles: List[str]
+    ) -> Dict[str, Any]:
+        """
+        Enhance a history item in several styles with one provider call
+
+        The first style that comes back becomes optimized_prompt; all of
+        them are stored in history.variants. Each style is priced and
+        cached like a single enhancement, and only produced styles are
+        charged.
+
+        Returns:
+            Dict with variants ({style: text}), missing_styles, optimized_prompt,
+            model, tokens, credits_spent, cached
+        """
+        def enhance():
+            result = self.enhance_prompt_variants(user=user, history=history, model=model, styles=styles)
+            self._save_enhancement(history, result, variants=result['variants'])
+            return result
+
+        return self._coalesce(history, model, 'variants:' + ','.join(styles), enhance)
+
+    def _coalesce(self, history, model: str, style_key: str, enhance):
+        """Run `enhance` once for concurrent identical calls (see singleflight.py)"""
+        result, shared = self.single_flight.run(flight_key(history.id, model, style_key), enhance)
+        return self._coalesced(history, model, result) if shared else result
+
+    def _coalesced(self, history, model: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """What a caller gets when a concurrent identical call did the work"""
+        COALESCED_ENHANCEMENTS.inc(model=model)
+        history.refresh_from_db()
+        return {**result, 'credits_spent': Decimal('0.00'), 'cached': True, 'coalesced': True}
+
+    def enhance_prompt_variants(
+        self,
+        user,
+        history,
+        model: str,
+        styles: List[str]
+    ) -> Dict[str, Any]:
+        """
+        Multi-style variant of enhance_prompt (not persisted)
+        Cached styles are reused; the rest share one structured completion.
+        """
+        with stage('price'):
+            priced = {style: self._price(history.original_prompt, model, style) for style in styles}
+        credits_required = sum((credits for credits, _, _ in priced.values()), Decimal('0.00'))
+
+        reservation = None
+        if credits_required:
+            with stage('reserve'):
+                reservation = self.ledger.reserve(user, credits_required, history=history, model=model)
+
+        try:
+            with stage('generate'):
+                generated = self._generate_variants(history.original_prompt, model, priced)
+        except Exception:
+            if reservation is not None:
+                self.ledger.refund(reservation)
+            raise
+
+        served = generated['model']
+        credits_spent = Decimal('0.00')
+        for style in generated['variants']:
+            credits = priced[style][0]
+            if served != model:
+                credits = min(credits, self.CREDIT_COSTS.get(served, credits))
+            credits_spent += credits
+
+        if reservation is not None:
+            with stage('commit'):
+                self.ledger.commit(reservation, amount=credits_spent)
+
+        variants = {style: generated['variants'][style] for style in styles if style in generated['variants']}
         return {
-            'optimized_prompt': result['text'],
-            'model': model,
-            'tokens': result['tokens'],
-            'credits_spent': credits_required,
+            'optimized_prompt': next(iter(variants.values())),
+            'variants': variants,
+            'missing_styles': [style for style in styles if style not in variants],
+            'model': served,
+            'tokens': generated['tokens'],
+            'credits_spent': credits_spent,
+            'cached': generated['cached'],
         }
 
-    def _enhance_with_openai(self, prompt: str, model: str) -> Dict[str, Any]:
-        """Enhance using OpenAI API"""
-        client = openai.OpenAI(api_key=getattr(settings, 'OPENAI_API_KEY', ''))
-
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a prompt engineering expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500,
-        )
+    def _generate_variants(self, original_prompt: str, model: str, priced) -> Dict[str, Any]:
+        """Cached styles plus one provider call for the rest"""
+        variants = {
+            style: cached['text']
+            for style, (_, _, cached) in priced.items()
+            if cached is not None
+        }
+        missing = [style for style in priced if style not in variants]
+        if not missing:
+            return {'variants': variants, 'tokens': 0, 'model': model, 'cached': True}
 
+        if len(missing) == 1:
+            # One style left: the plain prompt is cheaper than a structured one
+            result = self._call_model(original_prompt, model, missing[0])
+            generated = {missing[0]: result['text']}
+        else:
+            result = self._call_variants(original_prompt, model, missing)
+            generated = result['variants']
+
+        served = result.get('model', model)
+        if not self._is_local(served):
+            for style, text in generated.items():
+                self.cache.set(priced[style][1], {'text': text, 'tokens': 0, 'model': served})
+
+        variants.update(generated)
+        return {'variants': variants, 'tokens': result['tokens'], 'model': served, 'cached': False}
+
+    def _call_variants(self, original_prompt: str, model: str, styles: List[str]) -> Dict[str, Any]:
+        """
+        Ask for every style in one completion
+        Returns {'variants': {style: text}, 'tokens': ..., 'model': served}
+        """
+        if self._is_local(model):
+            return self._enhance_variants_locally(original_prompt, model, styles)
+
+        variants_prompt = self._build_variants_prompt(original_prompt, styles)
+        max_tokens = self.VARIANT_MAX_TOKENS * len(styles)
+
+        def run(served):
+            # A failover group may route to a local model: one rule pass per style
+            if self._is_local(served):
+                return self._enhance_variants_locally(original_prompt, served, styles)
+            return self._dispatch(variants_prompt, served, max_tokens=max_tokens)
+
+        try:
+            result = self.scheduler.call(model, run)
+        except ProviderUnavailableError:
+            fallback = self._local_fallback_model()
+            if not fallback:
+                raise
+            return self._enhance_variants_locally(original_prompt, fallback, styles)
+
+        if 'variants' in result:
+            return result
         return {
-            'text': response.choices[0].message.content.strip(),
-            'tokens': response.usage.total_tokens,
+            'variants': self._parse_variants(result['text'], styles),
+            'tokens': result['tokens'],
+            'model': result['model'],
         }
 
-    def _enhance_with_anthropic(self, prompt: str, model: str) -> Dict[str, Any]:
-        """Enhance using Anthropic API"""
-        import anthropic
+    def _enhance_variants_locally(self, original_prompt: str, model: str, styles: List[str]) -> Dict[str, Any]:
+        variants = {style: self._enhance_locally(original_prompt, model, style)['text'] for style in styles}
+        return {'variants': variants, 'tokens': 0, 'model': model}
 
-        client = anthropic.Anthropic(
-            api_key=getattr(settings, 'ANTHROPIC_API_KEY', '')
+    def _build_variants_prompt(self, original_prompt: str, styles: List[str]) -> str:
+        """One instruction per style, answered as a single JSON object"""
+        instructions = '\n'.join(
+            f'- "{style}": {self.STYLE_TEMPLATES.get(style, self.STYLE_TEMPLATES["balanced"])}'
+            for style in styles
         )
+        keys = ', '.join(f'"{style}"' for style in styles)
+        return f"""
+Rewrite the prompt below once for each style:
+{instructions}
 
-        response = client.messages.create(
-            model=model,
-            max_tokens=500,
-            temperature=0.7,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+Original Prompt:
+{original_prompt}
+
+Respond with only a JSON object with the keys {keys}, each mapped to the enhanced prompt as a string, no explanations:
+"""
 
-        tokens = response.usage.input_tokens + response.usage.output_tokens
+    @staticmethod
+    def _parse_variants(text: str, styles: List[str]) -> Dict[str, str]:
+        """Pull {style: text} out of the completion, tolerating code fences and chatter"""
+        start, end = text.find('{'), text.rfind('}')
+        try:
+            data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise VariantParseError("Model did not return a JSON object of variants")
 
-        return {
-            'text': response.content[0].text.strip(),
-            'tokens': tokens,
+        variants = {
+            style: data[style].strip()
+            for style in styles
+            if isinstance(data.get(style), str) and data[style].strip()
         }
+        if not variants:
+            raise VariantParseError("Model returned none of the requested styles")
+        return variants
+
+    def enhance_history_stream(
+        self,
+        user,
+        history,
+        model: str,
+        style: str = 'balanced'
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of enhance_history
+        The final text is persisted once the stream completes. It coalesces
+        with enhance_history: a caller that finds an identical stream or
+        enhance in flight waits for it and gets the result as one delta.
+        """
+        with self.single_flight.lead(flight_key(history.id, model, style)) as flight:
+            if not flight.leader:
+                result = self._coalesced(history, model, flight.result)
+                yield {'type': 'delta', 'text': result['optimized_prompt']}
+                yield {'type': 'done', 'result': result}
+                return
+
+            for event in self.enhance_prompt_stream(user=user, history=history, model=model, style=style):
+                if event['type'] == 'done':
+                    self._save_enhancement(history, event['result'])
+                    flight.result = event['result']
+                yield event
+
+    def _save_enhancement(self, history, result: Dict[str, Any], idempotency_key: str = None, variants=None):
+        """Persist an enhancement result (and any style variants) on the history item"""
+        # Update history with enhancement
+        meta = history.meta.copy()
+        if idempotency_key:
+            meta['enhance_idempotency_key'] = idempotency_key
+        meta['enhance_cached'] = result.get('cached', False)
+
+        update_fields = ['meta', 'updated_at']
+        if variants:
+            enhanced_at = timezone.now().isoformat()
+            history.variants = {
+                **(history.variants or {}),
+                **{
+                    style: {'text': text, 'model': result['model'], 'enhanced_at': enhanced_at}
+                    for style, text in variants.items()
+                },
+            }
+            update_fields.append('variants')
+
+        before = usage_of(history)
+        with stage('mark_enhanced'):
+            history.mark_enhanced(
+                optimized_prompt=result['optimized_prompt'],
+                model=result['model'],
+                tokens=result['tokens'],
+                credits_spent=result['credits_spent']
+            )
+        with stage('meta_save'):
+            history.meta = meta
+            history.save(update_fields=update_fields)
+        with stage('rollup'):
+            record_change(before, usage_of(history))
+
+    def _enhance_with_openai(self, prompt: str, model: str, stream: bool = False, max_tokens: int = 500):
+        """Enhance using OpenAI API"""
+        provider = self.providers.get('openai')
+        if stream:
+            return provider.stream(prompt, model, max_tokens=max_tokens)
+        return provider.complete(prompt, model, max_tokens=max_tokens)
+
+    def _enhance_with_anthropic(self, prompt: str, model: str, stream: bool = False, max_tokens: int = 500):
+        """Enhance using Anthropic API"""
+        provider = self.providers.get('anthropic')
+        if stream:
+            return provider.stream(prompt, model, max_tokens=max_tokens)
+        return provider.complete(prompt, model, max_tokens=max_tokens)
 
     def _get_user_credits(self, user) -> Decimal:
         """Get user's current credit balance"""
-        # This should integrate with your billing system
-        # For now, return a mock value or query from user profile
-        if hasattr(user, 'credits'):
-            return Decimal(str(user.credits))
-
-        # Mock credits for development
-        return Decimal('100.00')
-
-    def _deduct_credits(self, user, amount: Decimal):
-        """Deduct credits from user's account"""
-        # This should integrate with your billing system
-        # For now, just update the user profile
-        if hasattr(user, 'credits'):
-            user.credits = Decimal(str(user.credits)) - amount
-            user.save(update_fields=['credits'])
-
-        # TODO: Create a transaction record in billing system
+        return self.ledger.get_balance(user)
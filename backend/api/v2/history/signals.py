@@ -0,0 +1,71 @@
+"""
+Prompt History v2 Signals
+Keeps derived indexes in sync with PromptHistory writes
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import PromptHistory
+from .search import get_search_backend
+from .tags import sync_tags
+from .rollups import record_change, usage_of
+from .versions import bump_version
+from .similarity import get_vector_store, is_available as similarity_available
+
+# Fields whose changes require reindexing the search document
+SEARCH_FIELDS = {'original_prompt', 'optimized_prompt', 'tags', 'is_deleted'}
+
+# Fields whose changes require resyncing the tag index
+TAG_FIELDS = {'tags', 'is_deleted'}
+
+
+@receiver(post_save, sender=PromptHistory, dispatch_uid='history_search_index')
+def update_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """Reindex on create, update, enhance and soft delete"""
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+
+    backend = get_search_backend()
+    if instance.is_deleted:
+        backend.remove([instance.pk])
+    else:
+        backend.index(instance)
+
+
+@receiver(post_save, sender=PromptHistory, dispatch_uid='history_tag_index')
+def update_tag_index(sender, instance, created, update_fields=None, **kwargs):
+    """Mirror PromptHistory.tags into PromptTag"""
+    if update_fields is not None and not TAG_FIELDS.intersection(update_fields):
+        return
+    if created and not instance.tags:
+        return
+    sync_tags(instance)
+
+
+@receiver(post_save, sender=PromptHistory, dispatch_uid='history_usage_rollup')
+def update_usage_rollup(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Count new rows and drop soft-deleted ones from the usage rollup
+    Enhancements and category edits are recorded where the old values are known
+    """
+    if created:
+        record_change(None, usage_of(instance))
+    elif update_fields is not None and 'is_deleted' in update_fields and instance.is_deleted:
+        record_change(usage_of(instance, include_deleted=True), None)
+
+
+@receiver(post_save, sender=PromptHistory, dispatch_uid='history_change_version')
+def update_change_version(sender, instance, **kwargs):
+    """Every write (create, update, enhance, soft delete) invalidates ETags"""
+    bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=PromptHistory, dispatch_uid='history_prompt_vector')
+def update_prompt_vector(sender, instance, created, update_fields=None, **kwargs):
+    """Vectorize new prompts for similar-prompt search; drop soft-deleted ones"""
+    if not similarity_available():
+        return
+    if created:
+        get_vector_store().add([instance])
+    elif update_fields is not None and 'is_deleted' in update_fields and instance.is_deleted:
+        get_vector_store().remove([instance.pk])
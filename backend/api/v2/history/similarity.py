@@ -0,0 +1,266 @@
+"""
+Similar Prompt Search
+Local hashed n-gram vectors searched with cosine similarity; no external service
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+from django.conf import settings
+
+from .cache import normalize_prompt
+from .models import PromptVector
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # numpy not installed; similarity features are disabled
+    HAS_NUMPY = False
+
+# Override with settings.HISTORY_SIMILARITY
+DEFAULT_SIMILARITY_CONFIG = {
+    'enabled': True,
+    'dim': 256,                       # vector width; changing it needs rebuild_prompt_vectors
+    'max_chars': 4000,                # prompt prefix that is vectorized
+    'near_duplicate_threshold': 0.9,
+    'near_duplicate_window': 5000,    # newest rows compared on create; older ones are skipped
+    'cached_users': 256,              # per-user matrices kept in memory (LRU)
+    'max_bytes': 256 * 1024 * 1024,   # memory budget across cached matrices (LRU evicts past it)
+    'max_rows_per_user': 50000,       # newest vectors kept per user; older prompts aren't searched
+    'reload_after': 600,              # seconds before a cached matrix is rebuilt from scratch
+}
+
+
+def get_similarity_config():
+    return {**DEFAULT_SIMILARITY_CONFIG, **getattr(settings, 'HISTORY_SIMILARITY', {})}
+
+
+def is_available() -> bool:
+    return HAS_NUMPY and get_similarity_config()['enabled']
+
+
+def _grams(text: str, max_chars: int) -> List[str]:
+    """Word unigrams plus character trigrams of the normalized prompt"""
+    text = normalize_prompt(text).lower()[:max_chars]
+    words = text.split()
+    padded = f" {text} "
+    return words + [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def vectorize(text: str, config=None):
+    """
+    Signed feature hashing into `dim` buckets, L2-normalized float32
+    crc32 is stable across processes (unlike hash()), so stored vectors stay valid
+    """
+    config = config or get_similarity_config()
+    dim = config['dim']
+    vector = np.zeros(dim, dtype=np.float32)
+    grams = _grams(text, config['max_chars'])
+    if not grams:
+        return vector
+
+    hashes = np.fromiter(
+        (zlib.crc32(gram.encode('utf-8')) for gram in grams),
+        dtype=np.uint32,
+        count=len(grams)
+    )
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % dim, signs)
+
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class UserVectorIndex:
+    """
+    One user's newest `max_rows` vectors as a contiguous float32 matrix
+    Grows by doubling; new rows are pulled incrementally by PromptVector id.
+    """
+
+    def __init__(self, user_id, dim: int, max_rows: int = None):
+        self.user_id = user_id
+        self.dim = dim
+        self.max_rows = max_rows
+        self.history_ids = []
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+        self.last_vector_id = 0
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _append(self, history_ids, vectors):
+        needed = self._size + len(history_ids)
+        if needed > len(self._matrix):
+            capacity = max(needed, 2 * len(self._matrix), 64)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = vectors
+        self._size = needed
+        self.history_ids.extend(history_ids)
+
+    def _trim(self):
+        """
+        Drop the oldest rows once past max_rows; the slack keeps a user who
+        is adding prompts from paying for a copy on every refresh
+        """
+        if not self.max_rows or self._size <= self.max_rows + max(self.max_rows // 4, 64):
+            return
+        drop = self._size - self.max_rows
+        self._matrix = self._matrix[drop:self._size].copy()
+        self._size = self.max_rows
+        self.history_ids = self.history_ids[drop:]
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes
+
+    def _skip_to_newest(self):
+        """On first load, start after everything but the newest max_rows vectors"""
+        if not self.max_rows:
+            return
+        cutoff = (
+            PromptVector.objects.filter(user_id=self.user_id)
+            .order_by('-id')
+            .values_list('id', flat=True)[self.max_rows:self.max_rows + 1]
+        )
+        for vector_id in cutoff:
+            self.last_vector_id = vector_id
+
+    def refresh(self, chunk_size: int = 2000):
+        """Load vectors stored since the last refresh (one indexed range scan)"""
+        if not self.last_vector_id and not self._size:
+            self._skip_to_newest()
+        rows = (
+            PromptVector.objects.filter(user_id=self.user_id, id__gt=self.last_vector_id)
+            .order_by('id')
+            .values_list('id', 'history_id', 'vector')
+            .iterator(chunk_size=chunk_size)
+        )
+        width = self.dim * 4
+        batch = []
+        for vector_id, history_id, vector in rows:
+            self.last_vector_id = vector_id
+            if len(vector) != width:
+                continue  # stored with another dim; rebuild_prompt_vectors fixes it
+            batch.append((history_id, bytes(vector)))
+            if len(batch) >= chunk_size:
+                self._append_rows(batch)
+                batch = []
+        if batch:
+            self._append_rows(batch)
+        self._trim()
+
+    def _append_rows(self, batch):
+        vectors = np.frombuffer(b''.join(vector for _, vector in batch), dtype=np.float32)
+        self._append([history_id for history_id, _ in batch], vectors.reshape(len(batch), self.dim))
+
+    def search(self, query, limit: int, exclude=(), window: int = None) -> List[Tuple[object, float]]:
+        """Top `limit` (history_id, cosine) pairs, best first; `window` limits it to the newest rows"""
+        start = max(0, self._size - window) if window else 0
+        if self._size <= start:
+            return []
+        scores = self._matrix[start:self._size] @ query
+        want = min(limit + len(exclude), len(scores))
+        top = np.argpartition(-scores, want - 1)[:want]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for index in top:
+            history_id = self.history_ids[start + index]
+            if history_id in exclude:
+                continue
+            results.append((history_id, float(scores[index])))
+            if len(results) >= limit:
+                break
+        return results
+
+
+class VectorStore:
+    """Process-wide LRU of per-user vector matrices, bounded by count and total bytes"""
+
+    def __init__(self, config=None):
+        self.config = config or get_similarity_config()
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_for(self, user_id) -> UserVectorIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            stale = index is not None and time.monotonic() - index.loaded_at > self.config['reload_after']
+            if index is None or stale:
+                # Periodic full reload drops vectors of deleted rows
+                index = UserVectorIndex(user_id, self.config['dim'], self.config['max_rows_per_user'])
+                self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            self._evict()
+        return index
+
+    def _evict(self):
+        """Drop least recently used matrices past the count or byte budget (call under _lock)"""
+        total = sum(index.nbytes for index in self._indexes.values())
+        while len(self._indexes) > 1 and (
+            len(self._indexes) > self.config['cached_users'] or total > self.config['max_bytes']
+        ):
+            _, evicted = self._indexes.popitem(last=False)
+            total -= evicted.nbytes
+
+    def add(self, histories: Iterable):
+        """Vectorize and store new rows; cached matrices pick them up on refresh"""
+        PromptVector.objects.bulk_create([
+            PromptVector(
+                user_id=history.user_id,
+                history_id=history.id,
+                vector=vectorize(history.original_prompt, self.config).tobytes()
+            )
+            for history in histories
+        ], ignore_conflicts=True)
+
+    def remove(self, history_ids):
+        PromptVector.objects.filter(history_id__in=history_ids).delete()
+
+    def similar(self, user_id, text: str = None, vector=None, limit: int = 10, exclude=(), window: int = None):
+        """(history_id, score) pairs most similar to `text` (or `vector`)"""
+        if vector is None:
+            vector = vectorize(text, self.config)
+        index = self._index_for(user_id)
+        with index.lock:
+            index.refresh()
+            results = index.search(vector, limit, exclude=set(exclude), window=window)
+        # The refresh may have grown the matrix past the byte budget
+        with self._lock:
+            self._evict()
+        return results
+
+    def near_duplicates(self, history, limit: int = 3):
+        """
+        Earlier rows whose prompt is nearly identical to `history`'s
+        Runs on every create, so only the newest rows are compared
+        """
+        threshold = self.config['near_duplicate_threshold']
+        matches = self.similar(
+            history.user_id, history.original_prompt, limit=limit, exclude={history.id},
+            window=self.config['near_duplicate_window']
+        )
+        return [(history_id, score) for history_id, score in matches if score >= threshold]
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """Return the process-wide vector store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = VectorStore()
+    return _store
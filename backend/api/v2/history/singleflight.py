@@ -0,0 +1,196 @@
+"""
+Single-Flight Enhancement
+Coalesces concurrent identical enhance calls onto one provider call and one debit
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Tuple
+
+from django.conf import settings
+
+
+# Override with settings.HISTORY_SINGLE_FLIGHT
+DEFAULT_SINGLE_FLIGHT_CONFIG = {
+    'enabled': True,
+    # Django cache alias used for the cross-process lock; None = this
+    # process only. It coalesces across gunicorn workers only if the cache
+    # is shared and has an atomic add() (Redis, Memcached, database cache);
+    # with the per-process LocMemCache it degrades to per-process coalescing.
+    'cache_alias': 'default',
+    'lock_ttl': 120,       # seconds; bounds a crashed leader's lock
+    'result_ttl': 30,      # how long waiters in other processes can pick up the result
+    'wait_timeout': 90,    # give up waiting on another process and run ourselves
+    'poll_interval': 0.1,
+}
+
+KEY_PREFIX = 'history:flight:'
+
+
+def flight_key(history_id, model: str, style: str) -> str:
+    return f"{history_id}:{model}:{style}"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class Flight:
+    """
+    One caller's part in a flight (see SingleFlight.lead)
+    The leader does the work and sets `result`; a follower finds it set.
+    """
+
+    def __init__(self):
+        self.leader = False
+        self.result = None
+
+
+class SingleFlight:
+    """
+    Runs fn once per key no matter how many callers ask concurrently
+
+    Callers in this process wait on the leader's call. With a shared
+    cache, leaders in different processes also serialize on a cache lock
+    and later ones take the first one's result instead of calling again.
+    """
+
+    def __init__(self, **config):
+        self.config = {**DEFAULT_SINGLE_FLIGHT_CONFIG, **config}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        alias = self.config['cache_alias']
+        if not alias:
+            return None
+        from django.core.cache import caches
+        return caches[alias]
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared); shared is True when another caller did
+        the work. The leader's exception is re-raised to every waiter.
+        """
+        with self.lead(key) as flight:
+            if flight.leader:
+                flight.result = fn()
+            return flight.result, not flight.leader
+
+    @contextmanager
+    def lead(self, key: str) -> Iterator[Flight]:
+        """
+        Context-manager form of run() for work that isn't a single call,
+        such as a stream the caller relays as it arrives. Yields a Flight:
+        the leader must set flight.result before leaving the block. A
+        leader that leaves without a result or an exception (the client
+        went away) abandons the flight, and its waiters compete again.
+        """
+        flight = Flight()
+        if not self.config['enabled']:
+            flight.leader = True
+            yield flight
+            return
+
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            call.done.wait()
+            if call.abandoned:
+                continue
+            if call.error is not None:
+                raise call.error
+            flight.result = call.result
+            yield flight
+            return
+
+        try:
+            with self._exclusive(key, flight):
+                yield flight
+            call.result = flight.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # Exited mid-flight (client went away): hand on the result if
+            # it was already produced, otherwise let the waiters retry
+            if flight.result is None:
+                call.abandoned = True
+            else:
+                call.result = flight.result
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    @contextmanager
+    def _exclusive(self, key: str, flight: Flight):
+        """Cross-process leg: hold the cache lock while the leader works"""
+        cache = self.shared
+        if cache is None:
+            flight.leader = True
+            yield
+            return
+
+        lock_key = f"{KEY_PREFIX}lock:{key}"
+        result_key = f"{KEY_PREFIX}result:{key}"
+        deadline = time.monotonic() + self.config['wait_timeout']
+
+        while True:
+            token = uuid.uuid4().hex
+            if cache.add(lock_key, token, self.config['lock_ttl']):
+                try:
+                    # Never hand out a result left by an earlier flight
+                    cache.delete(result_key)
+                    flight.leader = True
+                    try:
+                        yield
+                    finally:
+                        if flight.result is not None:
+                            cache.set(result_key, flight.result, self.config['result_ttl'])
+                    return
+                finally:
+                    if cache.get(lock_key) == token:
+                        cache.delete(lock_key)
+
+            # Another process is running this flight; wait for it to land
+            while cache.get(lock_key) is not None and time.monotonic() < deadline:
+                time.sleep(self.config['poll_interval'])
+
+            result = cache.get(result_key)
+            if result is not None:
+                flight.result = result
+                yield
+                return
+            if time.monotonic() >= deadline:
+                # Stuck or very slow leader: don't hold the client forever
+                flight.leader = True
+                yield
+                return
+            # The other leader failed; compete for the lock again
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight group"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(**getattr(settings, 'HISTORY_SINGLE_FLIGHT', {}))
+    return _single_flight
@@ -0,0 +1,108 @@
+"""
+Prompt Text Storage
+Codecs and the model field that lets PromptHistory keep its text in a
+shared, content-addressed PromptBlob instead of inline
+"""
+import hashlib
+import zlib
+from typing import Any, Dict, Tuple
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:  # zstandard not installed; zlib is always available
+    HAS_ZSTD = False
+
+CODEC_RAW = 'raw'
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+# Override with settings.HISTORY_BLOB_STORE
+DEFAULT_BLOB_CONFIG = {
+    'enabled': False,
+    'min_size': 512,           # texts shorter than this stay inline
+    'compress_min_size': 2048,  # blobs at least this long are compressed
+    'codec': CODEC_ZLIB,       # or 'zstd' when zstandard is installed
+    'level': 6,
+}
+
+
+def get_blob_config() -> Dict[str, Any]:
+    return {**DEFAULT_BLOB_CONFIG, **getattr(settings, 'HISTORY_BLOB_STORE', {})}
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode_text(text: str, config: Dict[str, Any] = None) -> Tuple[str, bytes]:
+    """Return (codec, data) for a blob"""
+    config = config or get_blob_config()
+    raw = text.encode('utf-8')
+    if len(raw) < config['compress_min_size']:
+        return CODEC_RAW, raw
+    if config['codec'] == CODEC_ZSTD and HAS_ZSTD:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=config['level']).compress(raw)
+    return CODEC_ZLIB, zlib.compress(raw, config['level'])
+
+
+def decode_text(codec: str, data) -> str:
+    data = bytes(data)
+    if codec == CODEC_RAW:
+        return data.decode('utf-8')
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data).decode('utf-8')
+    if codec == CODEC_ZSTD:
+        if not HAS_ZSTD:
+            raise RuntimeError("zstandard is required to read zstd-compressed prompt blobs")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    raise ValueError(f"Unknown blob codec: {codec}")
+
+
+class BlobTextAttribute(DeferredAttribute):
+    """
+    Reads the text from the linked blob when the inline column is empty
+    The decoded text is cached on the instance like any loaded field.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if value == '':
+            blob_id = getattr(instance, self.field.blob_attname)
+            if blob_id:
+                value = getattr(instance, self.field.blob_field).text
+                instance.__dict__[self.field.attname] = value
+        return value
+
+
+class BlobTextField(models.TextField):
+    """
+    TextField whose value may live in a PromptBlob (`blob_field`)
+    While the blob is set, the inline column is written as ''.
+    """
+
+    descriptor_class = BlobTextAttribute
+
+    def __init__(self, *args, blob_field: str = None, **kwargs):
+        self.blob_field = blob_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['blob_field'] = self.blob_field
+        return name, path, args, kwargs
+
+    @property
+    def blob_attname(self) -> str:
+        return f'{self.blob_field}_id'
+
+    def pre_save(self, model_instance, add):
+        if model_instance.__dict__.get(self.blob_attname):
+            return ''
+        return super().pre_save(model_instance, add)
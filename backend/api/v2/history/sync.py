@@ -0,0 +1,95 @@
+"""
+Delta Sync
+Change feed over (updated_at, id) with tombstones for soft-deleted rows
+"""
+import base64
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PromptHistory
+from .retention import get_retention_days
+
+ZERO_ID = uuid.UUID(int=0)
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class SyncTokenExpired(Exception):
+    """Tombstones older than the token may have been purged; resync from scratch"""
+
+
+def encode_token(position) -> str:
+    updated_at, pk = position
+    raw = f"{updated_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_token(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii')
+        timestamp, pk = raw.split('|', 1)
+        updated_at = parse_datetime(timestamp)
+        if updated_at is None:
+            raise ValueError(timestamp)
+        return updated_at, uuid.UUID(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidSyncToken(token)
+
+
+def changes_since(user, token: str = None, limit: int = 500):
+    """
+    Rows changed after `token`, oldest first: (rows, next_token, has_more)
+
+    Without a token only live rows are returned (a fresh client has nothing
+    to delete). The returned token never runs ahead of now minus
+    HISTORY_SYNC_LAG seconds, so writes committed late with an earlier
+    updated_at are picked up on the next sync; clients apply changes as
+    upserts, so seeing a row twice is harmless.
+    """
+    now = timezone.now()
+    start = decode_token(token) if token else None
+
+    if start is not None and start[0] < now - timedelta(days=get_retention_days()):
+        raise SyncTokenExpired()
+
+    queryset = PromptHistory.objects.filter(user=user)
+    if start is None:
+        queryset = queryset.filter(is_deleted=False)
+    else:
+        updated_at, pk = start
+        queryset = queryset.filter(
+            Q(updated_at__gt=updated_at) |
+            Q(updated_at=updated_at, id__gt=pk)
+        )
+
+    rows = list(
+        queryset.select_related('original_blob', 'optimized_blob')
+        .order_by('updated_at', 'id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    safe = (now - timedelta(seconds=getattr(settings, 'HISTORY_SYNC_LAG', 5)), ZERO_ID)
+    position = (rows[-1].updated_at, rows[-1].id) if rows else start or safe
+    if not has_more:
+        # Caught up: move to the lag horizon (never back behind `start`), so
+        # an idle client's token keeps pace with the clock instead of aging
+        # past the retention window into SyncTokenExpired
+        position = max(start, safe) if start is not None else safe
+
+    return rows, encode_token(position), has_more
+
+
+def tombstone(history):
+    return {
+        'id': history.id,
+        'deleted': True,
+        'deleted_at': history.deleted_at,
+    }
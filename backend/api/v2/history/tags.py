@@ -0,0 +1,73 @@
+"""
+Prompt History Tag Index
+Keeps PromptTag in sync with PromptHistory.tags and answers tag queries
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import PromptTag
+
+
+def normalize_tag(tag) -> str:
+    return str(tag).strip().lower()[:64]
+
+
+def tag_names(tags):
+    """Distinct normalized names for a tags list"""
+    return {name for name in (normalize_tag(tag) for tag in (tags or [])) if name}
+
+
+def sync_tags(history):
+    """Make the index match history.tags (empty for soft-deleted rows)"""
+    wanted = set() if history.is_deleted else tag_names(history.tags)
+
+    with transaction.atomic():
+        current = set(PromptTag.objects.filter(history=history).values_list('name', flat=True))
+        stale = current - wanted
+        if stale:
+            PromptTag.objects.filter(history=history, name__in=stale).delete()
+        PromptTag.objects.bulk_create([
+            PromptTag(user_id=history.user_id, history=history, name=name)
+            for name in wanted - current
+        ], ignore_conflicts=True)
+
+
+def index_new_tags(histories):
+    """Index freshly inserted rows (bulk_create skips post_save)"""
+    PromptTag.objects.bulk_create([
+        PromptTag(user_id=history.user_id, history=history, name=name)
+        for history in histories
+        if not history.is_deleted
+        for name in tag_names(history.tags)
+    ], ignore_conflicts=True)
+
+
+def filter_by_tags(queryset, user, tags=(), prefix=None):
+    """
+    Restrict a history queryset with the tag index
+    Every tag in `tags` must match (AND); `prefix` matches any tag
+    """
+    for name in tag_names(tags):
+        queryset = queryset.filter(
+            id__in=PromptTag.objects.filter(user=user, name=name).values('history_id')
+        )
+    if prefix:
+        queryset = queryset.filter(
+            id__in=PromptTag.objects.filter(
+                user=user,
+                name__startswith=normalize_tag(prefix)
+            ).values('history_id')
+        )
+    return queryset
+
+
+def tag_facets(user, prefix=None, limit=100):
+    """Per-tag counts for a user, most used first"""
+    tags = PromptTag.objects.filter(user=user)
+    if prefix:
+        tags = tags.filter(name__startswith=normalize_tag(prefix))
+    return list(
+        tags.values('name')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'name')[:limit]
+    )
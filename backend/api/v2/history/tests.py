@@ -0,0 +1,366 @@
+"""
+Prompt History v2 Tests
+Run with: python manage.py test api.v2.history
+"""
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .credits import CreditLedger
+from .jobs import recover_jobs
+from .models import CreditReservation, EnhancementJob, IdempotencyKey, PromptHistory
+from .providers import StubProvider, StubProviderError
+from .retention import get_retention_days
+from .scheduler import CircuitBreaker, ProviderScheduler, ProviderUnavailableError, TokenBucket
+from .search import get_search_backend
+from .sync import ZERO_ID, changes_since, decode_token, encode_token
+from .views import PromptHistoryViewSet
+
+
+class BulkIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='bulk-user', password='x')
+        self.factory = APIRequestFactory()
+        self.view = PromptHistoryViewSet.as_view({'post': 'bulk'})
+
+    def _bulk(self, items):
+        request = self.factory.post('/api/v2/history/bulk/', {'items': items}, format='json')
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_repeated_key_returns_existing_item(self):
+        first = self._bulk([{'original_prompt': 'hello', 'idempotency_key': 'k1'}])
+        second = self._bulk([{'original_prompt': 'hello', 'idempotency_key': 'k1'}])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['results'][0]['status'], 'existing')
+        self.assertEqual(second.data['results'][0]['id'], first.data['results'][0]['id'])
+        self.assertEqual(PromptHistory.objects.filter(user=self.user).count(), 1)
+
+    def test_expired_unpurged_key_is_replaced(self):
+        first = self._bulk([{'original_prompt': 'hello', 'idempotency_key': 'k9'}])
+        IdempotencyKey.objects.filter(user=self.user, key='k9').update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        second = self._bulk([{'original_prompt': 'hello', 'idempotency_key': 'k9'}])
+
+        self.assertEqual(second.status_code, 200)
+        result = second.data['results'][0]
+        self.assertEqual(result['status'], 'created')
+        self.assertNotEqual(result['id'], first.data['results'][0]['id'])
+
+        key = IdempotencyKey.objects.get(user=self.user, scope=IdempotencyKey.SCOPE_CREATE, key='k9')
+        self.assertEqual(key.history_id, result['id'])
+        self.assertGreater(key.expires_at, timezone.now())
+
+
+class ImportIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='import-user', password='x')
+        self.factory = APIRequestFactory()
+        self.view = PromptHistoryViewSet.as_view({'post': 'import_history'})
+        self.body = '\n'.join(
+            json.dumps({'id': f'00000000-0000-0000-0000-00000000000{n}', 'original_prompt': f'prompt {n}'})
+            for n in range(3)
+        ) + '\n'
+
+    def _import(self):
+        request = self.factory.post('/api/v2/history/import/', self.body, content_type='application/x-ndjson')
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_reimport_after_create_ttl_is_deduplicated(self):
+        first = self._import()
+        self.assertEqual(first.data['created'], 3)
+
+        # Import keys don't share the create TTL: still live long after it
+        keys = IdempotencyKey.objects.filter(user=self.user, scope=IdempotencyKey.SCOPE_IMPORT)
+        self.assertEqual(keys.count(), 3)
+        self.assertFalse(keys.filter(expires_at__lte=timezone.now() + timedelta(days=365)).exists())
+
+        with self.settings(HISTORY_IDEMPOTENCY_TTL=0):
+            second = self._import()
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['existing'], 3)
+        self.assertEqual(second.data['created'], 0)
+        self.assertEqual(PromptHistory.objects.filter(user=self.user).count(), 3)
+
+
+class SearchFilterTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='search-user', password='x')
+
+    def test_result_cap_applies_after_filters(self):
+        for _ in range(2):
+            PromptHistory.objects.create(user=self.user, original_prompt='refactor parser', intent_category='other')
+        wanted = PromptHistory.objects.create(
+            user=self.user, original_prompt='refactor parser code', intent_category='code'
+        )
+        queryset = PromptHistory.objects.filter(user=self.user, is_deleted=False, intent_category='code')
+
+        with self.settings(HISTORY_SEARCH_MAX_RESULTS=1):
+            results = get_search_backend().search(queryset, 'refactor', user_id=self.user.pk)
+
+        self.assertEqual(list(results.values_list('id', flat=True)), [wanted.id])
+
+
+class SyncTokenTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='sync-user', password='x')
+
+    def _age(self, history, days):
+        PromptHistory.objects.filter(pk=history.pk).update(updated_at=timezone.now() - timedelta(days=days))
+
+    def test_idle_token_advances(self):
+        self._age(PromptHistory.objects.create(user=self.user, original_prompt='old'), days=1)
+        idle = encode_token((timezone.now() - timedelta(days=1), ZERO_ID))
+
+        rows, token, has_more = changes_since(self.user, idle)
+
+        self.assertEqual((rows, has_more), ([], False))
+        self.assertGreater(decode_token(token)[0], timezone.now() - timedelta(minutes=1))
+
+    def test_history_older_than_retention_gets_a_live_token(self):
+        history = PromptHistory.objects.create(user=self.user, original_prompt='ancient')
+        self._age(history, days=get_retention_days() + 10)
+
+        rows, token, has_more = changes_since(self.user)
+        self.assertEqual([row.id for row in rows], [history.id])
+        self.assertFalse(has_more)
+
+        # The token must not already be expired
+        rows, token, has_more = changes_since(self.user, token)
+        self.assertEqual(rows, [])
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_throttled(self):
+        bucket = TokenBucket(rate=1.0, burst=2)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertGreater(bucket.try_acquire(), 0.0)
+        self.assertFalse(bucket.acquire(timeout=0))
+
+    def test_refills_at_rate(self):
+        bucket = TokenBucket(rate=1000.0, burst=1)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=0.5))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 0)
+
+    def test_half_open_admits_one_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens_and_released_probe_retries(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        breaker.release_probe()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class ProviderSchedulerTests(SimpleTestCase):
+    """Drives the scheduler with local stub providers, one per model"""
+
+    LIMITS = {'rate': 1000.0, 'burst': 1000, 'concurrency': 4, 'acquire_timeout': 0.5,
+              'failure_threshold': 2, 'recovery_timeout': 30.0}
+
+    def _scheduler(self, groups=(), failover=True, **limits):
+        return ProviderScheduler(
+            limits={'default': {**self.LIMITS, **limits}},
+            failover_groups=[list(group) for group in groups],
+            failover=failover,
+        )
+
+    def _call(self, scheduler, model, providers):
+        return scheduler.call(model, lambda served: providers[served].complete('hello', served))
+
+    def test_retryable_error_fails_over(self):
+        scheduler = self._scheduler(groups=[('stub-a', 'stub-b')])
+        providers = {'stub-a': StubProvider(error_rate=1, error_status=503), 'stub-b': StubProvider()}
+
+        result = self._call(scheduler, 'stub-a', providers)
+
+        self.assertEqual(result['model'], 'stub-b')
+        self.assertEqual(scheduler.lane('stub-a').stats['failures'], 1)
+        self.assertEqual(scheduler.lane('stub-b').stats['successes'], 1)
+
+    def test_client_error_is_raised_and_neutral(self):
+        scheduler = self._scheduler(groups=[('stub-a', 'stub-b')], failure_threshold=1)
+        providers = {'stub-a': StubProvider(error_rate=1, error_status=400), 'stub-b': StubProvider()}
+
+        with self.assertRaises(StubProviderError):
+            self._call(scheduler, 'stub-a', providers)
+
+        lane = scheduler.lane('stub-a')
+        self.assertEqual(lane.stats['client_errors'], 1)
+        self.assertEqual(lane.stats['failures'], 0)
+        self.assertEqual(lane.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(scheduler.lane('stub-b').stats['calls'], 0)
+
+    def test_open_breaker_is_unavailable_with_retry_after(self):
+        scheduler = self._scheduler(failover=False)
+        providers = {'stub-a': StubProvider(error_rate=1, error_status=429)}
+
+        for _ in range(2):
+            with self.assertRaises(ProviderUnavailableError):
+                self._call(scheduler, 'stub-a', providers)
+        with self.assertRaises(ProviderUnavailableError) as raised:
+            self._call(scheduler, 'stub-a', providers)
+
+        self.assertEqual(scheduler.lane('stub-a').breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(scheduler.lane('stub-a').stats['rejected'], 1)
+        self.assertGreater(raised.exception.retry_after, 0)
+
+        response = PromptHistoryViewSet()._provider_unavailable_response(raised.exception)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(int(response['Retry-After']), int(raised.exception.retry_after) + 1)
+
+    def test_rate_limited_call_is_throttled(self):
+        scheduler = self._scheduler(failover=False, rate=0.001, burst=1, acquire_timeout=0)
+        providers = {'stub-a': StubProvider()}
+
+        self._call(scheduler, 'stub-a', providers)
+        with self.assertRaises(ProviderUnavailableError):
+            self._call(scheduler, 'stub-a', providers)
+        self.assertEqual(scheduler.lane('stub-a').stats['throttled'], 1)
+
+    def test_failover_prefers_the_faster_model(self):
+        scheduler = self._scheduler(groups=[('stub-a', 'stub-b', 'stub-c')])
+        providers = {
+            'stub-a': StubProvider(),
+            'stub-b': StubProvider(latency_ms=30),
+            'stub-c': StubProvider(),
+        }
+        for model in providers:
+            self._call(scheduler, model, providers)
+
+        self.assertEqual(scheduler.candidates('stub-a'), ['stub-a', 'stub-c', 'stub-b'])
+
+    def test_stream_open_error_frees_the_slot(self):
+        scheduler = self._scheduler(failover=False, concurrency=1)
+
+        def open_fn(served):
+            raise ValueError(f"Unsupported model: {served}")
+
+        with self.assertRaises(ValueError):
+            list(scheduler.stream('stub-a', open_fn))
+        self.assertEqual(scheduler.lane('stub-a').in_flight, 0)
+
+        events = list(scheduler.stream('stub-a', lambda served: StubProvider().stream('hello', served)))
+        self.assertEqual(events[-1]['model'], 'stub-a')
+
+    def test_stream_disconnect_is_neutral(self):
+        scheduler = self._scheduler(failover=False)
+        events = scheduler.stream('stub-a', lambda served: StubProvider().stream('one two three', served))
+
+        next(events)
+        events.close()
+
+        lane = scheduler.lane('stub-a')
+        self.assertEqual(lane.in_flight, 0)
+        self.assertEqual(lane.stats['successes'], 0)
+        self.assertEqual(lane.stats['client_errors'], 1)
+
+
+class ReservationExpiryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='reserve-user', password='x')
+        self.history = PromptHistory.objects.create(user=self.user, original_prompt='hello')
+        self.ledger = CreditLedger()
+        self.ledger.grant(self.user, Decimal('10.00'))
+
+    def test_running_job_reservation_is_left_to_job_recovery(self):
+        job = EnhancementJob.objects.create(
+            user=self.user, history=self.history, model='gpt-4o-mini',
+            status=EnhancementJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+        reservation = self.ledger.reserve(self.user, Decimal('1.00'), history=self.history, model='gpt-4o-mini')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        CreditReservation.objects.filter(pk=reservation.pk).update(touched_at=an_hour_ago)
+
+        self.assertEqual(self.ledger.expire_stale_reservations(60), 0)
+
+        # The worker is lost: recovery fails the job and refunds its hold
+        EnhancementJob.objects.filter(pk=job.pk).update(updated_at=an_hour_ago)
+        self.assertEqual(recover_jobs(mock.Mock(), stale_after=60, requeue_running=False), (0, 1))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, CreditReservation.STATUS_REFUNDED)
+
+    def test_touched_reservation_is_not_expired(self):
+        reservation = self.ledger.reserve(self.user, Decimal('1.00'))
+        CreditReservation.objects.filter(pk=reservation.pk).update(
+            touched_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertTrue(self.ledger.touch(reservation))
+
+        self.assertEqual(self.ledger.expire_stale_reservations(60), 0)
+        self.assertTrue(self.ledger.commit(reservation))
+
+
+def _has_legacy_credits():
+    return any(field.name == 'credits' for field in get_user_model()._meta.concrete_fields)
+
+
+@skipUnless(_has_legacy_credits(), "user model has no legacy credits column")
+class LegacyCreditsSyncTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='credit-user', password='x')
+        get_user_model().objects.filter(pk=self.user.pk).update(credits=Decimal('10.00'))
+        self.user.refresh_from_db()
+        self.ledger = CreditLedger()
+
+    def _legacy_balance(self):
+        self.user.refresh_from_db()
+        return Decimal(str(self.user.credits))
+
+    def test_movements_reach_user_credits_on_reconcile(self):
+        reservation = self.ledger.reserve(self.user, Decimal('4.00'))
+        self.ledger.commit(reservation, amount=Decimal('1.00'))
+        # The hot path never writes the user row
+        self.assertEqual(self._legacy_balance(), Decimal('10.00'))
+
+        self.assertEqual(self.ledger.sync_legacy_balance(self.user), Decimal('0.00'))
+        self.assertEqual(self._legacy_balance(), Decimal('9.00'))
+        self.assertEqual(self.ledger.get_balance(self.user), Decimal('9.00'))
+
+    def test_out_of_band_top_up_reaches_the_ledger(self):
+        self.assertEqual(self.ledger.get_balance(self.user), Decimal('10.00'))
+        self.ledger.reserve(self.user, Decimal('3.00'))
+        get_user_model().objects.filter(pk=self.user.pk).update(credits=Decimal('25.00'))
+
+        self.assertEqual(self.ledger.sync_legacy_balance(self.user), Decimal('15.00'))
+        self.assertEqual(self.ledger.get_balance(self.user), Decimal('22.00'))
+        self.assertEqual(self._legacy_balance(), Decimal('22.00'))
+
+        # A second run finds nothing new to fold in
+        self.assertEqual(self.ledger.sync_legacy_balance(self.user), Decimal('0.00'))
+        self.assertEqual(self.ledger.get_balance(self.user), Decimal('22.00'))
@@ -3,7 +3,7 @@ Prompt History v2 URL Configuration
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PromptHistoryViewSet
+from .views import PromptHistoryViewSet, history_metrics
 
 app_name = 'history'
 
@@ -11,5 +11,7 @@ router = DefaultRouter()
 router.register(r'', PromptHistoryViewSet, basename='history')
 
 urlpatterns = [
+    # Ahead of the router so 'metrics' isn't taken for a history id
+    path('metrics/', history_metrics, name='history-metrics'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,101 @@
+"""
+History Change Versions
+Per-user version counter in the Django cache backing ETags, conditional
+GETs and an optional cache of serialized pages
+"""
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+# Override with settings.HISTORY_CONDITIONAL_GET
+DEFAULT_CONDITIONAL_CONFIG = {
+    # Needs a cache shared by every web process (Redis, Memcached); a
+    # per-process LocMemCache would miss bumps made by other workers
+    'enabled': False,
+    'cache_alias': 'default',
+    'page_cache': False,   # also cache serialized list/retrieve bodies
+    'page_ttl': 300,
+    'version_ttl': 7 * 24 * 60 * 60,
+}
+
+KEY_PREFIX = 'history:version:'
+PAGE_PREFIX = 'history:page:'
+
+
+def get_conditional_config() -> Dict[str, Any]:
+    return {**DEFAULT_CONDITIONAL_CONFIG, **getattr(settings, 'HISTORY_CONDITIONAL_GET', {})}
+
+
+def _cache(config):
+    from django.core.cache import caches
+    return caches[config['cache_alias']]
+
+
+def _initial_version() -> int:
+    # Start from the clock so a version lost to eviction is never reused
+    return int(time.time() * 1000)
+
+
+def get_version(user_id, config=None) -> int:
+    """Current change version for a user's history"""
+    config = config or get_conditional_config()
+    cache = _cache(config)
+    key = f"{KEY_PREFIX}{user_id}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), config['version_ttl'])
+        version = cache.get(key)
+    return version
+
+
+def bump_version(user_id):
+    """Invalidate a user's ETags and cached pages once the write commits"""
+    config = get_conditional_config()
+    if not config['enabled']:
+        return
+
+    def bump():
+        cache = _cache(config)
+        key = f"{KEY_PREFIX}{user_id}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Missing or evicted; any fresh value differs from what clients hold
+            cache.set(key, _initial_version(), config['version_ttl'])
+
+    # Bumping before commit would let a reader cache pre-commit data under the new version
+    transaction.on_commit(bump)
+
+
+def make_etag(user_id, version, request) -> str:
+    """Strong ETag over the version, path, query string and negotiated format"""
+    accepted = getattr(request, 'accepted_media_type', '') or ''
+    digest = hashlib.sha256(
+        '\x00'.join([str(user_id), str(version), request.get_full_path(), accepted]).encode('utf-8')
+    ).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(request, etag: str) -> bool:
+    header = request.headers.get('If-None-Match', '')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in [candidate.strip() for candidate in header.split(',')]
+
+
+def get_cached_page(etag: str, config=None) -> Optional[Any]:
+    config = config or get_conditional_config()
+    if not config['page_cache']:
+        return None
+    return _cache(config).get(PAGE_PREFIX + etag.strip('"'))
+
+
+def set_cached_page(etag: str, data, config=None):
+    config = config or get_conditional_config()
+    if config['page_cache']:
+        _cache(config).set(PAGE_PREFIX + etag.strip('"'), data, config['page_ttl'])
@@ -6,21 +6,62 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Q
 from decimal import Decimal
+import hmac
+import json
 import uuid
 
-from .models import PromptHistory
+from .models import PromptHistory, EnhancementJob, IdempotencyKey
 from .serializers import (
     PromptHistorySerializer,
+    PromptHistoryListSerializer,
     PromptHistoryCreateSerializer,
     PromptHistoryUpdateSerializer,
     EnhanceRequestSerializer,
     EnhanceResponseSerializer,
+    EnhancementJobSerializer,
+    BulkCreateRequestSerializer,
+    PromptHistoryBulkItemSerializer,
+    EnhanceBatchRequestSerializer,
+    EnhanceVariantsRequestSerializer,
 )
 from .permissions import IsOwnerOrReadOnlyStaff
-from .services import PromptEnhancementService, InsufficientCreditsError
+from .services import PromptEnhancementService, InsufficientCreditsError, ProviderUnavailableError
+from .scheduler import get_provider_scheduler
+from .jobs import get_job_runner, wait_for_job
+from .search import get_search_backend
+from .pagination import HistoryCursorPagination
+from .tags import filter_by_tags, index_new_tags, tag_facets
+from .rollups import record_change, record_created, usage_of, usage_stats
+from .exports import FORMATS as EXPORT_FORMATS, export_stream, import_records
+from .blobs import BLOB_FIELDS, prepare_for_bulk_create
+from .similarity import get_vector_store, is_available as similarity_available
+from .sync import InvalidSyncToken, SyncTokenExpired, changes_since, tombstone
+from .metrics import render as render_metrics, stage, track_request
+from .versions import (
+    bump_version,
+    etag_matches,
+    get_cached_page,
+    get_conditional_config,
+    get_version,
+    make_etag,
+    set_cached_page,
+)
+from .idempotency import (
+    claim_key,
+    complete_key,
+    release_key,
+    resolve_keys,
+    get_import_ttl,
+    get_ttl as get_idempotency_ttl,
+)
 
 
 class PromptHistoryViewSet(viewsets.ModelViewSet):
@@ -31,6 +72,17 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnlyStaff]
     lookup_field = 'id'
 
+    def dispatch(self, request, *args, **kwargs):
+        """Record latency, query count and DB time per action"""
+        if not getattr(settings, 'HISTORY_REQUEST_METRICS', True):
+            return super().dispatch(request, *args, **kwargs)
+
+        action_name = (getattr(self, 'action_map', None) or {}).get(request.method.lower(), request.method.lower())
+        if action_name == 'list' and request.GET.get('q'):
+            action_name = 'search'
+        with track_request(action_name):
+            return super().dispatch(request, *args, **kwargs)
+
     def get_queryset(self):
         """
         Filter by user and non-deleted items
@@ -51,6 +103,12 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
         if source:
             queryset = queryset.filter(source=source)
 
+        # Filter by tags (exact, repeatable) and tag prefix via the tag index
+        tags = self.request.query_params.getlist('tag')
+        tag_prefix = self.request.query_params.get('tag_prefix')
+        if tags or tag_prefix:
+            queryset = filter_by_tags(queryset, self.request.user, tags=tags, prefix=tag_prefix)
+
         # Filter by date range
         date_from = self.request.query_params.get('date_from')
         date_to = self.request.query_params.get('date_to')
@@ -59,47 +117,344 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
         if date_to:
             queryset = queryset.filter(created_at__lte=date_to)
 
-        # Search by keyword
+        # Search by keyword (ranked by relevance)
         keyword = self.request.query_params.get('q')
         if keyword:
-            queryset = queryset.filter(
-                Q(original_prompt__icontains=keyword) |
-                Q(optimized_prompt__icontains=keyword) |
-                Q(tags__contains=[keyword])
+            queryset = get_search_backend().search(
+                queryset,
+                keyword,
+                user_id=self.request.user.pk
             )
+        else:
+            queryset = queryset.order_by('-created_at')
+
+        if self.action == 'list':
+            queryset = self._defer_unused_columns(queryset)
+
+        return queryset
+
+    def _defer_unused_columns(self, queryset):
+        """Load only the columns the list serializer will render"""
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        model_fields = {f.name for f in PromptHistory._meta.concrete_fields}
+        columns = {'id', 'user', 'created_at', 'enhanced_at'}
+        columns.update(
+            field.source for field in serializer.fields.values()
+            if field.source in model_fields
+        )
+
+        # Blob-backed text is read through its blob; join it instead of N+1
+        blobs = [
+            blob_field for text_field, blob_field in BLOB_FIELDS
+            if text_field in columns
+        ]
+        if blobs:
+            columns.update(blobs)
+            queryset = queryset.select_related(*blobs)
+        return queryset.only(*columns)
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_get(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_get(request, super().retrieve, *args, **kwargs)
+
+    def _conditional_get(self, request, render, *args, **kwargs):
+        """
+        Answer with 304 when the client's ETag matches the user's current
+        history version; otherwise render (or reuse a cached page) and tag it
+        """
+        config = get_conditional_config()
+        if not config['enabled']:
+            return render(request, *args, **kwargs)
+
+        etag = make_etag(request.user.pk, get_version(request.user.pk, config), request)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'private, no-cache',
+            'Vary': 'Authorization, Accept',
+        }
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-        return queryset.order_by('-created_at')
+        data = get_cached_page(etag, config)
+        if data is not None:
+            return Response(data, headers=headers)
+
+        response = render(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_cached_page(etag, response.data, config)
+            for name, value in headers.items():
+                response[name] = value
+        return response
+
+    @property
+    def paginator(self):
+        """
+        Keyset pagination when the client asks for it (`?pagination=cursor`
+        or a `cursor` param); ranked search results keep page numbers
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            wants_cursor = params.get('pagination') == 'cursor' or 'cursor' in params
+            if wants_cursor and not params.get('q'):
+                self._paginator = HistoryCursorPagination()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
         if self.action == 'create':
             return PromptHistoryCreateSerializer
+        elif self.action == 'list' and self.request.query_params.get('view') == 'compact':
+            return PromptHistoryListSerializer
         elif self.action in ['update', 'partial_update']:
             return PromptHistoryUpdateSerializer
         return PromptHistorySerializer
 
+    def create(self, request, *args, **kwargs):
+        """Create, flagging earlier near-identical prompts so their enhancements can be reused"""
+        self._near_duplicates = []
+        response = super().create(request, *args, **kwargs)
+        if self._near_duplicates:
+            response.data['near_duplicates'] = self._near_duplicates
+        return response
+
     def perform_create(self, serializer):
         """Bind to current user on create"""
-        # Handle idempotency
         idempotency_key = self.request.headers.get('X-Idempotency-Key')
-        if idempotency_key:
-            # Check if we already created this
-            existing = PromptHistory.objects.filter(
-                user=self.request.user,
-                meta__idempotency_key=idempotency_key,
-                is_deleted=False
-            ).first()
-            if existing:
-                # Return existing instead of creating new
-                serializer.instance = existing
-                return
+        if not idempotency_key:
+            serializer.save(user=self.request.user)
+            self._near_duplicates = self._find_near_duplicates(serializer.instance)
+            return
 
         # Add idempotency key to meta if provided
         meta = serializer.validated_data.get('meta', {})
-        if idempotency_key:
-            meta['idempotency_key'] = idempotency_key
+        meta['idempotency_key'] = idempotency_key
+
+        with transaction.atomic():
+            # Concurrent retries collide on the unique key instead of both inserting
+            record, claimed = claim_key(self.request.user, IdempotencyKey.SCOPE_CREATE, idempotency_key)
+            if not claimed and record.history is not None and not record.history.is_deleted:
+                # Return existing instead of creating new
+                serializer.instance = record.history
+                return
+
+            serializer.save(user=self.request.user, meta=meta)
+            complete_key(record, serializer.instance)
+        self._near_duplicates = self._find_near_duplicates(serializer.instance)
+
+    def _find_near_duplicates(self, history):
+        if not similarity_available():
+            return []
+        matches = dict(get_vector_store().near_duplicates(history))
+        if not matches:
+            return []
+        live = PromptHistory.objects.filter(
+            user=history.user, is_deleted=False, id__in=list(matches)
+        ).only('id', 'enhanced_at')
+        duplicates = [
+            {
+                'id': row.id,
+                'similarity': round(matches[row.id], 4),
+                'is_enhanced': row.enhanced_at is not None,
+            }
+            for row in live
+        ]
+        return sorted(duplicates, key=lambda item: -item['similarity'])
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Bulk create: POST /api/v2/history/bulk/
+        Resolves all idempotency keys in one query and inserts new rows in
+        one transaction; returns a result per item in request order
+        """
+        envelope = BulkCreateRequestSerializer(data=request.data)
+        envelope.is_valid(raise_exception=True)
+        items = envelope.validated_data['items']
+
+        results = [None] * len(items)
+        pending = []  # (index, validated_data, idempotency_key)
+        for index, item in enumerate(items):
+            item_serializer = PromptHistoryBulkItemSerializer(data=item)
+            if not item_serializer.is_valid():
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'errors': item_serializer.errors,
+                }
+                continue
+            data = dict(item_serializer.validated_data)
+            pending.append((index, data, data.pop('idempotency_key', None)))
+
+        try:
+            self._bulk_insert(pending, results)
+        except IntegrityError:
+            # A concurrent flush claimed some of our keys; resolve again
+            self._bulk_insert(pending, results)
+
+        for result in results:
+            history = result.pop('history', None)
+            if history is not None:
+                result['id'] = history.id
+                result['item'] = PromptHistorySerializer(history).data
+
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    def _bulk_insert(self, pending, results, scope=IdempotencyKey.SCOPE_CREATE, ttl=None):
+        """Resolve idempotency keys and insert new rows in one transaction"""
+        user = self.request.user
+        ttl = ttl or get_idempotency_ttl()
+
+        with transaction.atomic():
+            # Resolve every idempotency key with a single query
+            keys = {key for _, _, key in pending if key}
+            records = resolve_keys(user, scope, keys, include_expired=True) if keys else {}
+            now = timezone.now()
+            existing = {
+                key: record.history
+                for key, record in records.items()
+                if record.expires_at > now and record.history is not None and not record.history.is_deleted
+            }
+
+            to_create = []
+            new_keys = []
+            for index, data, key in pending:
+                if key and key in existing:
+                    results[index] = {'index': index, 'status': 'existing', 'history': existing[key]}
+                    continue
+
+                data = dict(data)
+                meta = data.pop('meta', None) or {}
+                if key:
+                    meta['idempotency_key'] = key
+                history = PromptHistory(user=user, meta=meta, **data)
+                history.refresh_previews()
+                if key:
+                    # Duplicate keys within the batch resolve to the first item
+                    existing[key] = history
+                    new_keys.append((key, history))
+                to_create.append(history)
+                results[index] = {'index': index, 'status': 'created', 'history': history}
+
+            if not to_create:
+                return
+
+            prepare_for_bulk_create(to_create)
+            created = PromptHistory.objects.bulk_create(to_create)
+
+            # Stale (expired or deleted-target) keys are replaced
+            stale = [records[key].id for key, _ in new_keys if key in records]
+            if stale:
+                IdempotencyKey.objects.filter(id__in=stale).delete()
+            expires_at = now + ttl
+            IdempotencyKey.objects.bulk_create([
+                IdempotencyKey(
+                    user=user,
+                    scope=scope,
+                    key=key,
+                    history=history,
+                    completed=True,
+                    expires_at=expires_at
+                )
+                for key, history in new_keys
+            ])
+
+            get_search_backend().index_many(created)
+            index_new_tags(created)
+            record_created(created)
+            if similarity_available():
+                get_vector_store().add(created)
+            bump_version(user.pk)
+
+    @action(detail=False, methods=['get'], url_path='export', url_name='export')
+    def export(self, request):
+        """
+        Streaming export: GET /api/v2/history/export/?export_format=ndjson|csv
+        Accepts the list filters; rows are read with a chunked iterator
+        """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'invalid_format', 'message': f"export_format must be one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            export_stream(queryset, export_format),
+            content_type=f"{EXPORT_FORMATS[export_format]}; charset=utf-8"
+        )
+        filename = f"prompt-history-{timezone.now():%Y%m%d}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import')
+    def import_history(self, request):
+        """
+        Streaming import: POST /api/v2/history/import/
+        Body is NDJSON (application/x-ndjson) or CSV (text/csv) as written by
+        export; it is read line by line and inserted in batches. Exported ids
+        become long-lived keys in the import scope, so re-importing a file
+        doesn't duplicate rows, however much later it happens.
+        """
+        import_format = request.query_params.get('import_format')
+        if import_format is None:
+            import_format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        if import_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'invalid_format', 'message': f"import_format must be one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        batch_size = getattr(settings, 'HISTORY_IMPORT_BATCH_SIZE', 500)
+        max_errors = 100
+        summary = {'created': 0, 'existing': 0, 'failed': 0, 'errors': []}
+
+        def fail(line, errors):
+            summary['failed'] += 1
+            if len(summary['errors']) < max_errors:
+                summary['errors'].append({'line': line, 'errors': errors})
+
+        batch = []
+        for line, item in import_records(request.stream or [], import_format):
+            if 'error' in item:
+                fail(line, item['error'])
+                continue
+            item_serializer = PromptHistoryBulkItemSerializer(data=item)
+            if not item_serializer.is_valid():
+                fail(line, item_serializer.errors)
+                continue
+            data = dict(item_serializer.validated_data)
+            batch.append((len(batch), data, data.pop('idempotency_key', None)))
+            if len(batch) >= batch_size:
+                self._import_batch(batch, summary)
+                batch = []
+        if batch:
+            self._import_batch(batch, summary)
 
-        serializer.save(user=self.request.user, meta=meta)
+        return Response(summary, status=status.HTTP_200_OK)
+
+    def _import_batch(self, pending, summary):
+        results = [None] * len(pending)
+        options = {'scope': IdempotencyKey.SCOPE_IMPORT, 'ttl': get_import_ttl()}
+        try:
+            self._bulk_insert(pending, results, **options)
+        except IntegrityError:
+            self._bulk_insert(pending, results, **options)
+        for result in results:
+            summary[result['status']] += 1
+
+    def perform_update(self, serializer):
+        """Move the row's usage if its intent category changes"""
+        before = usage_of(serializer.instance)
+        instance = serializer.save()
+        record_change(before, usage_of(instance))
 
     def perform_destroy(self, instance):
         """Soft delete instead of hard delete"""
@@ -110,9 +465,11 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
         """
         Enhancement endpoint: POST /api/v2/history/{id}/enhance/
         Runs optimization pipeline, debits credits, fills optimized_prompt
+        With `Prefer: respond-async`, returns 202 and a job to poll instead
         """
         # Get the history object
-        history = self.get_object()
+        with stage('load'):
+            history = self.get_object()
 
         # Validate request
         request_serializer = EnhanceRequestSerializer(data=request.data)
@@ -121,43 +478,107 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
         model = request_serializer.validated_data['model']
         style = request_serializer.validated_data['style']
 
-        # Handle idempotency
         idempotency_key = request.headers.get('X-Idempotency-Key')
+
+        # Opt-in async mode: hand off to the local worker pool
+        if self._wants_async(request):
+            return self._enqueue_enhancement(history, model, style, idempotency_key)
+
+        # Handle idempotency
+        claim = None
         if idempotency_key:
-            # Check if we already enhanced this
-            if history.optimized_prompt and history.meta.get('enhance_idempotency_key') == idempotency_key:
-                # Return existing enhancement
-                response_serializer = EnhanceResponseSerializer(history)
-                return Response(response_serializer.data)
+            with stage('claim'):
+                claim, claimed = claim_key(
+                    request.user,
+                    IdempotencyKey.SCOPE_ENHANCE,
+                    idempotency_key,
+                    history=history
+                )
+            if not claimed:
+                if claim.completed and claim.history_id == history.id:
+                    # Return existing enhancement
+                    response_serializer = EnhanceResponseSerializer(history)
+                    return Response(response_serializer.data)
+                return Response(
+                    {
+                        'error': 'enhancement_in_progress',
+                        'message': 'A request with this idempotency key is still running'
+                    },
+                    status=status.HTTP_409_CONFLICT
+                )
 
+        succeeded = False
         try:
             # Run enhancement service
             service = PromptEnhancementService()
-            result = service.enhance_prompt(
+            service.enhance_history(
                 user=request.user,
                 history=history,
                 model=model,
-                style=style
+                style=style,
+                idempotency_key=idempotency_key
             )
 
-            # Update history with enhancement
-            meta = history.meta.copy()
-            if idempotency_key:
-                meta['enhance_idempotency_key'] = idempotency_key
+            # Return response
+            succeeded = True
+            with stage('serialize'):
+                response_serializer = EnhanceResponseSerializer(history)
+                data = response_serializer.data
+            return Response(data)
 
-            history.mark_enhanced(
-                optimized_prompt=result['optimized_prompt'],
-                model=result['model'],
-                tokens=result['tokens'],
-                credits_spent=result['credits_spent']
+        except InsufficientCreditsError as e:
+            return Response(
+                {
+                    'error': 'insufficient_credits',
+                    'message': str(e),
+                    'required_credits': e.required_credits,
+                    'current_credits': e.current_credits,
+                },
+                status=status.HTTP_402_PAYMENT_REQUIRED
             )
-            history.meta = meta
-            history.save(update_fields=['meta'])
+        except ProviderUnavailableError as e:
+            return self._provider_unavailable_response(e)
+        except Exception as e:
+            return Response(
+                {
+                    'error': 'enhancement_failed',
+                    'message': str(e)
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        finally:
+            if claim is not None:
+                with stage('settle_key'):
+                    if succeeded:
+                        complete_key(claim, history)
+                    else:
+                        # Let the client retry with the same key
+                        release_key(claim)
 
-            # Return response
-            response_serializer = EnhanceResponseSerializer(history)
-            return Response(response_serializer.data)
+    @action(detail=True, methods=['post'], url_path='enhance/variants', url_name='enhance-variants')
+    def enhance_variants(self, request, id=None):
+        """
+        Multi-style enhancement: POST /api/v2/history/{id}/enhance/variants/
+        Generates every requested style in one provider call and stores them
+        in `variants`; the first style becomes optimized_prompt
+        """
+        with stage('load'):
+            history = self.get_object()
+
+        request_serializer = EnhanceVariantsRequestSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+
+        model = request_serializer.validated_data['model']
+        styles = request_serializer.validated_data['styles']
 
+        try:
+            service = PromptEnhancementService()
+            result = service.enhance_history_variants(
+                user=request.user,
+                history=history,
+                model=model,
+                styles=styles
+            )
         except InsufficientCreditsError as e:
             return Response(
                 {
@@ -168,6 +589,8 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_402_PAYMENT_REQUIRED
             )
+        except ProviderUnavailableError as e:
+            return self._provider_unavailable_response(e)
         except Exception as e:
             return Response(
                 {
@@ -176,3 +599,357 @@ class PromptHistoryViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+        data = EnhanceResponseSerializer(history).data
+        data['missing_styles'] = result.get('missing_styles', [])
+        return Response(data)
+
+    def _provider_unavailable_response(self, e):
+        """503 with Retry-After when every eligible provider is saturated or down"""
+        headers = {}
+        if e.retry_after:
+            headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return Response(
+            {
+                'error': 'provider_unavailable',
+                'message': str(e),
+            },
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers=headers
+        )
+
+    @action(detail=False, methods=['get'], url_path='changes', url_name='changes')
+    def changes(self, request):
+        """
+        Delta sync: GET /api/v2/history/changes/?since=<sync_token>&limit=<n>
+        Rows created, updated, enhanced or deleted since the token, oldest
+        first; soft-deleted rows come back as tombstones. Keep calling with
+        the returned sync_token while has_more is true.
+        """
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 500)), 1000))
+        except ValueError:
+            limit = 500
+
+        try:
+            rows, sync_token, has_more = changes_since(
+                request.user,
+                token=request.query_params.get('since'),
+                limit=limit
+            )
+        except InvalidSyncToken:
+            return Response(
+                {'error': 'invalid_sync_token', 'message': 'Invalid sync token'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except SyncTokenExpired:
+            return Response(
+                {'error': 'sync_token_expired', 'message': 'Sync token is too old; resync without a token'},
+                status=status.HTTP_410_GONE
+            )
+
+        changes = [
+            tombstone(history) if history.is_deleted else PromptHistorySerializer(history).data
+            for history in rows
+        ]
+        return Response({
+            'changes': changes,
+            'sync_token': sync_token,
+            'has_more': has_more,
+        })
+
+    @action(detail=True, methods=['get'], url_path='similar', url_name='similar')
+    def similar(self, request, id=None):
+        """
+        Similar prompts: GET /api/v2/history/{id}/similar/?limit=10&min_score=0.3
+        Cosine similarity over local hashed n-gram vectors, best first
+        """
+        history = self.get_object()
+        if not similarity_available():
+            return Response(
+                {'error': 'similarity_unavailable', 'message': 'Similar prompt search is not enabled'},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+            min_score = float(request.query_params.get('min_score', 0))
+        except ValueError:
+            limit, min_score = 10, 0.0
+
+        # Over-fetch: cached matrices may still hold rows deleted since they loaded
+        matches = get_vector_store().similar(
+            history.user_id, history.original_prompt, limit=limit * 2, exclude={history.id}
+        )
+        scores = {history_id: score for history_id, score in matches if score >= min_score}
+        rows = PromptHistory.objects.filter(
+            user_id=history.user_id, is_deleted=False, id__in=list(scores)
+        ).select_related('original_blob', 'optimized_blob')
+        ranked = sorted(rows, key=lambda row: -scores[row.id])[:limit]
+
+        results = []
+        for row in ranked:
+            item = PromptHistorySerializer(row).data
+            item['similarity'] = round(scores[row.id], 4)
+            results.append(item)
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'], url_path='tags', url_name='tags')
+    def tags(self, request):
+        """
+        Tag facets: GET /api/v2/history/tags/?prefix=<text>&limit=<n>
+        Per-tag counts over live history, served from the tag index
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), 500)
+        except ValueError:
+            limit = 100
+        facets = tag_facets(request.user, prefix=request.query_params.get('prefix'), limit=limit)
+        return Response({'results': facets})
+
+    @action(detail=False, methods=['get'], url_path='stats', url_name='stats')
+    def stats(self, request):
+        """
+        Usage stats: GET /api/v2/history/stats/?days=30&group_by=day
+        Totals and a series (by day, intent_category, source or model)
+        served from the usage rollup rather than scanning history
+        """
+        try:
+            days = max(1, min(int(request.query_params.get('days', 30)), 366))
+        except ValueError:
+            days = 30
+
+        try:
+            data = usage_stats(
+                request.user,
+                days=days,
+                group_by=request.query_params.get('group_by', 'day')
+            )
+        except ValueError as e:
+            return Response(
+                {'error': 'invalid_group_by', 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(data)
+
+    @action(detail=False, methods=['get'], url_path='providers', url_name='providers')
+    def providers(self, request):
+        """
+        Provider status: GET /api/v2/history/providers/
+        Live rate limits, concurrency and circuit breaker state per model
+        """
+        return Response(get_provider_scheduler().snapshot())
+
+    @action(detail=False, methods=['post'], url_path='enhance-batch', url_name='enhance-batch')
+    def enhance_batch(self, request):
+        """
+        Batch enhancement: POST /api/v2/history/enhance-batch/
+        Fans provider calls out concurrently; returns a result per id
+        """
+        request_serializer = EnhanceBatchRequestSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+
+        ids = request_serializer.validated_data['ids']
+        model = request_serializer.validated_data['model']
+        style = request_serializer.validated_data['style']
+
+        histories = {
+            history.id: history
+            for history in self.get_queryset().filter(id__in=ids)
+        }
+
+        try:
+            service = PromptEnhancementService()
+            outcomes = service.enhance_batch(
+                user=request.user,
+                histories=list(histories.values()),
+                model=model,
+                style=style
+            )
+        except InsufficientCreditsError as e:
+            return Response(
+                {
+                    'error': 'insufficient_credits',
+                    'message': str(e),
+                    'required_credits': e.required_credits,
+                    'current_credits': e.current_credits,
+                },
+                status=status.HTTP_402_PAYMENT_REQUIRED
+            )
+
+        results = []
+        for history_id in ids:
+            if history_id not in histories:
+                results.append({
+                    'id': history_id,
+                    'status': 'error',
+                    'error': 'not_found',
+                    'message': 'History item not found',
+                })
+                continue
+
+            outcome = outcomes[history_id]
+            if 'error' in outcome:
+                results.append({'id': history_id, 'status': 'error', **outcome})
+            else:
+                results.append({
+                    'id': history_id,
+                    'status': 'enhanced',
+                    'item': EnhanceResponseSerializer(histories[history_id]).data,
+                })
+
+        return Response({'results': results})
+
+    @action(detail=True, methods=['post'], url_path='enhance/stream', url_name='enhance-stream')
+    def enhance_stream(self, request, id=None):
+        """
+        Streaming enhancement: POST /api/v2/history/{id}/enhance/stream/
+        Relays tokens as server-sent events (`token`, then `done` or `error`)
+        """
+        history = self.get_object()
+
+        request_serializer = EnhanceRequestSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+
+        model = request_serializer.validated_data['model']
+        style = request_serializer.validated_data['style']
+
+        service = PromptEnhancementService()
+
+        # Fail fast with a normal 402 before the stream starts
+        credits_required = service.CREDIT_COSTS.get(model, Decimal('0.10'))
+        current_credits = service._get_user_credits(request.user)
+        if current_credits < credits_required:
+            return Response(
+                {
+                    'error': 'insufficient_credits',
+                    'message': str(InsufficientCreditsError(credits_required, current_credits)),
+                    'required_credits': credits_required,
+                    'current_credits': current_credits,
+                },
+                status=status.HTTP_402_PAYMENT_REQUIRED
+            )
+
+        events = service.enhance_history_stream(
+            user=request.user,
+            history=history,
+            model=model,
+            style=style
+        )
+        response = StreamingHttpResponse(
+            self._sse_events(events, history),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+        return response
+
+    def _sse_events(self, events, history):
+        """Encode enhancement events as SSE frames"""
+        try:
+            for event in events:
+                if event['type'] == 'delta':
+                    yield _sse('token', {'text': event['text']})
+                elif event['type'] == 'done':
+                    yield _sse('done', EnhanceResponseSerializer(history).data)
+        except InsufficientCreditsError as e:
+            yield _sse('error', {
+                'error': 'insufficient_credits',
+                'message': str(e),
+                'required_credits': e.required_credits,
+                'current_credits': e.current_credits,
+            })
+        except ProviderUnavailableError as e:
+            yield _sse('error', {'error': 'provider_unavailable', 'message': str(e)})
+        except Exception as e:
+            yield _sse('error', {'error': 'enhancement_failed', 'message': str(e)})
+        finally:
+            # Client disconnects close this generator; close the service
+            # stream too so the reservation is refunded immediately
+            events.close()
+
+    def _wants_async(self, request):
+        """Client opts in with `Prefer: respond-async` (RFC 7240)"""
+        if not getattr(settings, 'HISTORY_ENHANCE_ASYNC_ENABLED', True):
+            return False
+        prefer = request.headers.get('Prefer', '')
+        return 'respond-async' in [p.strip().lower() for p in prefer.split(',')]
+
+    def _enqueue_enhancement(self, history, model, style, idempotency_key):
+        """Create an EnhancementJob and return 202 with its id"""
+        try:
+            with transaction.atomic():
+                job = EnhancementJob.objects.create(
+                    user=self.request.user,
+                    history=history,
+                    model=model,
+                    style=style,
+                    idempotency_key=idempotency_key
+                )
+        except IntegrityError:
+            # Retries of the same request share one job (unique on history + key)
+            job = EnhancementJob.objects.get(history=history, idempotency_key=idempotency_key)
+        else:
+            get_job_runner().submit(job)
+
+        response_serializer = EnhancementJobSerializer(job)
+        return Response(
+            response_serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': self._job_url(job)}
+        )
+
+    def _job_url(self, job):
+        return self.request.build_absolute_uri(
+            reverse('history:history-enhance-job', kwargs={'job_id': job.id})
+        )
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]+)', url_name='enhance-job')
+    def enhance_job(self, request, job_id=None):
+        """
+        Async job status: GET /api/v2/history/jobs/{job_id}/?wait=<seconds>
+        With `wait`, long-polls until the job finishes or the wait elapses
+        """
+        try:
+            job = EnhancementJob.objects.select_related('history').get(
+                id=job_id,
+                user=request.user
+            )
+        except (EnhancementJob.DoesNotExist, ValueError, ValidationError):
+            return Response(
+                {'error': 'not_found', 'message': 'Job not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            wait = 0
+        max_wait = getattr(settings, 'HISTORY_JOB_MAX_WAIT', 20)
+        if wait > 0 and not job.is_finished:
+            job = wait_for_job(job, timeout=min(wait, max_wait))
+
+        response_serializer = EnhancementJobSerializer(job)
+        return Response(response_serializer.data)
+
+
+def _sse(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def history_metrics(request):
+    """
+    Prometheus scrape endpoint: GET /api/v2/history/metrics/
+    Open to staff sessions, or to `Authorization: Bearer <HISTORY_METRICS_TOKEN>`
+    """
+    token = getattr(settings, 'HISTORY_METRICS_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization, f"Bearer {token}")
+    if not authorized:
+        user = getattr(request, 'user', None)
+        authorized = bool(user is not None and user.is_authenticated and user.is_staff)
+    if not authorized:
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -34,6 +34,7 @@ export const EnhanceModal: React.FC<EnhanceModalProps> = ({
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [showUpsell, setShowUpsell] = useState(false);
+  const [streamedText, setStreamedText] = useState('');
 
   if (!open) return null;
 
@@ -51,6 +52,7 @@ export const EnhanceModal: React.FC<EnhanceModalProps> = ({
       label: 'Claude 3.5 Sonnet (0.75 credits)',
       cost: 0.75,
     },
+    { value: 'local-rules', label: 'Local rules (free, instant)', cost: 0 },
   ];
 
   // Style options
@@ -86,8 +88,10 @@ export const EnhanceModal: React.FC<EnhanceModalProps> = ({
   const handleEnhance = async () => {
     setLoading(true);
     setError(null);
+    setStreamedText('');
 
     const startTime = Date.now();
+    let firstTokenLatency: number | undefined;
 
     try {
       emitTelemetry('history.enhance.start', {
@@ -97,7 +101,12 @@ export const EnhanceModal: React.FC<EnhanceModalProps> = ({
       });
 
       const request: EnhanceRequest = { model, style };
-      const result = await client.enhance(history.id, request);
+      const result = await client.enhanceStream(history.id, request, text => {
+        if (firstTokenLatency === undefined) {
+          firstTokenLatency = Date.now() - startTime;
+        }
+        setStreamedText(prev => prev + text);
+      });
 
       // Update history with result
       const enhanced: PromptHistory = {
@@ -118,6 +127,7 @@ export const EnhanceModal: React.FC<EnhanceModalProps> = ({
         tokens: result.tokens,
         credits_spent: result.credits_spent,
         latency,
+        firstTokenLatency,
       });
     } catch (err) {
       const latency = Date.now() - startTime;
@@ -163,6 +173,14 @@ export const EnhanceModal: React.FC<EnhanceModalProps> = ({
             <div className="prompt-preview">{history.original_prompt}</div>
           </div>
 
+          {/* Streaming output */}
+          {streamedText && (
+            <div className="original-prompt">
+              <label>Enhanced Prompt:</label>
+              <div className="prompt-preview">{streamedText}</div>
+            </div>
+          )}
+
           {/* Model selection */}
           <div className="form-group">
             <label htmlFor="model">Model:</label>
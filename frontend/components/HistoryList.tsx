@@ -18,9 +18,11 @@ import { EnhanceModal } from './EnhanceModal';
 
 interface HistoryListProps {
   client: HistoryApiClient;
+  // 'cursor' switches to keyset pagination with infinite scroll
+  paginationMode?: 'page' | 'cursor';
 }
 
-export const HistoryList: React.FC<HistoryListProps> = ({ client }) => {
+export const HistoryList: React.FC<HistoryListProps> = ({ client, paginationMode = 'page' }) => {
   const [history, setHistory] = useState<PromptHistory[]>([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
@@ -37,16 +39,48 @@ export const HistoryList: React.FC<HistoryListProps> = ({ client }) => {
   const [totalCount, setTotalCount] = useState(0);
   const [hasNext, setHasNext] = useState(false);
   const [hasPrevious, setHasPrevious] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // Ranked search results are page-numbered on the server
+  const useCursor = paginationMode === 'cursor' && !searchKeyword;
 
   // Enhance modal
   const [enhanceModalOpen, setEnhanceModalOpen] = useState(false);
   const [selectedHistory, setSelectedHistory] = useState<PromptHistory | null>(null);
 
+  // Build filter params shared by both pagination modes
+  const buildFilters = useCallback((): ListHistoryParams => {
+    const params: ListHistoryParams = { page_size: 20 };
+
+    if (searchKeyword) params.q = searchKeyword;
+    if (intentCategory) params.intent_category = intentCategory;
+    if (source) params.source = source;
+    if (dateFrom) params.date_from = dateFrom;
+    if (dateTo) params.date_to = dateTo;
+
+    return params;
+  }, [searchKeyword, intentCategory, source, dateFrom, dateTo]);
+
   // Load history
   const loadHistory = useCallback(async () => {
     setLoading(true);
     setError(null);
 
+    if (useCursor) {
+      try {
+        const response = await client.listCursor(buildFilters());
+        setHistory(response.results);
+        setNextCursor(response.next_cursor);
+      } catch (err) {
+        setError(getErrorMessage(err));
+        console.error('Failed to load history:', err);
+      } finally {
+        setLoading(false);
+      }
+      return;
+    }
+
     try {
       const params: ListHistoryParams = {
         page,
@@ -71,7 +105,33 @@ export const HistoryList: React.FC<HistoryListProps> = ({ client }) => {
     } finally {
       setLoading(false);
     }
-  }, [client, page, searchKeyword, intentCategory, source, dateFrom, dateTo]);
+  }, [client, page, searchKeyword, intentCategory, source, dateFrom, dateTo, useCursor, buildFilters]);
+
+  // Append the next keyset page (infinite scroll)
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+
+    try {
+      const response = await client.listCursor({ ...buildFilters(), cursor: nextCursor });
+      setHistory(prev => [...prev, ...response.results]);
+      setNextCursor(response.next_cursor);
+    } catch (err) {
+      setError(getErrorMessage(err));
+      console.error('Failed to load more history:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [client, nextCursor, loadingMore, buildFilters]);
+
+  // Handle scroll near the bottom of the list
+  const handleScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    if (!useCursor) return;
+    const el = e.currentTarget;
+    if (el.scrollHeight - el.scrollTop - el.clientHeight < 200) {
+      loadMore();
+    }
+  };
 
   // Load on mount and when filters change
   useEffect(() => {
@@ -219,7 +279,7 @@ export const HistoryList: React.FC<HistoryListProps> = ({ client }) => {
         </div>
       )}
 
-      <div className="history-items">
+      <div className="history-items" onScroll={handleScroll}>
         {history.map(item => (
           <HistoryRow
             key={item.id}
@@ -231,8 +291,21 @@ export const HistoryList: React.FC<HistoryListProps> = ({ client }) => {
         ))}
       </div>
 
+      {/* Infinite scroll */}
+      {useCursor && nextCursor && (
+        <div className="pagination">
+          <button
+            disabled={loadingMore}
+            onClick={loadMore}
+            className="pagination-button"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
+
       {/* Pagination */}
-      {totalCount > 0 && (
+      {!useCursor && totalCount > 0 && (
         <div className="pagination">
           <button
             disabled={!hasPrevious}
@@ -36,6 +36,10 @@ export const HistoryRow: React.FC<HistoryRowProps> = ({
     return text.slice(0, maxLength) + '...';
   };
 
+  // Compact list items carry is_enhanced and previews instead of full text
+  const isEnhanced = history.is_enhanced ?? !!history.optimized_prompt;
+  const optimizedPreview = history.optimized_preview ?? history.optimized_prompt;
+
   // Get category badge color
   const getCategoryColor = (category: string) => {
     const colors: Record<string, string> = {
@@ -53,7 +57,7 @@ export const HistoryRow: React.FC<HistoryRowProps> = ({
     <div className="history-row">
       <div className="history-row-header">
         <div className="history-row-title">
-          {truncate(history.original_prompt)}
+          {truncate(history.preview ?? history.original_prompt)}
         </div>
         <div className="history-row-date">{formatDate(history.created_at)}</div>
       </div>
@@ -78,7 +82,7 @@ export const HistoryRow: React.FC<HistoryRowProps> = ({
         ))}
 
         {/* Enhanced indicator */}
-        {history.optimized_prompt && (
+        {isEnhanced && (
           <span className="enhanced-badge" title="Enhanced">
             ✨ Enhanced
           </span>
@@ -86,11 +90,11 @@ export const HistoryRow: React.FC<HistoryRowProps> = ({
       </div>
 
       {/* Enhanced prompt preview */}
-      {history.optimized_prompt && (
+      {isEnhanced && optimizedPreview && (
         <div className="history-row-enhanced">
           <div className="enhanced-label">Optimized:</div>
           <div className="enhanced-text">
-            {truncate(history.optimized_prompt, 100)}
+            {truncate(optimizedPreview, 100)}
           </div>
           {history.model && (
             <div className="enhanced-info">
@@ -106,8 +110,8 @@ export const HistoryRow: React.FC<HistoryRowProps> = ({
         <button
           className="action-button enhance-button"
           onClick={() => onEnhance(history)}
-          disabled={!!history.optimized_prompt}
-          title={history.optimized_prompt ? 'Already enhanced' : 'Enhance prompt'}
+          disabled={isEnhanced}
+          title={isEnhanced ? 'Already enhanced' : 'Enhance prompt'}
         >
           ✨ Enhance
         </button>
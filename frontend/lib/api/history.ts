@@ -18,8 +18,14 @@ export interface PromptHistory {
   tokens?: number;
   credits_spent?: number;
   enhanced_at?: string;
+  variants?: Partial<Record<EnhancementStyle, PromptVariant>>;
   created_at: string;
   updated_at: string;
+  // Present on compact list items (view: 'compact')
+  preview?: string;
+  optimized_preview?: string;
+  is_enhanced?: boolean;
+  near_duplicates?: NearDuplicate[]; // create responses only
 }
 
 export type IntentCategory = 'summary' | 'creative' | 'analysis' | 'code' | 'translation' | 'other';
@@ -34,6 +40,18 @@ export interface CreateHistoryRequest {
   meta?: Record<string, any>;
 }
 
+export interface BulkCreateItem extends CreateHistoryRequest {
+  idempotency_key?: string;
+}
+
+export interface BulkCreateResult {
+  index: number;
+  status: 'created' | 'existing' | 'error';
+  id?: string;
+  item?: PromptHistory;
+  errors?: Record<string, string[]>;
+}
+
 export interface UpdateHistoryRequest {
   tags?: string[];
   meta?: Record<string, any>;
@@ -45,6 +63,29 @@ export interface EnhanceRequest {
   style?: EnhancementStyle;
 }
 
+export interface PromptVariant {
+  text: string;
+  model: string;
+  enhanced_at: string;
+}
+
+export interface EnhanceVariantsRequest {
+  model?: string;
+  styles?: EnhancementStyle[]; // default: all; the first becomes optimized_prompt
+}
+
+export interface EnhanceBatchRequest extends EnhanceRequest {
+  ids: string[];
+}
+
+export interface EnhanceBatchResult {
+  id: string;
+  status: 'enhanced' | 'error';
+  item?: EnhanceResponse;
+  error?: string;
+  message?: string;
+}
+
 export interface EnhanceResponse {
   id: string;
   original_prompt: string;
@@ -53,6 +94,27 @@ export interface EnhanceResponse {
   tokens: number;
   credits_spent: number;
   enhanced_at: string;
+  variants?: Partial<Record<EnhancementStyle, PromptVariant>>;
+}
+
+export interface EnhanceVariantsResponse extends EnhanceResponse {
+  missing_styles: EnhancementStyle[];
+}
+
+export type EnhancementJobStatus = 'pending' | 'running' | 'succeeded' | 'failed';
+
+export interface EnhancementJob {
+  id: string;
+  history_id: string;
+  model: string;
+  style: EnhancementStyle;
+  status: EnhancementJobStatus;
+  error: string | null;
+  error_detail: Record<string, any>;
+  result: EnhanceResponse | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
 }
 
 export interface ListHistoryParams {
@@ -63,6 +125,63 @@ export interface ListHistoryParams {
   q?: string; // search keyword
   page?: number;
   page_size?: number;
+  cursor?: string; // keyset pagination (see listCursor)
+  view?: 'compact'; // previews instead of full prompt text and meta
+  fields?: string; // comma-separated fields to include
+  exclude?: string; // comma-separated fields to omit
+  tag?: string | string[]; // exact tag match; repeated tags must all match
+  tag_prefix?: string; // any tag starting with this text
+}
+
+export type UsageGroupBy = 'day' | 'intent_category' | 'source' | 'model';
+
+export interface UsageCounters {
+  prompts: number;
+  enhanced: number;
+  tokens: number;
+  credits_spent: string;
+}
+
+export interface UsageStats {
+  since: string;
+  days: number;
+  group_by: UsageGroupBy;
+  totals: UsageCounters;
+  series: Array<UsageCounters & Partial<Record<UsageGroupBy, string>>>;
+}
+
+export type TransferFormat = 'ndjson' | 'csv';
+
+export interface ImportSummary {
+  created: number;
+  existing: number;
+  failed: number;
+  errors: Array<{ line: number; errors: unknown }>;
+}
+
+export interface HistoryTombstone {
+  id: string;
+  deleted: true;
+  deleted_at: string;
+}
+
+export interface ChangesResponse {
+  changes: Array<PromptHistory | HistoryTombstone>;
+  sync_token: string;
+  has_more: boolean;
+}
+
+export interface NearDuplicate {
+  id: string;
+  similarity: number;
+  is_enhanced: boolean;
+}
+
+export type SimilarPrompt = PromptHistory & { similarity: number };
+
+export interface TagFacet {
+  name: string;
+  count: number;
 }
 
 export interface PaginatedResponse<T> {
@@ -72,6 +191,12 @@ export interface PaginatedResponse<T> {
   results: T[];
 }
 
+export interface CursorPaginatedResponse<T> {
+  next: string | null;
+  next_cursor: string | null;
+  results: T[];
+}
+
 export interface ApiError {
   error: string;
   message: string;
@@ -101,6 +226,9 @@ const RETRY_DELAYS = [1000, 2000, 4000]; // ms
 export class HistoryApiClient {
   private baseUrl: string;
   private tokenStorage: TokenStorage;
+  // Last ETag and body per GET path, revalidated with If-None-Match
+  private etagCache = new Map<string, { etag: string; data: unknown }>();
+  private static readonly ETAG_CACHE_LIMIT = 100;
 
   constructor(tokenStorage: TokenStorage, baseUrl: string = API_BASE_URL) {
     this.baseUrl = baseUrl;
@@ -194,8 +322,26 @@ export class HistoryApiClient {
     retries: number = 0
   ): Promise<T> {
     try {
-      const response = await fetch(`${this.baseUrl}${path}`, options);
-      return await this.handleResponse<T>(response);
+      const isGet = (options.method ?? 'GET') === 'GET';
+      const cached = isGet ? this.etagCache.get(path) : undefined;
+      const init = cached
+        ? {
+            ...options,
+            headers: { ...(options.headers as Record<string, string>), 'If-None-Match': cached.etag },
+          }
+        : options;
+
+      const response = await fetch(`${this.baseUrl}${path}`, init);
+      if (cached && response.status === 304) {
+        return cached.data as T;
+      }
+
+      const data = await this.handleResponse<T>(response);
+      const etag = isGet ? response.headers.get('ETag') : null;
+      if (etag) {
+        this.rememberEtag(path, etag, data);
+      }
+      return data;
     } catch (error) {
       // Retry on auth error or network issues
       if (error instanceof Error && error.message === 'RETRY' && retries < MAX_RETRIES) {
@@ -208,6 +354,16 @@ export class HistoryApiClient {
     }
   }
 
+  private rememberEtag(path: string, etag: string, data: unknown): void {
+    this.etagCache.delete(path);
+    this.etagCache.set(path, { etag, data });
+    if (this.etagCache.size > HistoryApiClient.ETAG_CACHE_LIMIT) {
+      // Map iterates in insertion order: drop the least recently stored
+      const oldest = this.etagCache.keys().next().value;
+      if (oldest !== undefined) this.etagCache.delete(oldest);
+    }
+  }
+
   private sleep(ms: number): Promise<void> {
     return new Promise(resolve => setTimeout(resolve, ms));
   }
@@ -228,6 +384,26 @@ export class HistoryApiClient {
     });
   }
 
+  /**
+   * Create many history entries in one request
+   * Each item carries its own idempotency key so replays are safe
+   */
+  async bulkCreate(items: BulkCreateItem[]): Promise<BulkCreateResult[]> {
+    const headers = await this.getHeaders();
+
+    const response = await this.request<{ results: BulkCreateResult[] }>(
+      `${API_HISTORY_PATH}/bulk/`,
+      {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({
+          items: items.map(item => ({ source: 'extension', ...item })),
+        }),
+      }
+    );
+    return response.results;
+  }
+
   /**
    * List history entries with filters and pagination
    */
@@ -237,7 +413,9 @@ export class HistoryApiClient {
 
     if (params) {
       Object.entries(params).forEach(([key, value]) => {
-        if (value !== undefined) {
+        if (Array.isArray(value)) {
+          value.forEach((item) => queryParams.append(key, String(item)));
+        } else if (value !== undefined) {
           queryParams.append(key, String(value));
         }
       });
@@ -250,6 +428,147 @@ export class HistoryApiClient {
     });
   }
 
+  /**
+   * List history entries with keyset pagination
+   * Pass the previous response's next_cursor to fetch the following page
+   */
+  async listCursor(
+    params?: Omit<ListHistoryParams, 'page'>
+  ): Promise<CursorPaginatedResponse<PromptHistory>> {
+    const headers = await this.getHeaders();
+    const queryParams = new URLSearchParams({ pagination: 'cursor' });
+
+    if (params) {
+      Object.entries(params).forEach(([key, value]) => {
+        if (Array.isArray(value)) {
+          value.forEach((item) => queryParams.append(key, String(item)));
+        } else if (value !== undefined) {
+          queryParams.append(key, String(value));
+        }
+      });
+    }
+
+    const path = `${API_HISTORY_PATH}/?${queryParams.toString()}`;
+    return this.request<CursorPaginatedResponse<PromptHistory>>(path, {
+      method: 'GET',
+      headers,
+    });
+  }
+
+  /**
+   * Tag facets with counts, most used first
+   */
+  async listTags(prefix?: string, limit?: number): Promise<TagFacet[]> {
+    const headers = await this.getHeaders();
+    const queryParams = new URLSearchParams();
+    if (prefix) queryParams.append('prefix', prefix);
+    if (limit) queryParams.append('limit', String(limit));
+
+    const response = await this.request<{ results: TagFacet[] }>(
+      `${API_HISTORY_PATH}/tags/?${queryParams.toString()}`,
+      {
+        method: 'GET',
+        headers,
+      }
+    );
+    return response.results;
+  }
+
+  /**
+   * Usage totals and series for the last `days` days
+   */
+  async getStats(days: number = 30, groupBy: UsageGroupBy = 'day'): Promise<UsageStats> {
+    const headers = await this.getHeaders();
+    const queryParams = new URLSearchParams({ days: String(days), group_by: groupBy });
+
+    return this.request<UsageStats>(`${API_HISTORY_PATH}/stats/?${queryParams.toString()}`, {
+      method: 'GET',
+      headers,
+    });
+  }
+
+  /**
+   * Export history (list filters apply) as an NDJSON or CSV file
+   */
+  async exportHistory(
+    format: TransferFormat = 'ndjson',
+    params?: Omit<ListHistoryParams, 'page' | 'page_size' | 'cursor'>
+  ): Promise<Blob> {
+    const headers = await this.getHeaders();
+    const queryParams = new URLSearchParams({ export_format: format });
+
+    if (params) {
+      Object.entries(params).forEach(([key, value]) => {
+        if (Array.isArray(value)) {
+          value.forEach((item) => queryParams.append(key, String(item)));
+        } else if (value !== undefined) {
+          queryParams.append(key, String(value));
+        }
+      });
+    }
+
+    const response = await fetch(
+      `${this.baseUrl}${API_HISTORY_PATH}/export/?${queryParams.toString()}`,
+      { method: 'GET', headers }
+    );
+    if (!response.ok) {
+      return this.handleResponse<Blob>(response);
+    }
+    return response.blob();
+  }
+
+  /**
+   * Import an exported NDJSON or CSV file; the server reads it in batches
+   */
+  async importHistory(file: Blob, format: TransferFormat = 'ndjson'): Promise<ImportSummary> {
+    const headers = await this.getHeaders();
+    (headers as Record<string, string>)['Content-Type'] =
+      format === 'csv' ? 'text/csv' : 'application/x-ndjson';
+
+    return this.request<ImportSummary>(`${API_HISTORY_PATH}/import/`, {
+      method: 'POST',
+      headers,
+      body: file,
+    });
+  }
+
+  /**
+   * Delta sync: changes since a sync token (omit it for the initial sync)
+   * Apply changes as upserts / deletes, store sync_token, and call again
+   * while has_more is true. A 410 means the token expired: resync from scratch.
+   */
+  async getChanges(since?: string, limit?: number): Promise<ChangesResponse> {
+    const headers = await this.getHeaders();
+    const queryParams = new URLSearchParams();
+    if (since) queryParams.append('since', since);
+    if (limit) queryParams.append('limit', String(limit));
+
+    return this.request<ChangesResponse>(`${API_HISTORY_PATH}/changes/?${queryParams.toString()}`, {
+      method: 'GET',
+      headers,
+    });
+  }
+
+  /**
+   * Prompts similar to a history entry, most similar first
+   * Enhanced matches can be reused instead of paying for a new enhancement
+   */
+  async similar(id: string, limit?: number, minScore?: number): Promise<SimilarPrompt[]> {
+    const headers = await this.getHeaders();
+    const queryParams = new URLSearchParams();
+    if (limit) queryParams.append('limit', String(limit));
+    if (minScore !== undefined) queryParams.append('min_score', String(minScore));
+
+    const response = await this.request<{ results: SimilarPrompt[] }>(
+      `${API_HISTORY_PATH}/${id}/similar/?${queryParams.toString()}`,
+      {
+        method: 'GET',
+        headers,
+      }
+    );
+    return response.results;
+  }
+
   /**
    * Retrieve a single history entry
    */
@@ -296,6 +615,133 @@ export class HistoryApiClient {
       body: JSON.stringify(request || {}),
     });
   }
+
+  /**
+   * Enhance a prompt in several styles with one provider round-trip
+   * Variants are stored on the item; styles the model skipped are listed in missing_styles
+   */
+  async enhanceVariants(id: string, request?: EnhanceVariantsRequest): Promise<EnhanceVariantsResponse> {
+    const headers = await this.getHeaders();
+
+    return this.request<EnhanceVariantsResponse>(`${API_HISTORY_PATH}/${id}/enhance/variants/`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify(request || {}),
+    });
+  }
+
+  /**
+   * Enhance several prompts in one request
+   * Items succeed or fail independently; only successes are charged
+   */
+  async enhanceBatch(request: EnhanceBatchRequest): Promise<EnhanceBatchResult[]> {
+    const headers = await this.getHeaders();
+
+    const response = await this.request<{ results: EnhanceBatchResult[] }>(
+      `${API_HISTORY_PATH}/enhance-batch/`,
+      {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(request),
+      }
+    );
+    return response.results;
+  }
+
+  /**
+   * Enhance a prompt, streaming tokens as they are generated
+   * Resolves with the persisted enhancement once the stream completes
+   */
+  async enhanceStream(
+    id: string,
+    request: EnhanceRequest | undefined,
+    onToken: (text: string) => void,
+    signal?: AbortSignal
+  ): Promise<EnhanceResponse> {
+    const headers = await this.getHeaders();
+    (headers as Record<string, string>)['Accept'] = 'text/event-stream';
+
+    const response = await fetch(
+      `${this.baseUrl}${API_HISTORY_PATH}/${id}/enhance/stream/`,
+      {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(request || {}),
+        signal,
+      }
+    );
+
+    if (!response.ok || !response.body) {
+      // Reuse the standard error mapping (402 -> InsufficientCreditsError, ...)
+      return this.handleResponse<EnhanceResponse>(response);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE frames are separated by a blank line
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        const event = frame.match(/^event: (.*)$/m)?.[1];
+        const data = frame.match(/^data: (.*)$/m)?.[1];
+        if (!event || data === undefined) continue;
+
+        const payload = JSON.parse(data);
+        if (event === 'token') {
+          onToken(payload.text);
+        } else if (event === 'done') {
+          return payload as EnhanceResponse;
+        } else if (event === 'error') {
+          if (payload.error === 'insufficient_credits') {
+            throw new InsufficientCreditsError(
+              payload.message,
+              payload.required_credits,
+              payload.current_credits
+            );
+          }
+          throw new ApiClientError(payload.message, 500, payload.error);
+        }
+      }
+    }
+
+    throw new ApiClientError('Stream ended before completion', 500, 'stream_incomplete');
+  }
+
+  /**
+   * Start an async enhancement; returns immediately with a job to poll
+   */
+  async enhanceAsync(id: string, request?: EnhanceRequest): Promise<EnhancementJob> {
+    const headers = await this.getHeaders(true); // Include idempotency key
+    (headers as Record<string, string>)['Prefer'] = 'respond-async';
+
+    return this.request<EnhancementJob>(`${API_HISTORY_PATH}/${id}/enhance/`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify(request || {}),
+    });
+  }
+
+  /**
+   * Get async enhancement job status, optionally long-polling up to `wait` seconds
+   */
+  async getEnhanceJob(jobId: string, wait: number = 0): Promise<EnhancementJob> {
+    const headers = await this.getHeaders();
+    const query = wait > 0 ? `?wait=${wait}` : '';
+    return this.request<EnhancementJob>(`${API_HISTORY_PATH}/jobs/${jobId}/${query}`, {
+      method: 'GET',
+      headers,
+    });
+  }
 }
 
 // Custom errors
@@ -18,6 +18,7 @@ interface QueuedRequest {
 const STORAGE_KEY = 'history_offline_queue';
 const MAX_RETRIES = 3;
 const RETRY_DELAYS = [2000, 4000, 8000]; // ms
+const BULK_BATCH_SIZE = 100;
 
 /**
  * Offline Queue Manager
@@ -119,20 +120,35 @@ export class OfflineQueue {
     this.processing = true;
 
     try {
-      const queue = await this.getQueue();
+      let queue = await this.getQueue();
       const now = Date.now();
 
+      // Flush queued creates through the bulk endpoint
+      const readyCreates = queue.filter(
+        r => r.type === 'create' && this.isReady(r, now)
+      );
+      for (let i = 0; i < readyCreates.length; i += BULK_BATCH_SIZE) {
+        const batch = readyCreates.slice(i, i + BULK_BATCH_SIZE);
+        const done = await this.processCreateBatch(batch);
+
+        queue = queue.filter(r => !done.has(r.id));
+        batch
+          .filter(r => !done.has(r.id))
+          .forEach(r => {
+            r.retries++;
+            r.lastAttempt = now;
+          });
+
+        await this.saveQueue(queue);
+      }
+
       for (let i = 0; i < queue.length; i++) {
         const request = queue[i];
 
-        // Skip if max retries reached
-        if (request.retries >= MAX_RETRIES) continue;
+        // Creates were handled in bulk above
+        if (request.type === 'create') continue;
 
-        // Check if enough time has passed since last attempt
-        const delay = RETRY_DELAYS[request.retries] || RETRY_DELAYS[RETRY_DELAYS.length - 1];
-        if (request.lastAttempt && now - request.lastAttempt < delay) {
-          continue;
-        }
+        if (!this.isReady(request, now)) continue;
 
         // Attempt to process
         const success = await this.processRequest(request);
@@ -154,6 +170,38 @@ export class OfflineQueue {
     }
   }
 
+  private isReady(request: QueuedRequest, now: number): boolean {
+    // Skip if max retries reached
+    if (request.retries >= MAX_RETRIES) return false;
+
+    // Check if enough time has passed since last attempt
+    const delay = RETRY_DELAYS[request.retries] || RETRY_DELAYS[RETRY_DELAYS.length - 1];
+    return !request.lastAttempt || now - request.lastAttempt >= delay;
+  }
+
+  /**
+   * Send a batch of queued creates in one request
+   * Returns the ids of queued requests that no longer need retrying
+   */
+  private async processCreateBatch(batch: QueuedRequest[]): Promise<Set<string>> {
+    const done = new Set<string>();
+
+    try {
+      const results = await this.client.bulkCreate(
+        // The queue id is stable across retries, so it doubles as idempotency key
+        batch.map(r => ({ ...r.data, idempotency_key: r.id }))
+      );
+
+      // Created, existing and validation errors are all final;
+      // a retry would not change the outcome
+      results.forEach(result => done.add(batch[result.index].id));
+    } catch (error) {
+      console.error('Failed to process queued creates:', error);
+    }
+
+    return done;
+  }
+
   private async processRequest(request: QueuedRequest): Promise<boolean> {
     try {
       if (request.type === 'create') {